@@ -0,0 +1,114 @@
+# path: backend/analysis_context.py
+"""
+Per-bar analysis context shared by the prediction / confluence stages.
+
+An AnalysisContext wraps one candle window and lazily computes each indicator, resample and
+SMC detector result the first time a stage asks for it; later stages get the cached value.
+get_context() keeps one context per (symbol, timeframe): it is reused while the window's key
+(last bar ts, bar count and the last bar's values, so a forming bar that ticks is a new key)
+is unchanged and evicted as soon as a new bar arrives.
+
+Cached results are shared between stages: treat them as read-only.
+"""
+
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+import smc_filters
+
+
+def context_key(df: pd.DataFrame, symbol: Optional[str] = None, timeframe: Optional[str] = None) -> Tuple:
+    if len(df) == 0:
+        return (symbol, timeframe, None, 0, ())
+    last = df.iloc[-1]
+    bar = tuple(float(last[c]) for c in ("open", "high", "low", "close", "volume") if c in df.columns)
+    return (symbol, timeframe, df.index[-1], len(df), bar)
+
+
+class AnalysisContext:
+    def __init__(self, df: pd.DataFrame, symbol: Optional[str] = None, timeframe: Optional[str] = None):
+        self.df = df
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.key = context_key(df, symbol, timeframe)
+        self._memo: Dict[Tuple, object] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def memo(self, name: str, fn: Callable, *params, **kw):
+        """fn(self.df, *params, **kw), computed once per (name, params)."""
+        key = (name, params, tuple(sorted(kw.items())))
+        if key in self._memo:
+            self.hits += 1
+            return self._memo[key]
+        self.misses += 1
+        value = fn(self.df, *params, **kw)
+        self._memo[key] = value
+        return value
+
+    # ------------------------
+    # Indicators
+    # ------------------------
+
+    def atr(self, period: int = 14) -> float:
+        return self.memo("atr", smc_filters.atr, period=period)
+
+    def sma(self, window: int = 20, column: str = "close") -> pd.Series:
+        return self.memo("sma", lambda df, w, c: df[c].rolling(w).mean(), window, column)
+
+    def resample(self, rule: str) -> pd.DataFrame:
+        return self.memo("resample", smc_filters.resample_ohlcv, rule)
+
+    def htf_trend(self, rule: str, fast: int = 20, slow: int = 50) -> str:
+        """'bull' / 'bear' / 'neutral' from the fast vs slow close MA of the `rule` resample."""
+        def trend(_df, rule, fast, slow):
+            closes = self.resample(rule)["close"]
+            ma_fast = closes.rolling(fast).mean().iloc[-1]
+            ma_slow = closes.rolling(slow).mean().iloc[-1]
+            return "bull" if ma_fast > ma_slow else ("bear" if ma_fast < ma_slow else "neutral")
+        return self.memo("htf_trend", trend, rule, fast, slow)
+
+    # ------------------------
+    # SMC detectors (smc_filters)
+    # ------------------------
+
+    def order_blocks(self, lookback: int = 200):
+        return self.memo("order_blocks", smc_filters.detect_order_blocks, lookback=lookback)
+
+    def bos(self, lookback: int = 20):
+        return self.memo("bos", smc_filters.detect_bos, lookback=lookback)
+
+    def fvgs(self, lookback: int = 200):
+        return self.memo("fvgs", smc_filters.detect_fvg, lookback=lookback)
+
+    def liquidity_pools(self, lookback: int = 20, threshold: float = 0.0005):
+        return self.memo("liquidity_pools", smc_filters.detect_liquidity_pools, lookback=lookback, threshold=threshold)
+
+    def mitigations(self):
+        return self.memo("mitigations", lambda df: smc_filters.detect_mitigation_blocks(df, self.bos(), self.order_blocks()))
+
+    def breakers(self):
+        return self.memo("breakers", lambda df: smc_filters.detect_breaker_blocks(self.order_blocks(), df))
+
+    def premium_discount(self, lookback: int = 50):
+        return self.memo("premium_discount", smc_filters.detect_premium_discount, lookback=lookback)
+
+    def is_impulsive_move(self, min_points: float = 150.0, pip_size: float = 0.0001) -> bool:
+        return self.memo("impulsive", smc_filters.is_impulsive_move, min_points=min_points, pip_size=pip_size)
+
+
+_CONTEXTS: Dict[Tuple, AnalysisContext] = {}
+_lock = threading.Lock()
+
+
+def get_context(df: pd.DataFrame, symbol: Optional[str] = None, timeframe: Optional[str] = None) -> AnalysisContext:
+    """Shared context for this candle window; replaces (evicts) the market's previous one on a new key."""
+    key = context_key(df, symbol, timeframe)
+    with _lock:
+        ctx = _CONTEXTS.get((symbol, timeframe))
+        if ctx is None or ctx.key != key:
+            ctx = AnalysisContext(df, symbol, timeframe)
+            _CONTEXTS[(symbol, timeframe)] = ctx
+        return ctx
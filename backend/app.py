@@ -1,23 +1,36 @@
 # path: backend/app.py
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from db import init_db, SessionLocal, Signal
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
 import datetime
+import json
+import os
 import traceback
 
 # we call the run_prediction helper from predict_signal.py
 # ensure predict_signal.py (same folder) implements run_prediction(...)
 from predict_signal import run_prediction
+import scanner
+from metrics import METRICS
+from signal_feed import FEED
+from signal_sink import signal_dict
 
 app = Flask(__name__)
 init_db()
 
 scheduler = BackgroundScheduler()
+STREAM_KEEPALIVE_SEC = float(os.getenv("STREAM_KEEPALIVE_SEC", "15"))
 
 def auto_job():
     try:
         print("⏳ [scheduler] running prediction job...", datetime.datetime.utcnow().isoformat())
+        if scanner.SCANNER_ENABLED:
+            # whole universe (SCAN_SYMBOLS x SCAN_TIMEFRAMES), fetched and analyzed concurrently
+            report = scanner.run_scan_cycle()
+            for sig in report["signals"]:
+                print("✅ [scheduler] valid signal produced:", sig.get("id") or "no-id", sig.get("symbol"), sig.get("side"), sig.get("entry"))
+            return
         # run_prediction should run the full pipeline and return the saved signal dict (if saved) or None
         result = run_prediction(symbol="BTC/USDT", timeframe="5m")
         if result:
@@ -30,19 +43,23 @@ def auto_job():
 
 # schedule every 10 seconds (you asked for frequent polling)
 scheduler.add_job(func=auto_job, trigger="interval", seconds=10, max_instances=1)
-scheduler.start()
-atexit.register(lambda: scheduler.shutdown(wait=False))
+# `python app.py`: the scanner's spawned analysis workers re-import this script as __mp_main__
+if __name__ != "__mp_main__":
+    scheduler.start()
+    atexit.register(lambda: scheduler.shutdown(wait=False))
+    atexit.register(scanner.shutdown)
 
 # API endpoints (frontend calls these)
-@app.route("/signals")
-def signals():
-    """
-    Returns latest matching signal as {"signal": {...}} or {"signal": None}
-    Example: /signals?symbol=BTC/USDT&timeframe=5m
-    """
-    symbol = request.args.get("symbol", None)
-    timeframe = request.args.get("timeframe", None)
+# Responses come from signal_feed.FEED's cache (rebuilt only after a signal insert) and carry an
+# ETag, so an unchanged poll costs neither a DB query nor a body (304).
+def _cached_json(key, build):
+    body, etag = FEED.cached(key, build)
+    resp = app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag)
+    return resp.make_conditional(request)
+
 
+def _latest_signal(symbol, timeframe):
     db = SessionLocal()
     query = db.query(Signal).order_by(Signal.created_at.desc())
     if symbol:
@@ -54,29 +71,22 @@ def signals():
     db.close()
 
     if not latest:
-        return jsonify({"signal": None})
-
-    return jsonify({
-        "signal": {
-            "id": latest.id,
-            "symbol": latest.symbol,
-            "timeframe": latest.timeframe,
-            "side": latest.side,
-            "entry": latest.entry,
-            "stop_loss": latest.stop_loss,
-            "take_profit": latest.take_profit,
-            "rr": latest.rr,
-            "ml_label": latest.ml_label,
-            "confidence": latest.confidence,
-            "reason": latest.reason,
-            "smc_confirmed": latest.smc_confirmed,
-            "created_at": latest.created_at.isoformat()
-        }
-    })
+        return {"signal": None}
+    return {"signal": signal_dict(latest)}
 
 
-@app.route("/signals_list")
-def signals_list():
+@app.route("/signals")
+def signals():
+    """
+    Returns latest matching signal as {"signal": {...}} or {"signal": None}
+    Example: /signals?symbol=BTC/USDT&timeframe=5m
+    """
+    symbol = request.args.get("symbol", None)
+    timeframe = request.args.get("timeframe", None)
+    return _cached_json(("signals", symbol, timeframe), lambda: _latest_signal(symbol, timeframe))
+
+
+def _signals_list():
     db = SessionLocal()
     rows = db.query(Signal).order_by(Signal.created_at.desc()).limit(200).all()
     db.close()
@@ -96,7 +106,72 @@ def signals_list():
             "reason": s.reason,
             "created_at": s.created_at.isoformat()
         })
-    return jsonify({"signals": out})
+    return {"signals": out}
+
+
+@app.route("/signals_list")
+def signals_list():
+    return _cached_json(("signals_list",), _signals_list)
+
+
+def _feed_filters():
+    symbol = request.args.get("symbol", None)
+    timeframe = request.args.get("timeframe", None)
+    return (symbol.replace("/", "") if symbol else None), timeframe
+
+
+@app.route("/signals/stream")
+def signals_stream():
+    """
+    Server-Sent Events: one `signal` event per newly saved signal (event id = signal id).
+    Reconnecting clients resume after Last-Event-ID (or ?after=<id>) from the in-memory buffer.
+    Example: new EventSource("/signals/stream?symbol=BTC/USDT&timeframe=5m")
+    """
+    symbol, timeframe = _feed_filters()
+    after = request.headers.get("Last-Event-ID") or request.args.get("after")
+    after = int(after) if after and after.isdigit() else FEED.last_id()
+
+    def events(last_id):
+        yield "retry: 3000\n\n"
+        while True:
+            batch = FEED.wait(last_id, timeout=STREAM_KEEPALIVE_SEC, symbol=symbol, timeframe=timeframe)
+            if not batch:
+                yield ": keepalive\n\n"
+                continue
+            for sig in batch:
+                last_id = sig["id"]
+                yield f"id: {last_id}\nevent: signal\ndata: {json.dumps(sig)}\n\n"
+
+    return Response(stream_with_context(events(after)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/signals/poll")
+def signals_poll():
+    """
+    Long-poll fallback: returns {"signals": [...], "last_id"} as soon as a signal newer than ?after
+    is saved, or an empty list after ?timeout seconds (max 60).
+    """
+    symbol, timeframe = _feed_filters()
+    after = request.args.get("after", type=int)
+    if after is None:
+        after = FEED.last_id()
+    timeout = min(request.args.get("timeout", 25.0, type=float), 60.0)
+    batch = FEED.wait(after, timeout=timeout, symbol=symbol, timeframe=timeframe)
+    return jsonify({"signals": batch, "last_id": batch[-1]["id"] if batch else after})
+
+
+@app.route("/model")
+def model_info():
+    """Active model version (also stored in each signal's raw_data as model_version)."""
+    from predict_signal import MODEL_REGISTRY
+    return jsonify(MODEL_REGISTRY.info())
+
+
+@app.route("/metrics")
+def metrics():
+    """Prometheus scrape target: per-stage latency histograms and rejection counts (METRICS=0 disables)."""
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/health")
@@ -0,0 +1,221 @@
+# path: backend/candle_store.py
+"""
+Local incremental OHLCV cache.
+
+CandleStore keeps the last `max_bars` candles per (symbol, timeframe) in memory, persists them
+to data/candles/<SYMBOL>_<tf>.parquet and only asks the exchange for bars from its latest
+timestamp onwards:
+- the stored last bar may still be forming, so it is always re-fetched and replaced
+- when the cache is behind by more than one page, fetches page forward until caught up
+- a cache shorter than the requested depth is paged in from that depth once; a market younger
+  than that (the exchange has fewer bars) is then kept current with delta fetches only
+- holes inside the cached range are requested once each (a few per refresh); holes the
+  exchange cannot fill are remembered and not asked for again
+One shared ccxt client is used for every market.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from utils.timeframes import timeframe_ms
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+CANDLES_DIR = os.path.join(DATA_DIR, "candles")
+COLUMNS = ["ts", "open", "high", "low", "close", "volume"]
+PAGE_LIMIT = 1000          # bars per exchange request
+MAX_GAP_FILLS = 3          # internal holes re-requested per refresh
+
+
+class CandleStore:
+    def __init__(self, root: str = CANDLES_DIR, max_bars: int = 5000, exchange=None, persist: bool = True):
+        self.root = root
+        self.max_bars = max_bars
+        self.persist = persist
+        self._exchange = exchange
+        self._frames: Dict[Tuple[str, str], pd.DataFrame] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        # per market: deepest min_bars already paged in, and holes (bar before, bar after) requested
+        self._depth: Dict[Tuple[str, str], int] = {}
+        self._tried_gaps: Dict[Tuple[str, str], Set[Tuple[int, int]]] = {}
+        self._guard = threading.Lock()
+        self.requests = 0  # exchange calls made (for monitoring)
+
+    # ------------------------
+    # Exchange / disk
+    # ------------------------
+
+    @property
+    def exchange(self):
+        if self._exchange is None:
+            import ccxt
+            self._exchange = ccxt.binance({"enableRateLimit": True})
+        return self._exchange
+
+    def _path(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, f"{symbol.replace('/', '')}_{timeframe}.parquet")
+
+    def _lock(self, key) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _load(self, symbol: str, timeframe: str) -> pd.DataFrame:
+        path = self._path(symbol, timeframe)
+        if self.persist and os.path.exists(path):
+            try:
+                return pd.read_parquet(path)[COLUMNS]
+            except Exception as e:
+                print("candle cache read error:", path, e)
+        return pd.DataFrame(columns=COLUMNS)
+
+    def _save(self, symbol: str, timeframe: str, df: pd.DataFrame):
+        if not self.persist:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(symbol, timeframe)
+        # a temp name per writer: two processes saving the same market must not share one
+        with tempfile.NamedTemporaryFile(dir=self.root, prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                         delete=False) as f:
+            tmp = f.name
+        try:
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _fetch(self, symbol: str, timeframe: str, since: Optional[int] = None, limit: int = PAGE_LIMIT) -> List[list]:
+        self.requests += 1
+        return self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit)
+
+    # ------------------------
+    # Refresh
+    # ------------------------
+
+    def _fetch_from(self, symbol: str, timeframe: str, since: int, until: int) -> List[list]:
+        """Page forward from `since` until a short page or `until` is reached."""
+        rows = []
+        while True:
+            page = self._fetch(symbol, timeframe, since=since, limit=PAGE_LIMIT)
+            if not page:
+                break
+            rows.extend(page)
+            last = page[-1][0]
+            if len(page) < PAGE_LIMIT or last >= until or last < since:
+                break
+            since = last + 1
+        return rows
+
+    def refresh(self, symbol: str, timeframe: str, min_bars: int = 0) -> pd.DataFrame:
+        """Bring the cached frame for (symbol, timeframe) up to date and return it (ts in ms)."""
+        key = (symbol, timeframe)
+        with self._lock(key):
+            df = self._frames.get(key)
+            if df is None:
+                df = self._load(symbol, timeframe)
+            step = timeframe_ms(timeframe)
+            now = int(time.time() * 1000)
+            want = max(min_bars, 1)
+
+            if len(df) < want and self._depth.get(key, 0) < want:
+                # cold start or deeper history requested: page forward over the whole span
+                since = now - want * step
+                if len(df):
+                    since = min(since, int(df["ts"].iloc[0]))
+                rows = self._fetch_from(symbol, timeframe, since, now)
+                # whatever the exchange has back to `since` is now cached; a young market stays short
+                self._depth[key] = want
+            elif not len(df):
+                rows = self._fetch_from(symbol, timeframe, now - want * step, now)
+            else:
+                # delta: the stored last bar (possibly still forming) and everything after it
+                rows = self._fetch_from(symbol, timeframe, int(df["ts"].iloc[-1]), now)
+
+            changed = bool(rows)
+            if rows:
+                df = self._merge(df, pd.DataFrame(rows, columns=COLUMNS))
+            filled = self._fill_gaps(symbol, timeframe, df, step)
+            if filled is not None:
+                df, changed = filled, True
+
+            keep = max(self.max_bars, min_bars)
+            if len(df) > keep:
+                df = df.iloc[-keep:].reset_index(drop=True)
+            self._frames[key] = df
+            if changed:
+                try:
+                    self._save(symbol, timeframe, df)
+                except Exception as e:
+                    print("candle cache write error:", e)
+            return df
+
+    @staticmethod
+    def _merge(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+        if not len(old):
+            out = new
+        else:
+            out = pd.concat([old, new], ignore_index=True)
+        out = out.drop_duplicates(subset="ts", keep="last").sort_values("ts").reset_index(drop=True)
+        out["ts"] = out["ts"].astype("int64")
+        for c in COLUMNS[1:]:
+            out[c] = out[c].astype("float64")
+        return out
+
+    def _fill_gaps(self, symbol: str, timeframe: str, df: pd.DataFrame, step: int) -> Optional[pd.DataFrame]:
+        if len(df) < 2:
+            return None
+        ts = df["ts"].to_numpy()
+        holes = ((ts[1:] - ts[:-1]) > step).nonzero()[0]
+        # forget holes that were filled (or trimmed away); skip the ones already requested
+        present = {(int(ts[i]), int(ts[i + 1])) for i in holes}
+        tried = self._tried_gaps[(symbol, timeframe)] = self._tried_gaps.get((symbol, timeframe), set()) & present
+        todo = [i for i in holes if (int(ts[i]), int(ts[i + 1])) not in tried][:MAX_GAP_FILLS]
+        if not todo:
+            return None
+        rows = []
+        for i in todo:
+            tried.add((int(ts[i]), int(ts[i + 1])))
+            missing = int((ts[i + 1] - ts[i]) // step) - 1
+            rows.extend(self._fetch(symbol, timeframe, since=int(ts[i]) + step, limit=min(missing, PAGE_LIMIT)))
+        known = set(ts.tolist())
+        rows = [r for r in rows if r[0] not in known]
+        if not rows:
+            return None
+        return self._merge(df, pd.DataFrame(rows, columns=COLUMNS))
+
+    # ------------------------
+    # Readers
+    # ------------------------
+
+    def get(self, symbol: str = "BTC/USDT", timeframe: str = "5m", limit: int = 500, closed_only: bool = False) -> pd.DataFrame:
+        """
+        Last `limit` candles as a DataFrame indexed by datetime 'timestamp' (like predict_signal.fetch_candles).
+        closed_only drops the last bar while it is still forming.
+        """
+        df = self.refresh(symbol, timeframe, min_bars=limit)
+        if closed_only and len(df) and int(df["ts"].iloc[-1]) + timeframe_ms(timeframe) > time.time() * 1000:
+            df = df.iloc[:-1]
+        out = df.iloc[-limit:].copy()
+        out["timestamp"] = pd.to_datetime(out.pop("ts"), unit="ms")
+        return out.set_index("timestamp")
+
+    def get_raw(self, symbol: str = "BTC/USDT", timeframe: str = "5m", limit: int = 500) -> List[list]:
+        """Last `limit` candles as ccxt-style [ts_ms, open, high, low, close, volume] rows."""
+        df = self.refresh(symbol, timeframe, min_bars=limit).iloc[-limit:]
+        return [[int(t), o, h, l, c, v] for t, o, h, l, c, v in df.itertuples(index=False, name=None)]
+
+
+_STORE: Optional[CandleStore] = None
+
+
+def get_store() -> CandleStore:
+    """Process-wide CandleStore (CANDLE_CACHE_BARS bars kept per market)."""
+    global _STORE
+    if _STORE is None:
+        _STORE = CandleStore(max_bars=int(os.getenv("CANDLE_CACHE_BARS", "5000")))
+    return _STORE
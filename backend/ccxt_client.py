@@ -3,6 +3,7 @@ import ccxt
 import pandas as pd
 import os
 from datetime import datetime
+from candle_store import get_store
 
 API_KEY = os.getenv("BINANCE_API_KEY", None)
 API_SECRET = os.getenv("BINANCE_API_SECRET", None)
@@ -13,9 +14,21 @@ exchange = ccxt.binance({
     'secret': API_SECRET
 })
 
+def fetch_ohlcv(symbol="BTC/USDT", timeframe="5m", limit=500):
+    """Last `limit` candles as raw [ts, open, high, low, close, volume] rows, via the candle cache."""
+    try:
+        return get_store().get_raw(symbol, timeframe, limit=limit)
+    except Exception as e:
+        print("ccxt fetch error:", e)
+        return []
+
 def fetch_ohlcv_df(symbol="BTC/USDT", timeframe="5m", since=None, limit=500):
     try:
-        data = exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit)
+        if since is None:
+            # latest candles: served from the cache, only the delta is downloaded
+            data = get_store().get_raw(symbol, timeframe, limit=limit)
+        else:
+            data = exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit)
         df = pd.DataFrame(data, columns=['timestamp','open','high','low','close','volume'])
         df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
         return df
@@ -5,29 +5,39 @@ from typing import Optional
 
 from db import SessionLocal, Signal
 import smc_filters
+from smc.state import SMCState
+from smc.mtf import HTFAggregator, get_htf
+from analysis_context import AnalysisContext, get_context
+from metrics import METRICS
 
 # Configuration
 MIN_MOVE_PIPS = 150.0
 PIP_SIZE = 0.0001  # change per instrument if needed (1 for BTC if you measure in USD points)
 KILLZONE_LONDON = (8, 11)   # 08:00 - 11:00 UTC
 KILLZONE_NY = (13, 16)      # 13:00 - 16:00 UTC
+KILLZONES = (KILLZONE_LONDON, KILLZONE_NY)
 
 
 # ------------------------
 # DB helpers
 # ------------------------
-def is_duplicate(session, symbol, timeframe, side, entry, tolerance=0.0005):
+def is_duplicate(session, symbol, timeframe, side, entry, tolerance=0.0005, exclude_id=None):
+    """
+    True if a signal for the same market and side with entry within entry * tolerance was created
+    in the last 30 minutes. One EXISTS query served by ix_signals_symbol_tf_side_created.
+    """
     window = datetime.utcnow() - timedelta(minutes=30)
-    q = session.query(Signal).filter(
+    band = abs(entry) * tolerance
+    q = session.query(Signal.id).filter(
         Signal.symbol == symbol,
         Signal.timeframe == timeframe,
         Signal.side == side,
-        Signal.created_at >= window
-    ).order_by(Signal.created_at.desc()).all()
-    for s in q:
-        if abs(s.entry - entry) <= (entry * tolerance):
-            return True
-    return False
+        Signal.created_at >= window,
+        Signal.entry.between(entry - band, entry + band)
+    )
+    if exclude_id is not None:
+        q = q.filter(Signal.id != exclude_id)
+    return session.query(q.exists()).scalar()
 
 
 def finalize_and_return_execution(signal_id):
@@ -39,7 +49,7 @@ def finalize_and_return_execution(signal_id):
         if not sig.stop_loss or not sig.take_profit:
             print("Signal missing SL/TP - reject")
             return None
-        if is_duplicate(db, sig.symbol, sig.timeframe, sig.side, sig.entry):
+        if is_duplicate(db, sig.symbol, sig.timeframe, sig.side, sig.entry, exclude_id=sig.id):
             print("Duplicate signal suppressed:", sig.id)
             return None
         payload = {
@@ -66,41 +76,47 @@ def finalize_and_return_execution(signal_id):
 # ------------------------
 # Session / Killzone utils
 # ------------------------
-def in_killzone(ts: datetime) -> bool:
+def in_killzone(ts: datetime, zones=None) -> bool:
     """
     ts expected in UTC (naive datetime or timezone-aware).
+    zones: (start_hour, end_hour) pairs, both ends inclusive (default KILLZONES).
     """
+    zones = KILLZONES if zones is None else zones
     hour = ts.hour
-    if KILLZONE_LONDON[0] <= hour <= KILLZONE_LONDON[1]:
-        return True
-    if KILLZONE_NY[0] <= hour <= KILLZONE_NY[1]:
-        return True
-    return False
+    return any(start <= hour <= end for start, end in zones)
 
 
 # ------------------------
 # HTF Confluence helper
 # ------------------------
-def confirm_htf_confluence(df_ltf: pd.DataFrame, pip_size: float = PIP_SIZE) -> bool:
+def confirm_htf_confluence(df_ltf: pd.DataFrame, pip_size: float = PIP_SIZE, ctx: Optional[AnalysisContext] = None,
+                           htf: Optional[HTFAggregator] = None) -> bool:
     """
     Confirm direction with higher timeframes:
     - require 15m & 1H trend to agree with 5m signal (simple MA method).
+    htf: streaming HTFAggregator for this market; it is synced with df_ltf and its MA trends,
+    kept on closed 15m/1h bars over a longer history than df_ltf, are looked up instead of
+    resampling the frame. It is ignored (resample path) when df_ltf ends before the last candle
+    the aggregator was fed, i.e. for historical frames.
     """
     try:
-        df_15 = smc_filters.resample_ohlcv(df_ltf, "15T")
-        df_1h = smc_filters.resample_ohlcv(df_ltf, "1H")
-        def trend(df):
-            ma_fast = df['close'].rolling(20).mean().iloc[-1]
-            ma_slow = df['close'].rolling(50).mean().iloc[-1]
-            return "bull" if ma_fast > ma_slow else ("bear" if ma_fast < ma_slow else "neutral")
-
-        t15 = trend(df_15)
-        t1h = trend(df_1h)
+        if htf is not None and htf.follows(df_ltf):
+            htf.sync(df_ltf)
+            return htf.confirm(("15m", "1h"))
+        ctx = ctx if ctx is not None else AnalysisContext(df_ltf)
+        t15 = ctx.htf_trend("15min")
+        t1h = ctx.htf_trend("1h")
         return t15 == t1h and t15 != "neutral"
     except Exception:
         return False
 
 
+def live_htf(symbol: str, timeframe: str) -> HTFAggregator:
+    """The market's process-wide HTFAggregator, seeded from the candle store's closed history."""
+    from candle_store import get_store
+    return get_htf(symbol, timeframe, seed=lambda n: get_store().get(symbol, timeframe, limit=n, closed_only=True))
+
+
 # ------------------------
 # SMT Divergence helper
 # ------------------------
@@ -117,18 +133,41 @@ def run_smc_confluence(
     symbol: str,
     timeframe: str,
     ml_signal: dict,
-    reference_df: Optional[pd.DataFrame] = None
+    reference_df: Optional[pd.DataFrame] = None,
+    state: Optional[SMCState] = None,
+    ctx: Optional[AnalysisContext] = None,
+    htf: Optional[HTFAggregator] = None
 ) -> dict:
     """
     Relaxed scoring-based validation pipeline (Smart Money Concept)
+    state: optional (opt-in) streaming SMCState, smc.state.get_state(symbol, timeframe); it is
+    synced with candles_df under state.lock and its incrementally maintained detectors replace
+    the full-window batch scans. Pass it only with closed candles (predict_signal.smc_confluence
+    does): a still-forming last bar is never revised.
+    ctx: AnalysisContext for candles_df; defaults to the shared one for (symbol, timeframe), so
+    indicators / resamples / detectors already computed by other stages on this bar are reused.
+    htf: optional HTFAggregator for the HTF confirmation (live callers pass live_htf(symbol,
+    timeframe)); without it the HTF trends come from resampling candles_df via ctx.
+    Each check is timed per (stage, symbol, timeframe) and every failed check of a rejected
+    signal is counted by reason (metrics.METRICS, /metrics).
     """
+    with METRICS.stage("run_smc_confluence", symbol, timeframe):
+        out = _run_smc_confluence(candles_df, symbol, timeframe, ml_signal, reference_df, state, ctx, htf)
+    if not out["valid"] and METRICS.enabled:
+        reasons = [r for r in out["reason"].split(";") if r] or ["low_score"]
+        for r in reasons:
+            METRICS.reject("run_smc_confluence", r, symbol, timeframe)
+    return out
+
 
+def _run_smc_confluence(candles_df, symbol, timeframe, ml_signal, reference_df, state, ctx, htf) -> dict:
     out = {"valid": False, "reason": "", "confluences": [], "payload": None}
 
     if candles_df is None or len(candles_df) < 10:
         out['reason'] = "insufficient_data"
         return out
 
+    ctx = ctx if ctx is not None else get_context(candles_df, symbol, timeframe)
     ts = ml_signal.get("time") or candles_df.index[-1]
     if isinstance(ts, str):
         ts = pd.to_datetime(ts)
@@ -146,27 +185,42 @@ def run_smc_confluence(
         reasons.append("outside_killzone")
 
     # ✅ Impulsive Move (Important)
-    if smc_filters.is_impulsive_move(candles_df, min_points=MIN_MOVE_PIPS, pip_size=PIP_SIZE):
+    with METRICS.stage("impulsive_move", symbol, timeframe):
+        impulsive = ctx.is_impulsive_move(min_points=MIN_MOVE_PIPS, pip_size=PIP_SIZE)
+    if impulsive:
         score += 1
         confluences.append("impulsive_move ✅ [Important]")
     else:
         reasons.append("not_impulsive_move")
 
     # ✅ HTF Confirmation (Must-Have)
-    if confirm_htf_confluence(candles_df):
+    with METRICS.stage("htf_confluence", symbol, timeframe):
+        htf_ok = confirm_htf_confluence(candles_df, ctx=ctx, htf=htf)
+    if htf_ok:
         score += 1
         confluences.append("htf_confluence ✅ [Must-Have]")
     else:
         reasons.append("htf_confluence_failed")
 
     # ✅ FVG / OB / BOS / Mitigation / Liquidity
-    order_blocks = smc_filters.detect_order_blocks(candles_df)
-    bos_points = smc_filters.detect_bos(candles_df)
-    fvgs = smc_filters.detect_fvg(candles_df)
-    pools = smc_filters.detect_liquidity_pools(candles_df)
-    mitigations = smc_filters.detect_mitigation_blocks(candles_df, bos_points, order_blocks)
-    breakers = smc_filters.detect_breaker_blocks(order_blocks, candles_df)
-    zone, eq = smc_filters.detect_premium_discount(candles_df)
+    with METRICS.stage("smc_detectors", symbol, timeframe):
+        if state is not None:
+            with state.lock:
+                state.sync(candles_df)
+                snap = state.snapshot()
+            order_blocks = snap["order_blocks"]
+            fvgs = snap["fvgs"]
+            pools = snap["liquidity_pools"]
+            mitigations = snap["mitigations"]
+            breakers = snap["breakers"]
+            zone, eq = snap["zone"], snap["equilibrium"]
+        else:
+            order_blocks = ctx.order_blocks()
+            fvgs = ctx.fvgs()
+            pools = ctx.liquidity_pools()
+            mitigations = ctx.mitigations()
+            breakers = ctx.breakers()
+            zone, eq = ctx.premium_discount()
 
     if pools['highs'] or pools['lows']:
         score += 1
@@ -188,7 +242,8 @@ def run_smc_confluence(
 
     # ✅ SMT Divergence (Optional)
     if reference_df is not None:
-        div = check_smt_divergence(candles_df, reference_df)
+        with METRICS.stage("smt_divergence", symbol, timeframe):
+            div = check_smt_divergence(candles_df, reference_df)
         if div:
             score += 1
             confluences.append("smt_divergence ✅ [Optional]")
@@ -1,5 +1,5 @@
 # path: backend/db.py
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, Text
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, Boolean, DateTime, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -8,6 +8,16 @@ import os
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./smc_trader.db")
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _record):
+        # WAL: readers (API) don't block the signal writer and commits are cheaper
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -28,8 +38,16 @@ class Signal(Base):
     smc_confirmed = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    # duplicate check / latest-signal lookups: equality on the first three, range on created_at
+    __table_args__ = (
+        Index("ix_signals_symbol_tf_side_created", "symbol", "timeframe", "side", "created_at"),
+    )
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    # create_all skips indexes of tables that already exist
+    for idx in Signal.__table__.indexes:
+        idx.create(bind=engine, checkfirst=True)
 
 if __name__ == "__main__":
     init_db()
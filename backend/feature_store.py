@@ -0,0 +1,288 @@
+# path: backend/feature_store.py
+"""
+Persistent bar-level feature store shared by training and live inference.
+
+Every (symbol, timeframe, ts) bar gets one row of FEATURE_COLUMNS, computed by compute_features():
+  open, high, low, close, volume        raw bar
+  r1, r3                                close pct change over 1 / 3 bars
+  ma5, ma20                             close SMA
+  atr                                   SMA(14) of true range, partial window at series start
+                                        (the smc_filters.atr value the live model is served)
+  atr_wilder                            Wilder ATR(14) (ta's AverageTrueRange; NaN during warmup)
+  body, upper_wick, lower_wick          candle anatomy
+  vol_spike                             volume > 2 x SMA(20) volume
+
+Rows are persisted as data/features/symbol=<SYM>/timeframe=<tf>/part-<first_ts>-<last_ts>.parquet.
+New closed bars only append rows: the rolling windows continue from a carried FeatureState
+(last WARMUP bars + the Wilder ATR value), so appending bar by bar gives exactly the rows a
+single pass over the whole history gives. When the first new bar is not one bar after the last
+stored one (downtime, a missing exchange bar), the state is rebuilt from the whole window of
+bars passed in, so the new rows are those compute_features() gives for that window (which, like
+features_frame(), rolls straight through holes inside it) rather than rows continued from
+bars that are no longer adjacent. Small part files are compacted once there are more than
+MAX_PARTS of them.
+"""
+
+import glob
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.timeframes import timeframe_ms
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+FEATURES_DIR = os.path.join(DATA_DIR, "features")
+FEATURE_STORE_ENABLED = os.getenv("FEATURE_STORE", "1") == "1"
+
+BAR_COLUMNS = ["open", "high", "low", "close", "volume"]
+FEATURE_COLUMNS = BAR_COLUMNS + ["r1", "r3", "ma5", "ma20", "atr", "atr_wilder",
+                                 "body", "upper_wick", "lower_wick", "vol_spike"]
+ATR_WINDOW = 14
+WARMUP = 20        # longest rolling window; bars of history carried between appends
+MAX_PARTS = 64
+
+
+@dataclass
+class FeatureState:
+    """Rolling state after the last stored bar."""
+    last_ts: Optional[int] = None
+    count: int = 0                                     # bars seen so far
+    tail: np.ndarray = field(default_factory=lambda: np.empty((0, 5)))  # last WARMUP bars (BAR_COLUMNS)
+    atr_wilder: float = np.nan
+    last_row: Optional[np.ndarray] = None              # FEATURE_COLUMNS of the last bar
+
+
+def _window_mean(x: np.ndarray, window: int, min_periods: int) -> np.ndarray:
+    """Trailing mean; summed offset by offset so a value never depends on where the series starts."""
+    n = len(x)
+    pad = np.concatenate([np.full(window - 1, np.nan), x])
+    total = np.zeros(n)
+    count = np.zeros(n)
+    for k in range(window):
+        seg = pad[k:k + n]
+        ok = ~np.isnan(seg)
+        total += np.where(ok, seg, 0.0)
+        count += ok
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count >= min_periods, total / count, np.nan)
+
+
+def _wilder(tr: np.ndarray, first: int, prev: float, count: int, window: int = ATR_WINDOW) -> np.ndarray:
+    """
+    Wilder ATR for tr[first:], continuing from `prev` (the value at bar count-1).
+    `tr` holds the true range of every bar since the series start whenever prev is still NaN.
+    """
+    m = len(tr) - first
+    out = np.full(m, np.nan)
+    if np.isnan(prev):
+        # seeded with the plain mean of the first `window` true ranges (global bar window-1)
+        seed_at = window - 1 - count
+        if seed_at >= m:
+            return out
+        prev = float(tr[first + seed_at - window + 1:first + seed_at + 1].mean())
+        out[seed_at] = prev
+        start = seed_at + 1
+    else:
+        start = 0
+    if start < m:
+        s = pd.Series(np.r_[prev, tr[first + start:]])
+        out[start:] = s.ewm(alpha=1.0 / window, adjust=False).mean().to_numpy()[1:]
+    return out
+
+
+def compute_features(bars: np.ndarray, state: Optional[FeatureState] = None) -> Tuple[np.ndarray, FeatureState]:
+    """
+    Feature rows for `bars` (n x 5 float array in BAR_COLUMNS order) that follow `state`
+    (None = series start). Returns (n x len(FEATURE_COLUMNS) array, state after the last bar);
+    the caller sets state.last_ts.
+    """
+    state = state or FeatureState()
+    bars = np.asarray(bars, dtype=np.float64).reshape(-1, 5)
+    n = len(bars)
+    k = len(state.tail)
+    ext = np.concatenate([state.tail, bars]) if k else bars
+    o, h, l, c, v = (ext[:, j] for j in range(5))
+
+    prev_c = np.r_[np.nan, c[:-1]]
+    with np.errstate(invalid="ignore"):
+        tr = np.fmax(h - l, np.fmax(np.abs(h - prev_c), np.abs(l - prev_c)))
+    r1 = c / prev_c - 1.0
+    r3 = c / np.r_[np.full(3, np.nan), c[:-3]][:len(c)] - 1.0
+    vol_mean = _window_mean(v, 20, 20)
+    with np.errstate(invalid="ignore"):
+        vol_spike = (v > vol_mean * 2).astype(np.float64)
+    hi_oc = np.maximum(c, o)
+    lo_oc = np.minimum(c, o)
+
+    cols = [o, h, l, c, v, r1, r3, _window_mean(c, 5, 5), _window_mean(c, 20, 20),
+            _window_mean(tr, ATR_WINDOW, 1), None, np.abs(c - o), h - hi_oc, lo_oc - l, vol_spike]
+    out = np.empty((n, len(FEATURE_COLUMNS)))
+    for j, col in enumerate(cols):
+        if col is not None:
+            out[:, j] = col[k:]
+    out[:, FEATURE_COLUMNS.index("atr_wilder")] = _wilder(tr, k, state.atr_wilder, state.count)
+
+    wilder = out[-1, FEATURE_COLUMNS.index("atr_wilder")] if n else state.atr_wilder
+    new_state = FeatureState(last_ts=state.last_ts, count=state.count + n, tail=ext[-WARMUP:].copy(),
+                             atr_wilder=float(wilder), last_row=out[-1].copy() if n else state.last_row)
+    return out, new_state
+
+
+def features_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """compute_features() over a whole OHLCV frame; keeps the frame's index and extra columns."""
+    out, _ = compute_features(df[BAR_COLUMNS].to_numpy(dtype=np.float64))
+    res = df.copy()
+    for j, name in enumerate(FEATURE_COLUMNS):
+        res[name] = out[:, j]
+    res["vol_spike"] = res["vol_spike"].astype(int)
+    return res
+
+
+def candle_ts(candles: pd.DataFrame) -> Optional[np.ndarray]:
+    """Bar open times in ms from a 'ts' column, a 'timestamp' column or a DatetimeIndex (None if absent)."""
+    if "ts" in candles.columns:
+        return candles["ts"].to_numpy(dtype=np.int64)
+    if "timestamp" in candles.columns:
+        stamps = pd.to_datetime(candles["timestamp"])
+    elif isinstance(candles.index, pd.DatetimeIndex):
+        stamps = candles.index
+    else:
+        return None
+    return np.asarray((stamps - pd.Timestamp(0)) // pd.Timedelta(1, "ms"), dtype=np.int64)
+
+
+class FeatureStore:
+    def __init__(self, root: str = FEATURES_DIR, persist: bool = True):
+        self.root = root
+        self.persist = persist
+        self._states: Dict[Tuple[str, str], FeatureState] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _dir(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, f"symbol={symbol.replace('/', '')}", f"timeframe={timeframe}")
+
+    def _lock(self, key) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _parts(self, symbol: str, timeframe: str):
+        return sorted(glob.glob(os.path.join(self._dir(symbol, timeframe), "part-*.parquet")))
+
+    def read(self, symbol: str, timeframe: str, start: Optional[int] = None, end: Optional[int] = None) -> pd.DataFrame:
+        """Stored rows (ts + FEATURE_COLUMNS) with start <= ts <= end, oldest first."""
+        parts = self._parts(symbol, timeframe)
+        if not parts:
+            return pd.DataFrame(columns=["ts"] + FEATURE_COLUMNS)
+        df = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True).sort_values("ts")
+        if start is not None:
+            df = df[df["ts"] >= start]
+        if end is not None:
+            df = df[df["ts"] <= end]
+        return df.reset_index(drop=True)
+
+    def _state(self, symbol: str, timeframe: str) -> FeatureState:
+        key = (symbol, timeframe)
+        state = self._states.get(key)
+        if state is None:
+            state = FeatureState()
+            if self.persist:
+                stored = self.read(symbol, timeframe)
+                if len(stored):
+                    state = FeatureState(last_ts=int(stored["ts"].iloc[-1]), count=len(stored),
+                                         tail=stored[BAR_COLUMNS].to_numpy(dtype=np.float64)[-WARMUP:],
+                                         atr_wilder=float(stored["atr_wilder"].iloc[-1]),
+                                         last_row=stored[FEATURE_COLUMNS].to_numpy(dtype=np.float64)[-1])
+            self._states[key] = state
+        return state
+
+    def _write(self, symbol: str, timeframe: str, rows: pd.DataFrame):
+        path = self._dir(symbol, timeframe)
+        os.makedirs(path, exist_ok=True)
+        name = f"part-{int(rows['ts'].iloc[0]):015d}-{int(rows['ts'].iloc[-1]):015d}.parquet"
+        tmp = os.path.join(path, name + ".tmp")
+        rows.to_parquet(tmp, index=False)
+        os.replace(tmp, os.path.join(path, name))
+        parts = self._parts(symbol, timeframe)
+        if len(parts) > MAX_PARTS:
+            merged = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
+            self._write_compacted(path, parts, merged)
+
+    @staticmethod
+    def _write_compacted(path: str, parts, merged: pd.DataFrame):
+        name = f"part-{int(merged['ts'].iloc[0]):015d}-{int(merged['ts'].iloc[-1]):015d}.parquet"
+        tmp = os.path.join(path, name + ".tmp")
+        merged.to_parquet(tmp, index=False)
+        for p in parts:
+            os.remove(p)
+        os.replace(tmp, os.path.join(path, name))
+
+    def append(self, symbol: str, timeframe: str, ts: np.ndarray, bars: np.ndarray) -> int:
+        """
+        Append feature rows for closed bars newer than the last stored one (older bars are ignored).
+        When the first new bar does not follow the last stored bar, the rows and the carried
+        state come from compute_features() over all of `bars` instead (pass the whole window).
+        Returns the number of rows appended.
+        """
+        key = (symbol, timeframe)
+        with self._lock(key):
+            state = self._state(symbol, timeframe)
+            ts = np.asarray(ts, dtype=np.int64)
+            bars = np.asarray(bars, dtype=np.float64)
+            new = ts > state.last_ts if state.last_ts is not None else np.ones(len(ts), dtype=bool)
+            if not new.any():
+                return 0
+            if state.last_ts is not None and int(ts[new][0]) != state.last_ts + timeframe_ms(timeframe):
+                # not adjacent to the store: rebuild from the window instead of rolling on
+                out, new_state = compute_features(bars)
+                out = out[new]
+            else:
+                out, new_state = compute_features(bars[new], state)
+            new_state.last_ts = int(ts[new][-1])
+            if self.persist:
+                rows = pd.DataFrame(out, columns=FEATURE_COLUMNS)
+                rows.insert(0, "ts", ts[new])
+                rows["vol_spike"] = rows["vol_spike"].astype(int)
+                self._write(symbol, timeframe, rows)
+            self._states[key] = new_state
+            return int(new.sum())
+
+    def latest(self, symbol: str, timeframe: str, candles: pd.DataFrame, closed_before: Optional[int] = None) -> pd.DataFrame:
+        """
+        Serving path: append the closed bars of `candles` (ts < closed_before, default now minus one bar)
+        and return the one-row feature frame of its last bar. A still-forming last bar is
+        computed from the carried state without being stored.
+        """
+        ts = candle_ts(candles)
+        bars = candles[BAR_COLUMNS].to_numpy(dtype=np.float64)
+        if closed_before is None:
+            closed_before = int(time.time() * 1000) - timeframe_ms(timeframe) + 1
+        closed = ts < closed_before
+        self.append(symbol, timeframe, ts[closed], bars[closed])
+        with self._lock((symbol, timeframe)):
+            state = self._states.get((symbol, timeframe)) or FeatureState()
+            last = int(ts[-1])
+            if state.last_ts is not None and last == state.last_ts:
+                row = state.last_row
+            elif state.last_ts is None or last == state.last_ts + timeframe_ms(timeframe):
+                row, _ = compute_features(bars[-1:], state)
+                row = row[0]
+            else:
+                # candles older than the store or not adjacent to it: compute from the window alone
+                row = compute_features(bars)[0][-1]
+        return pd.DataFrame(row.reshape(1, -1), columns=FEATURE_COLUMNS)
+
+
+_STORE: Optional[FeatureStore] = None
+
+
+def get_feature_store() -> FeatureStore:
+    global _STORE
+    if _STORE is None:
+        _STORE = FeatureStore()
+    return _STORE
@@ -0,0 +1,159 @@
+# path: backend/metrics.py
+"""
+Per-stage latency histograms and rejection counters for the prediction pipeline, rendered in
+the Prometheus text format by app.py's /metrics route.
+
+    with METRICS.stage("fetch_candles", symbol, timeframe):
+        ...
+    METRICS.reject("confirm_signal", "not_smc_confirmed", symbol, timeframe)
+
+Series are keyed by (stage, symbol, timeframe); a stage that covers several markets at once
+(batched predict_proba, one DB commit for many signals) is recorded under symbol/timeframe "*".
+Values live in the process that recorded them; the scanner's analysis workers drain() theirs
+after every task and the parent merge()s them, so their stages show up here too.
+
+METRICS=0 disables recording: stage() then hands back one shared no-op context manager and
+reject() returns immediately, so the instrumented code pays a single attribute check.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Dict, Iterable, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+# seconds; +Inf is implicit
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NULL = nullcontext()
+
+
+def common(values: Iterable[Optional[str]]) -> str:
+    """The single value shared by all `values` (a batch of one market), else "*"."""
+    found = set(values)
+    return (found.pop() or "") if len(found) == 1 else "*"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(pairs) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Timer:
+    __slots__ = ("metrics", "key", "t0")
+
+    def __init__(self, metrics: "Metrics", key: Tuple[str, str, str]):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe(self.key, time.perf_counter() - self.t0)
+        return False
+
+
+class Metrics:
+    def __init__(self, enabled: bool = METRICS_ENABLED, buckets=STAGE_BUCKETS):
+        self.enabled = enabled
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # (stage, symbol, timeframe) -> [per-bucket counts..., sum, count]
+        self._hist: Dict[Tuple[str, str, str], List[float]] = {}
+        # (stage, reason, symbol, timeframe) -> count
+        self._rejects: Dict[Tuple[str, str, str, str], int] = {}
+
+    def stage(self, name: str, symbol: Optional[str] = None, timeframe: Optional[str] = None):
+        """Context manager timing one run of a pipeline stage."""
+        if not self.enabled:
+            return _NULL
+        return _Timer(self, (name, symbol or "", timeframe or ""))
+
+    def observe(self, name: str, seconds: float, symbol: Optional[str] = None, timeframe: Optional[str] = None):
+        """Record an already measured duration."""
+        if self.enabled:
+            self._observe((name, symbol or "", timeframe or ""), seconds)
+
+    def _observe(self, key, seconds: float):
+        slot = bisect_left(self.buckets, seconds)
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = [0] * (len(self.buckets) + 2)
+            if slot < len(self.buckets):
+                h[slot] += 1
+            h[-2] += seconds
+            h[-1] += 1
+
+    def reject(self, stage: str, reason: str, symbol: Optional[str] = None, timeframe: Optional[str] = None, n: int = 1):
+        """Count a candidate dropped at `stage` for `reason`."""
+        if not self.enabled:
+            return
+        key = (stage, reason, symbol or "", timeframe or "")
+        with self._lock:
+            self._rejects[key] = self._rejects.get(key, 0) + n
+
+    def drain(self) -> Tuple[Dict, Dict]:
+        """Everything recorded so far as (histograms, rejections), clearing it; see merge()."""
+        with self._lock:
+            hist, rejects = self._hist, self._rejects
+            self._hist, self._rejects = {}, {}
+        return hist, rejects
+
+    def merge(self, recorded: Tuple[Dict, Dict]):
+        """Add series drained from another Metrics (same buckets), e.g. in a worker process."""
+        hist, rejects = recorded
+        if not self.enabled:
+            return
+        with self._lock:
+            for key, values in hist.items():
+                h = self._hist.get(key)
+                if h is None:
+                    self._hist[key] = list(values)
+                else:
+                    for i, v in enumerate(values):
+                        h[i] += v
+            for key, n in rejects.items():
+                self._rejects[key] = self._rejects.get(key, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self._hist.clear()
+            self._rejects.clear()
+
+    def render(self) -> str:
+        """Prometheus text exposition (version 0.0.4) of every series recorded so far."""
+        with self._lock:
+            hist = {k: list(v) for k, v in self._hist.items()}
+            rejects = dict(self._rejects)
+        lines = [
+            "# HELP smc_stage_seconds Wall time of one prediction pipeline stage.",
+            "# TYPE smc_stage_seconds histogram",
+        ]
+        for (stage, symbol, timeframe), h in sorted(hist.items()):
+            base = [("stage", stage), ("symbol", symbol), ("timeframe", timeframe)]
+            cumulative = 0
+            for le, n in zip(self.buckets, h):
+                cumulative += n
+                lines.append(f"smc_stage_seconds_bucket{_labels(base + [('le', repr(float(le)))])} {cumulative}")
+            lines.append(f"smc_stage_seconds_bucket{_labels(base + [('le', '+Inf')])} {h[-1]}")
+            lines.append(f"smc_stage_seconds_sum{_labels(base)} {h[-2]!r}")
+            lines.append(f"smc_stage_seconds_count{_labels(base)} {h[-1]}")
+        lines += [
+            "# HELP smc_rejections_total Candidates rejected by the pipeline, by stage and reason.",
+            "# TYPE smc_rejections_total counter",
+        ]
+        for (stage, reason, symbol, timeframe), n in sorted(rejects.items()):
+            labels = _labels([("stage", stage), ("reason", reason), ("symbol", symbol), ("timeframe", timeframe)])
+            lines.append(f"smc_rejections_total{labels} {n}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
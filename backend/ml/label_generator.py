@@ -2,12 +2,13 @@
 Label generator with ML + SMC signals
 """
 
-import os, pandas as pd, json
+import os, pandas as pd, numpy as np, json
 from pathlib import Path
 from datetime import datetime
-from smc.advanced_smc import evaluate_smc
-from smc.analyzer import extract_features
+from smc.advanced_smc import evaluate_smc, evaluate_smc_batch
+from smc.analyzer import extract_features, extract_features_batch, features_frame
 from ccxt_client import fetch_ohlcv
+from ml import manifest, sharded
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
 PRED_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "predictions")
@@ -28,34 +29,233 @@ def fetch_and_store_historical(symbol='BTC/USDT', timeframe='1m', limit=5000, fi
     return path
 
 
+def label_barriers(high, low, start, entry, stop_loss, take_profits, side, max_bars=120, block=4096) -> pd.DataFrame:
+    """
+    First-touch barrier labels for many candidates and several TP levels in one call.
+    high/low: full price arrays; start: bar where each candidate's future begins;
+    entry/stop_loss: per candidate; take_profits: (candidates, levels) array (NaN = no level);
+    side: 'buy'/'sell' strings or booleans (True = buy).
+    Bars start..start+max_bars-1 are scanned per candidate; SL wins when SL and TP hit on the same bar.
+    Returns one row per candidate with sl_bar and, per level k, tp{k}_outcome (1 TP first,
+    -1 SL first, 0 neither), tp{k}_hit_bar (absolute bar that resolved it, -1 if none) and
+    tp{k}_mfe / tp{k}_mae (max favourable / adverse excursion from entry up to that bar,
+    or over the whole horizon when unresolved).
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    start = np.asarray(start, dtype=np.int64)
+    entry = np.asarray(entry, dtype=np.float64)
+    stop_loss = np.asarray(stop_loss, dtype=np.float64)
+    tps = np.asarray(take_profits, dtype=np.float64)
+    if tps.ndim == 1:
+        tps = tps[:, None]
+    side = np.asarray(side)
+    is_buy = side == 'buy' if side.dtype.kind in 'OUS' else side.astype(bool)
+    n = len(high)
+    m, levels = tps.shape
+
+    sl_bar = np.full(m, -1, dtype=np.int64)
+    outcome = np.zeros((m, levels), dtype=np.int8)
+    hit_bar = np.full((m, levels), -1, dtype=np.int64)
+    mfe = np.full((m, levels), np.nan)
+    mae = np.full((m, levels), np.nan)
+    steps = np.arange(max_bars)
+    for b0 in range(0, m if n else 0, block):
+        sel = slice(b0, b0 + block)
+        rows = np.arange(len(start[sel]))
+        idx = start[sel][:, None] + steps[None, :]
+        valid = idx < n
+        idx = np.minimum(idx, n - 1)
+        hi, lo = high[idx], low[idx]
+        buy = is_buy[sel][:, None]
+        e = entry[sel][:, None]
+        sl = stop_loss[sel][:, None]
+        sl_hit = np.where(buy, lo <= sl, hi >= sl) & valid
+        first_sl = np.where(sl_hit.any(axis=1), sl_hit.argmax(axis=1), max_bars)
+        sl_bar[sel] = np.where(first_sl < max_bars, start[sel] + first_sl, -1)
+        run_fav = np.maximum.accumulate(np.where(valid, np.where(buy, hi - e, e - lo), -np.inf), axis=1)
+        run_adv = np.maximum.accumulate(np.where(valid, np.where(buy, e - lo, hi - e), -np.inf), axis=1)
+        last_bar = np.minimum(max_bars, n - start[sel]) - 1
+        for j in range(levels):
+            tp = tps[sel, j][:, None]
+            tp_hit = np.where(buy, hi >= tp, lo <= tp) & valid
+            first_tp = np.where(tp_hit.any(axis=1), tp_hit.argmax(axis=1), max_bars)
+            win = first_tp < first_sl
+            loss = ~win & (first_sl < max_bars)
+            outcome[sel, j] = np.where(win, 1, np.where(loss, -1, 0))
+            end = np.where(win, first_tp, np.where(loss, first_sl, last_bar))
+            hit_bar[sel, j] = np.where(win | loss, start[sel] + end, -1)
+            ok = end >= 0
+            end = np.maximum(end, 0)
+            mfe[sel, j] = np.where(ok, run_fav[rows, end], np.nan)
+            mae[sel, j] = np.where(ok, run_adv[rows, end], np.nan)
+
+    out = {'sl_bar': sl_bar}
+    for j in range(levels):
+        out[f'tp{j+1}_outcome'] = outcome[:, j]
+        out[f'tp{j+1}_hit_bar'] = hit_bar[:, j]
+        out[f'tp{j+1}_mfe'] = mfe[:, j]
+        out[f'tp{j+1}_mae'] = mae[:, j]
+    return pd.DataFrame(out)
+
+
 def forward_label_one_candidate(cand: dict, future_df: pd.DataFrame, max_bars=120, tp_index=1):
-    entry = float(cand.get('entry', 0.0))
-    sl = float(cand.get('stop_loss', 0.0))
     tps = cand.get('take_profits', [])
     if len(tps) < tp_index:
         return 0
-    tp = float(tps[tp_index-1])
-    side = cand.get('side','buy')
-
-    for i in range(min(len(future_df), max_bars)):
-        hi = float(future_df['high'].iloc[i])
-        lo = float(future_df['low'].iloc[i])
-
-        if side == 'buy':
-            if lo <= sl:  
-                return 0
-            if hi >= tp:  
-                return 1
-        else:
-            if hi >= sl:  
-                return 0
-            if lo <= tp:  
-                return 1
-    return 0
+    res = label_barriers(future_df['high'].to_numpy(), future_df['low'].to_numpy(), [0],
+                         [float(cand.get('entry', 0.0))], [float(cand.get('stop_loss', 0.0))],
+                         [[float(tps[tp_index-1])]], [cand.get('side', 'buy')], max_bars=max_bars)
+    return int(res['tp1_outcome'].iat[0] == 1)
+
+
+def _batch_labeled_frame(df_all: pd.DataFrame, symbol: str, timeframe: str, lookback: int, forward_bars: int, tp_index: int, max_samples: int = None, all_tps: bool = False,
+                         start: int = None, stop: int = None, created_at: str = None):
+    """
+    Same rows as the per-window loop of generate_labeled_dataset, built from whole-frame arrays:
+    candidates from evaluate_smc_batch, labels from label_barriers and the
+    extract_features() columns from extract_features_batch.
+    all_tps=True appends the TP1/TP2/TP3 outcome, hit bar and MFE/MAE columns.
+    start/stop limit the window ends t to [start, stop) (default: every t the loop visits).
+    """
+    n = len(df_all)
+    start = lookback if start is None else start
+    stop = n - forward_bars - 1 if stop is None else stop
+    cand = evaluate_smc_batch(df_all, lookback, start=start, stop=stop)
+    if max_samples:
+        cand = {k: v[:max_samples] for k, v in cand.items()}
+    m = len(cand['t'])
+    if m == 0:
+        return pd.DataFrame([])
 
+    h = df_all['high'].to_numpy(dtype=np.float64)
+    l = df_all['low'].to_numpy(dtype=np.float64)
+    t = cand['t'].astype(np.int64)
+    is_buy = cand['side'].astype(bool)
+    entry, sl = cand['entry'], cand['stop_loss']
+    tps = [cand['tp1'], cand['tp2'], cand['tp3']]
+
+    barriers = label_barriers(h, l, t, entry, sl, np.column_stack(tps), is_buy, max_bars=forward_bars)
+    if tp_index > len(tps):
+        labels = np.zeros(m, dtype=np.int64)
+    else:
+        labels = (barriers.filter(like='_outcome').to_numpy()[:, tp_index-1] == 1).astype(np.int64)
+
+    reasons = np.where(is_buy, 'bullish_ob', 'bearish_ob').astype(object)
+    reasons[cand['with_bos'].astype(bool)] += '_with_bos'
+    table = {
+        'bar': t - 1,
+        'side': is_buy,
+        'entry': entry,
+        'stop_loss': sl,
+        'tp1': tps[0],
+        'take_profits': [list(tp) for tp in zip(tps[0].tolist(), tps[1].tolist(), tps[2].tolist())],
+        'ob_high': cand['ob_high'],
+        'ob_low': cand['ob_low'],
+        # evaluate_smc candidates carry no 'bos' key, so extract_features always reports 0
+        'has_bos': np.zeros(m, dtype=np.int64),
+        'has_fvg': cand['has_fvg'],
+        'confidence': cand['confidence'],
+        'reason': reasons,
+    }
+    # float64: the CSV keeps the exact values of the per-window extract_features path
+    X, meta = extract_features_batch(df_all, table, lookback=lookback, symbol=symbol, timeframe=timeframe,
+                                     created_at=created_at, dtype=np.float64)
+    out = features_frame(X, meta)
+    out['label'] = labels
+    if all_tps:
+        out = pd.concat([out, barriers.drop(columns='sl_bar')], axis=1)
+    return out
+
+
+_SHARD_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+# extra bars read before each chunk's first window, on top of `lookback`
+_SHARD_LEAD_PAD = 64
+
+
+def _labeled_chunk(task):
+    """Worker task: _batch_labeled_frame for window ends [t0, t1), read from the shared price arrays."""
+    (t0, t1), p = task
+    cols = sharded.arrays()
+    n = len(cols['close'])
+    a = max(0, t0 - p['lookback'] - _SHARD_LEAD_PAD)
+    b = min(n, t1 + p['forward_bars'] + 1)
+    sub = pd.DataFrame({k: cols[k][a:b] for k in _SHARD_COLUMNS})
+    out = _batch_labeled_frame(sub, p['symbol'], p['timeframe'], p['lookback'], p['forward_bars'], p['tp_index'],
+                               all_tps=p['all_tps'], start=t0 - a, stop=t1 - a, created_at=p['created_at'])
+    # hit bars are positions in the chunk: shift back to the full series
+    for col in out.columns:
+        if col.endswith('_hit_bar'):
+            out[col] = np.where(out[col] >= 0, out[col] + a, out[col])
+    return out
+
+
+def _sharded_labeled_frame(df_all: pd.DataFrame, symbol: str, timeframe: str, lookback: int, forward_bars: int, tp_index: int, max_samples: int = None,
+                           all_tps: bool = False, workers: int = None, chunk: int = None, start: int = None):
+    """
+    _batch_labeled_frame split into time chunks labeled in worker processes (ml.sharded).
+    Each chunk owns a range of window ends and reads lookback bars before it and forward_bars
+    after it from the shared arrays; chunks are concatenated in time order, so the rows equal
+    the serial frame's. start limits the window ends like _batch_labeled_frame's.
+    """
+    workers = workers or sharded.LABEL_WORKERS
+    n = len(df_all)
+    chunks = sharded.plan_chunks(lookback if start is None else start, n - forward_bars - 1, workers, chunk)
+    params = dict(symbol=symbol, timeframe=timeframe, lookback=lookback, forward_bars=forward_bars, tp_index=tp_index,
+                  all_tps=all_tps, created_at=datetime.now().isoformat())
+    columns = {k: np.ascontiguousarray(df_all[k].to_numpy(dtype=np.float64)) for k in _SHARD_COLUMNS}
+    parts = sharded.run_sharded(columns, _labeled_chunk, [(c, params) for c in chunks], workers)
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return pd.DataFrame([])
+    out = pd.concat(parts, ignore_index=True)
+    return out.iloc[:max_samples] if max_samples else out
 
-def generate_labeled_dataset(parquet_path: str, lookback: int = 500, forward_bars: int = 120, tp_index: int = 1, out_csv: str = None, max_samples: int = None):
+
+def generate_labeled_dataset(parquet_path: str, lookback: int = 500, forward_bars: int = 120, tp_index: int = 1, out_csv: str = None, max_samples: int = None, batch: bool = True, all_tps: bool = False,
+                             workers: int = 1):
+    """
+    Slide a `lookback` window over the parquet, label every evaluate_smc candidate by its forward
+    outcome and write features + label to CSV.
+    batch=True computes everything once over the whole frame (same rows as the per-window loop,
+    which is kept behind batch=False). all_tps=True (batch only) also writes the barrier
+    outcome / hit bar / MFE / MAE columns of every TP level, so one build serves all tp_index values.
+    workers > 1 (batch only; 0 = LABEL_WORKERS / all cores) labels time chunks in that many
+    processes; the CSV is the same row for row.
+    When the CSV was already built from this parquet (batch, no max_samples, recorded in the
+    manifest and unchanged since), only the windows ending after its last labeled bar are labeled
+    and appended: the earlier bytes stay as they are, so the trainer sees an append, not a rewrite.
+    """
     df_all = pd.read_parquet(parquet_path).reset_index(drop=True)
+    symbol = Path(parquet_path).stem.split('_')[0]
+    timeframe = Path(parquet_path).stem.split('_')[-1]
+    out_path = out_csv or parquet_path.replace('.parquet', f'_labeled_tp{tp_index}.csv')
+    if batch:
+        prev = None if max_samples else _labeled_so_far(out_path, df_all, lookback)
+        start = prev['next_t'] if prev else None
+        if prev and start >= len(df_all) - forward_bars - 1:
+            return out_path          # no new window with a full forward horizon yet
+
+        def label(start):
+            if workers != 1:
+                return _sharded_labeled_frame(df_all, symbol, timeframe, lookback, forward_bars, tp_index, max_samples,
+                                              all_tps, workers=workers, start=start)
+            return _batch_labeled_frame(df_all, symbol, timeframe, lookback, forward_bars, tp_index, max_samples, all_tps,
+                                        start=start)
+
+        out = label(start)
+        if prev and len(out) and list(out.columns) != prev['columns']:
+            # other columns than the file has (e.g. all_tps changed): rebuild the whole file
+            prev, out = None, label(None)
+        if prev:
+            if len(out):
+                out.to_csv(out_path, mode='a', header=False, index=False)
+            _record_output(out_path, prev['rows'] + len(out), df_all, lookback, forward_bars, first_ts=prev['ts_min'])
+        else:
+            out.to_csv(out_path, index=False)
+            _record_output(out_path, len(out), df_all, lookback, forward_bars)
+        return out_path
+
     n = len(df_all)
     rows = []
     start = lookback
@@ -63,8 +263,8 @@ def generate_labeled_dataset(parquet_path: str, lookback: int = 500, forward_bar
 
     for t in range(start, n - forward_bars - 1):
         window = df_all.iloc[t-lookback:t].copy().reset_index(drop=True)
-        window.attrs['symbol'] = Path(parquet_path).stem.split('_')[0]
-        window.attrs['timeframe'] = Path(parquet_path).stem.split('_')[-1]
+        window.attrs['symbol'] = symbol
+        window.attrs['timeframe'] = timeframe
 
         candidates = evaluate_smc(window)
         if not candidates:
@@ -83,11 +283,61 @@ def generate_labeled_dataset(parquet_path: str, lookback: int = 500, forward_bar
         if max_samples and count >= max_samples:
             break
 
-    out_path = out_csv or parquet_path.replace('.parquet', f'_labeled_tp{tp_index}.csv')
     pd.DataFrame(rows).to_csv(out_path, index=False)
+    _record_output(out_path, len(rows), df_all, lookback, forward_bars)
     return out_path
 
 
+def _labeled_so_far(out_path: str, df_all: pd.DataFrame, lookback: int):
+    """
+    What an earlier build of out_path covered, for appending to it: {'rows', 'ts_min', 'columns',
+    'next_t'} with next_t the first window end not labeled yet. None (rebuild the file) unless the
+    manifest has its bar range, the file is unchanged since it was recorded and the parquet
+    still holds its last labeled bar.
+    """
+    if 'ts' not in df_all.columns or not os.path.exists(out_path) or not _in_data_dir(out_path):
+        return None
+    entry = manifest.load()['files'].get(os.path.basename(out_path))
+    st = os.stat(out_path)
+    if not entry or entry.get('ts_max') is None or entry['bytes'] != st.st_size or entry['mtime'] != st.st_mtime:
+        return None
+    ts = df_all['ts']
+    try:
+        last = pd.Series([entry['ts_max']]).astype(ts.dtype).iat[0]
+    except (TypeError, ValueError):
+        return None
+    done = int(ts.searchsorted(last, side='right'))
+    if done == 0 or ts.iat[done - 1] != last:
+        return None
+    with open(out_path) as f:
+        columns = f.readline().rstrip('\r\n').split(',')
+    # window end t covers bars [t - lookback, t): the next one ends right after the last labeled bar
+    return {'rows': entry['rows'], 'ts_min': entry.get('ts_min'), 'columns': columns,
+            'next_t': max(done + 1, lookback)}
+
+
+def _in_data_dir(out_path: str) -> bool:
+    return os.path.dirname(os.path.abspath(out_path)) == os.path.abspath(manifest.DATA_DIR)
+
+
+def _record_output(out_path: str, rows: int, df_all: pd.DataFrame, lookback: int, forward_bars: int, first_ts=None):
+    """
+    Add a labeled CSV written under DATA_DIR to the labeled-data manifest (auto_trainer reads it).
+    first_ts: bar range start of rows appended to an earlier build (default: the first window of df_all).
+    """
+    if not _in_data_dir(out_path):
+        return
+    ts_range = None
+    last = len(df_all) - forward_bars - 3
+    if 'ts' in df_all.columns and last >= lookback - 1:
+        # bar times of the last candle of the first / last labeled window (window end t covers [t - lookback, t))
+        ts_range = (df_all['ts'].iloc[lookback - 1] if first_ts is None else first_ts, df_all['ts'].iloc[last])
+    try:
+        manifest.record(out_path, rows=rows, ts_range=ts_range)
+    except Exception as e:
+        print("manifest update failed:", e)
+
+
 def save_prediction(cand, ml_label, confidence):
     """
     Save final prediction to predictions/signal.json
@@ -0,0 +1,128 @@
+"""
+Manifest of the labeled datasets in data/ (data/labeled_manifest.json).
+
+One entry per labeled CSV: rows, bytes, mtime, sha1 of the content and, when the writer knows
+it, the bar time range the rows were labeled from. generate_labeled_dataset() records its
+output right after writing it: rows and bar range come from its frame, and the file is streamed
+once for its sha1 (never parsed). refresh() picks up files written by anything else and only
+re-reads a file whose size or mtime changed, streaming it once to hash it and count its lines.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+MANIFEST_PATH = os.path.join(DATA_DIR, "labeled_manifest.json")
+
+_lock = threading.Lock()
+
+
+def is_labeled_file(name: str) -> bool:
+    return name.endswith(".csv") and "labeled" in name
+
+
+def load(path: str = MANIFEST_PATH) -> Dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"files": {}}
+
+
+def _save(manifest: Dict, path: str = MANIFEST_PATH):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def scan_file(path: str, block: int = 1 << 20) -> Tuple[str, int]:
+    """(sha1, data rows) of a CSV in one streaming pass (rows = lines minus the header)."""
+    h = hashlib.sha1()
+    lines, last = 0, b"\n"
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+            lines += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last != b"\n":
+        lines += 1              # no newline after the last row
+    return h.hexdigest(), max(lines - 1, 0)
+
+
+def prefix_sha1(path: str, nbytes: int, block: int = 1 << 20) -> Optional[str]:
+    """sha1 of the first nbytes of a file; None when the file is shorter."""
+    h = hashlib.sha1()
+    left = nbytes
+    with open(path, "rb") as f:
+        while left > 0:
+            chunk = f.read(min(block, left))
+            if not chunk:
+                return None
+            h.update(chunk)
+            left -= len(chunk)
+    return h.hexdigest()
+
+
+def _entry(path: str, sha1: str, rows: int, ts_range=None, prev: Optional[Dict] = None) -> Dict:
+    st = os.stat(path)
+    entry = {"rows": int(rows), "bytes": st.st_size, "mtime": st.st_mtime, "sha1": sha1,
+             "ts_min": None, "ts_max": None, "updated_at": datetime.utcnow().isoformat()}
+    if ts_range is not None:
+        entry["ts_min"], entry["ts_max"] = (str(t) if t is not None else None for t in ts_range)
+    elif prev and prev.get("sha1") == sha1:
+        entry["ts_min"], entry["ts_max"] = prev.get("ts_min"), prev.get("ts_max")
+    return entry
+
+
+def record(path: str, rows: Optional[int] = None, ts_range=None, manifest_path: str = MANIFEST_PATH) -> Dict:
+    """
+    Upsert the entry for a labeled file that was just written. rows (when the writer knows it)
+    skips counting lines; the file is still streamed once for its sha1.
+    """
+    sha1, counted = scan_file(path)
+    with _lock:
+        manifest = load(manifest_path)
+        name = os.path.basename(path)
+        entry = _entry(path, sha1, counted if rows is None else rows, ts_range, manifest["files"].get(name))
+        manifest["files"][name] = entry
+        _save(manifest, manifest_path)
+    return entry
+
+
+def refresh(data_dir: str = DATA_DIR, manifest_path: str = MANIFEST_PATH) -> Dict:
+    """
+    Bring the manifest in line with the labeled files in data_dir: unchanged files (same size
+    and mtime) are only stat()ed, new / modified ones are scanned, deleted ones dropped.
+    """
+    with _lock:
+        manifest = load(manifest_path)
+        files = manifest["files"]
+        present = set()
+        changed = False
+        for name in sorted(os.listdir(data_dir)) if os.path.isdir(data_dir) else []:
+            if not is_labeled_file(name):
+                continue
+            path = os.path.join(data_dir, name)
+            present.add(name)
+            st = os.stat(path)
+            prev = files.get(name)
+            if prev and prev["bytes"] == st.st_size and prev["mtime"] == st.st_mtime:
+                continue
+            sha1, rows = scan_file(path)
+            files[name] = _entry(path, sha1, rows, prev=prev)
+            changed = True
+        for name in set(files) - present:
+            del files[name]
+            changed = True
+        if changed or not os.path.exists(manifest_path):
+            _save(manifest, manifest_path)
+        return manifest
+
+
+def total_rows(manifest: Dict) -> int:
+    return sum(e["rows"] for e in manifest["files"].values())
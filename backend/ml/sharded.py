@@ -0,0 +1,98 @@
+"""
+Process-pool driver for labeling long OHLCV series in time chunks.
+
+The price columns are copied once into a shared-memory block; worker processes attach to it
+in their initializer and see the columns as read-only NumPy views, so a task is just the
+(t0, t1) range of positions it owns. Each chunk reads `lead` bars before t0 and `trail` bars
+after t1 from the shared arrays (the lookback / forward horizon), and results come back in
+chunk order, so concatenating them gives the same rows as one serial pass.
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+LABEL_WORKERS = int(os.getenv("LABEL_WORKERS", "0")) or (os.cpu_count() or 1)
+MIN_CHUNK = 20_000
+
+_ARRAYS: Dict[str, np.ndarray] = {}
+_SHM: Optional[shared_memory.SharedMemory] = None
+
+
+def plan_chunks(start: int, stop: int, workers: int, chunk: Optional[int] = None) -> List[Tuple[int, int]]:
+    """Split positions [start, stop) into consecutive (t0, t1) ranges, ~4 per worker by default."""
+    total = stop - start
+    if total <= 0:
+        return []
+    if chunk is None:
+        chunk = max(MIN_CHUNK, math.ceil(total / (max(workers, 1) * 4)))
+    return [(t0, min(t0 + chunk, stop)) for t0 in range(start, stop, chunk)]
+
+
+class SharedArrays:
+    """Equal-length float64 columns in one shared-memory block (parent side, a context manager)."""
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.keys = tuple(columns)
+        n = len(next(iter(columns.values()))) if columns else 0
+        self.shape = (len(self.keys), n)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, 8 * self.shape[0] * n))
+        block = np.ndarray(self.shape, dtype=np.float64, buffer=self.shm.buf)
+        for row, key in enumerate(self.keys):
+            block[row] = columns[key]
+
+    @property
+    def spec(self):
+        return self.shm.name, self.shape, self.keys
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _attach(spec):
+    """Worker initializer: map the parent's block and publish read-only column views."""
+    global _SHM
+    name, shape, keys = spec
+    # workers share the parent's resource tracker: the parent unlinks the block when done
+    _SHM = shared_memory.SharedMemory(name=name)
+    block = np.ndarray(shape, dtype=np.float64, buffer=_SHM.buf)
+    block.flags.writeable = False
+    _ARRAYS.clear()
+    _ARRAYS.update({k: block[i] for i, k in enumerate(keys)})
+
+
+def arrays() -> Dict[str, np.ndarray]:
+    """The shared columns, inside a task."""
+    return _ARRAYS
+
+
+def run_sharded(columns: Dict[str, np.ndarray], task: Callable, chunks: Sequence[Tuple], workers: int) -> List:
+    """
+    task(chunk) for every chunk in worker processes that share `columns`; results in chunk order.
+    `task` must be a module-level function reading its data through arrays().
+    """
+    if not chunks:
+        return []
+    if workers <= 1 or len(chunks) == 1:
+        # in-process: same tasks over the parent's arrays
+        _ARRAYS.clear()
+        _ARRAYS.update(columns)
+        try:
+            return [task(c) for c in chunks]
+        finally:
+            _ARRAYS.clear()
+    with SharedArrays(columns) as shared:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_attach,
+                                 initargs=(shared.spec,)) as pool:
+            return list(pool.map(task, chunks))
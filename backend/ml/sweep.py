@@ -0,0 +1,310 @@
+"""
+ml/sweep.py - parameter sweep of the confluence score over historical candles
+Usage: python ml/sweep.py data/BTCUSDT_5m.parquet --grid grid.json [--workers N] [--out results.csv]
+
+grid.json maps parameter names to the values to try, e.g.
+  {"min_move_pips": [100, 150, 200], "killzones": [[[8, 11], [13, 16]], [[7, 10], [12, 16]]],
+   "pool_threshold": [0.0003, 0.0005], "body_ratio": [0.5, 0.6, 0.7]}
+Parameters left out keep their current value in the code (DEFAULTS):
+  min_move_pips, pip_size, killzones       check_signals.MIN_MOVE_PIPS / PIP_SIZE / KILLZONES
+  ob_lookback, fvg_lookback,
+  pool_lookback, pool_threshold            AnalysisContext (smc_filters) detector defaults
+  body_ratio, min_body_pct                 advanced_smc.BODY_RATIO / MIN_BODY_PCT
+  min_score                                score check_signals accepts (3)
+  tp_index                                 TP level the outcome is measured at (1)
+
+Every evaluate_smc candidate of every `window`-bar window (the labeling pipeline's candidates)
+is scored like check_signals.run_smc_confluence scores a signal on that window: killzone,
+impulsive move, HTF confirmation, liquidity pools, FVGs, order blocks, mitigation/breaker and
+TP move (no SMT: there is no reference market), with each check computed for all windows at
+once from whole-series arrays. Candidates scoring >= min_score are the signals; their
+first-touch outcome at tp_index comes from label_generator.label_barriers.
+
+Combinations run in a process pool over one shared-memory copy of the price arrays
+(ml.sharded); candidates and barriers are cached per worker for each body filter setting.
+The results table is ranked by expectancy (R per signal: +reward/risk when the TP is hit first,
+-1 when the SL is, 0 when neither within forward_bars), combinations with fewer than
+--min-signals signals last.
+"""
+
+import argparse, inspect, itertools, json, os, sys, time
+
+import numpy as np
+import pandas as pd
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(BACKEND_ROOT)
+
+import check_signals
+from analysis_context import AnalysisContext
+from ml import sharded
+from ml.label_generator import label_barriers
+from smc import advanced_smc
+from smc.fvg import find_fvgs
+from smc.liquidity import window_extremes
+from smc.orderblock import ORDER_BLOCK_RULES
+
+
+def _default(fn, name):
+    return inspect.signature(fn).parameters[name].default
+
+
+DEFAULTS = {
+    'min_move_pips': check_signals.MIN_MOVE_PIPS,
+    'pip_size': check_signals.PIP_SIZE,
+    'killzones': check_signals.KILLZONES,
+    'ob_lookback': _default(AnalysisContext.order_blocks, 'lookback'),
+    'fvg_lookback': _default(AnalysisContext.fvgs, 'lookback'),
+    'pool_lookback': _default(AnalysisContext.liquidity_pools, 'lookback'),
+    'pool_threshold': _default(AnalysisContext.liquidity_pools, 'threshold'),
+    'body_ratio': advanced_smc.BODY_RATIO,
+    'min_body_pct': advanced_smc.MIN_BODY_PCT,
+    'min_score': 3,
+    'tp_index': 1,
+}
+BOS_LOOKBACK = _default(AnalysisContext.bos, 'lookback')
+MITIGATION_CANDLES = _default(check_signals.smc_filters.detect_mitigation_blocks, 'recent_candles')
+HTF_RULES = (('15min', 15 * 60), ('1h', 3600))
+
+_CACHE = {}
+
+
+def combinations(grid: dict) -> list:
+    """Every combination of the grid's values, other parameters at DEFAULTS."""
+    unknown = set(grid) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+    keys = list(grid)
+    combos = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        p = dict(DEFAULTS, **dict(zip(keys, values)))
+        p['killzones'] = tuple(tuple(z) for z in p['killzones'])
+        combos.append(p)
+    # neighbours share candidates (and the worker cache) when they share the body filters
+    return sorted(combos, key=lambda p: (p['body_ratio'], p['min_body_pct']))
+
+
+# ------------------------
+# Parameter-free columns (parent, once)
+# ------------------------
+
+def htf_confirmed(ts_sec: np.ndarray, close: np.ndarray, window: int, fast: int = 20, slow: int = 50) -> np.ndarray:
+    """
+    confirm_htf_confluence() of the window ending at each bar (all False before a full window).
+    A window's 15m / 1h resample is the series' closed bars from the window's first bin on, with
+    the last bin's close replaced by the window's last close, so MAs come from per-bin closes.
+    """
+    n = len(close)
+    last = np.arange(window - 1, n)
+    first = last - window + 1
+    trends = []
+    for _, seconds in HTF_RULES:
+        bins = np.floor_divide(ts_sec, seconds)
+        new_bin = np.r_[True, bins[1:] != bins[:-1]]
+        bin_idx = np.cumsum(new_bin) - 1
+        bin_close = close[np.r_[np.flatnonzero(new_bin)[1:] - 1, n - 1]]
+        csum = np.r_[0.0, np.cumsum(bin_close)]
+        b_first, b_last = bin_idx[first], bin_idx[last]
+        count = b_last - b_first + 1
+        ma = {}
+        for p in (fast, slow):
+            lo = np.maximum(b_last - p + 1, 0)
+            ma[p] = np.where(count >= p, (csum[b_last] - csum[lo] + close[last]) / p, np.nan)
+        trends.append(np.where(ma[fast] > ma[slow], 1, np.where(ma[fast] < ma[slow], -1, 0)))
+    out = np.zeros(n, dtype=bool)
+    out[last] = (trends[0] == trends[1]) & (trends[0] != 0)
+    return out
+
+
+def shared_columns(df: pd.DataFrame, window: int) -> dict:
+    """Price arrays plus the parameter-free checks, per bar (a window's last bar); df needs a ts column."""
+    ts = pd.to_datetime(df['ts']).reset_index(drop=True)
+    ts_sec = (ts.to_numpy(dtype='datetime64[ns]').astype(np.int64) // 10**9).astype(np.float64)
+    cols = {k: np.ascontiguousarray(df[k].to_numpy(dtype=np.float64)) for k in ('open', 'high', 'low', 'close')}
+    h, l, c = cols['high'], cols['low'], cols['close']
+    # smc_filters.detect_bos on the window: last close beyond the previous BOS_LOOKBACK highs / lows
+    prev_high = pd.Series(h).rolling(BOS_LOOKBACK).max().shift(1).to_numpy()
+    prev_low = pd.Series(l).rolling(BOS_LOOKBACK).min().shift(1).to_numpy()
+    cols['bos'] = ((c > prev_high) | (c < prev_low)).astype(np.float64)
+    cols['hour'] = ts.dt.hour.to_numpy(dtype=np.float64)
+    cols['htf'] = htf_confirmed(ts_sec, c, window).astype(np.float64)
+    return cols
+
+
+# ------------------------
+# Worker side
+# ------------------------
+
+def _cached(key, fn):
+    if key not in _CACHE:
+        _CACHE[key] = fn()
+    return _CACHE[key]
+
+
+def _window_any(flags: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """True where flags has a hit in [lo, hi) (per row)."""
+    csum = np.r_[0, np.cumsum(flags)]
+    return (hi > lo) & (csum[np.maximum(hi, lo)] - csum[lo] > 0)
+
+
+def _candidates(p, opts):
+    """evaluate_smc_batch candidates and their barrier outcomes for p's body filters."""
+    def build():
+        a = sharded.arrays()
+        frame = pd.DataFrame({k: a[k] for k in ('open', 'high', 'low', 'close')})
+        n = len(frame)
+        cand = advanced_smc.evaluate_smc_batch(frame, opts['window'], start=opts['window'], stop=n - opts['forward_bars'] - 1,
+                                               body_ratio=p['body_ratio'], min_body_pct=p['min_body_pct'])
+        t = cand['t'].astype(np.int64)
+        tps = np.column_stack([cand['tp1'], cand['tp2'], cand['tp3']]) if len(t) else np.empty((0, 3))
+        barriers = label_barriers(a['high'], a['low'], t, cand['entry'], cand['stop_loss'], tps, cand['side'].astype(bool),
+                                  max_bars=opts['forward_bars'])
+        bars, inverse = np.unique(t, return_inverse=True)
+        return cand, tps, barriers, bars, inverse
+    return _cached(('candidates', p['body_ratio'], p['min_body_pct']), build)
+
+
+def _order_block_masks():
+    a = sharded.arrays()
+    bull, bear = ORDER_BLOCK_RULES['three_candle'](a['open'], a['high'], a['low'], a['close'])[:2]
+    return bull, bear
+
+
+def bar_scores(p: dict, t: np.ndarray, window: int, block: int = 4096) -> np.ndarray:
+    """Confluence score of the windows ending before each t, without the per-signal TP move check."""
+    a = sharded.arrays()
+    h, l, c = a['high'], a['low'], a['close']
+    s = t - window
+    last = t - 1
+    score = np.zeros(len(t), dtype=np.int64)
+    # killzone / impulsive move (previous bar's range) / HTF confirmation
+    hour = a['hour'][last]
+    score += np.any([(hour >= z0) & (hour <= z1) for z0, z1 in p['killzones']], axis=0) if p['killzones'] else 0
+    score += np.abs(h[t - 2] - l[t - 2]) / p['pip_size'] >= p['min_move_pips']
+    score += a['htf'][last].astype(bool)
+    # liquidity pools: any bar i >= pool_lookback (window positions) with a tight enough range
+    L, thr = p['pool_lookback'], p['pool_threshold']
+    def pools():
+        hmax, hmin = window_extremes(h, L)
+        lmax, lmin = window_extremes(l, L)
+        limit = c * thr
+        flag = (hmax - hmin <= limit) | (lmax - lmin <= limit)
+        flag[:L] = False
+        return flag
+    score += _window_any(_cached(('pools', L, thr), pools), s + L, t)
+    # FVGs (coloured) with their third candle at window positions [2, fvg_lookback + 1)
+    def fvgs():
+        fv = find_fvgs(a['open'], h, l, c, require_color=True)
+        flag = np.zeros(len(c), dtype=bool)
+        flag[fv['index']] = True
+        return flag
+    score += _window_any(_cached(('fvgs',), fvgs), s + 2, s + np.minimum(p['fvg_lookback'] + 1, window))
+    # three-candle order blocks at window positions [1, min(window - 2, ob_lookback) - 1)
+    bull, bear = _cached(('order_blocks',), _order_block_masks)
+    ob_stop = min(window - 2, p['ob_lookback']) - 1
+    has_ob = _window_any(bull | bear, s + 1, s + ob_stop)
+    score += has_ob
+    # mitigation (BOS + an OB inside the last candles' range) or breaker (close through an OB)
+    offsets = np.arange(1, max(ob_stop, 1))
+    recent_low, recent_high = _cached(('recent',), lambda: (pd.Series(l).rolling(MITIGATION_CANDLES).min().to_numpy(),
+                                                            pd.Series(h).rolling(MITIGATION_CANDLES).max().to_numpy()))
+    bos = a['bos'][last].astype(bool)
+    mit = np.zeros(len(t), dtype=bool)
+    for b0 in range(0, len(t) if len(offsets) else 0, block):
+        sel = slice(b0, b0 + block)
+        q = s[sel][:, None] + offsets[None, :]
+        lb = last[sel][:, None]
+        is_ob = bull[q] | bear[q]
+        mitigated = is_ob & (l[q] >= recent_low[lb]) & (h[q] <= recent_high[lb])
+        broken = (bull[q] & (c[lb] < l[q])) | (bear[q] & (c[lb] > h[q]))
+        mit[sel] = (bos[sel] & mitigated.any(axis=1)) | broken.any(axis=1)
+    score += mit & has_ob
+    return score
+
+
+def evaluate(task) -> dict:
+    """Worker task: one parameter combination -> signal count, hit rate and expectancy."""
+    p, opts = task
+    t0 = time.perf_counter()
+    cand, tps, barriers, bars, inverse = _candidates(p, opts)
+    k = p['tp_index']
+    row = {key: p[key] for key in DEFAULTS}
+    row['killzones'] = ','.join(f'{z0}-{z1}' for z0, z1 in p['killzones'])
+    if len(bars) == 0:
+        return dict(row, candidates=0, signals=0, wins=0, losses=0, open=0, hit_rate=np.nan, expectancy_r=np.nan,
+                    avg_score=np.nan, eval_sec=round(time.perf_counter() - t0, 3))
+    entry, sl = cand['entry'], cand['stop_loss']
+    tp = tps[:, k - 1]
+    score = bar_scores(p, bars, opts['window'])[inverse]
+    # TP move potential, per signal
+    score += np.abs(tp - entry) / p['pip_size'] >= p['min_move_pips']
+    signal = score >= p['min_score']
+    outcome = barriers[f'tp{k}_outcome'].to_numpy()[signal]
+    risk = np.abs(entry - sl)[signal]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reward = np.where(risk > 0, np.abs(tp - entry)[signal] / risk, 0.0)
+    r = np.where(outcome == 1, reward, np.where(outcome == -1, -1.0, 0.0))
+    n = int(signal.sum())
+    return dict(row, candidates=int(len(entry)), signals=n, wins=int((outcome == 1).sum()), losses=int((outcome == -1).sum()),
+                open=int((outcome == 0).sum()), hit_rate=float((outcome == 1).mean()) if n else np.nan,
+                expectancy_r=float(r.mean()) if n else np.nan, avg_score=float(score[signal].mean()) if n else np.nan,
+                eval_sec=round(time.perf_counter() - t0, 3))
+
+
+# ------------------------
+# Driver
+# ------------------------
+
+def rank(results: pd.DataFrame, min_signals: int = 30) -> pd.DataFrame:
+    enough = results['signals'] >= min_signals
+    out = results.assign(_enough=enough).sort_values(['_enough', 'expectancy_r', 'signals'], ascending=False, na_position='last')
+    out = out.drop(columns='_enough').reset_index(drop=True)
+    out.insert(0, 'rank', np.arange(1, len(out) + 1))
+    return out
+
+
+def run_sweep(df: pd.DataFrame, grid: dict, window: int = 500, forward_bars: int = 120, workers: int = None,
+              min_signals: int = 30) -> pd.DataFrame:
+    """Ranked results table, one row per combination of `grid`."""
+    if window <= BOS_LOOKBACK:
+        raise ValueError(f"window must be > {BOS_LOOKBACK} bars")
+    combos = combinations(grid)
+    workers = workers or sharded.LABEL_WORKERS
+    if 'ts' not in df.columns:
+        df = df.assign(ts=df.index)
+    df = df.reset_index(drop=True)
+    columns = shared_columns(df, window)
+    opts = {'window': window, 'forward_bars': forward_bars}
+    t0 = time.perf_counter()
+    print(f"Sweeping {len(combos)} combinations over {len(df)} bars on {min(workers, len(combos))} processes")
+    try:
+        rows = sharded.run_sharded(columns, evaluate, [(p, opts) for p in combos], workers)
+    finally:
+        _CACHE.clear()
+    print(f"Done in {time.perf_counter() - t0:.1f}s")
+    return rank(pd.DataFrame(rows), min_signals)
+
+
+def _load_grid(spec: str) -> dict:
+    if os.path.exists(spec):
+        with open(spec) as f:
+            return json.load(f)
+    return json.loads(spec)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Sweep confluence / detector parameters over historical candles")
+    ap.add_argument("parquet")
+    ap.add_argument("--grid", default="{}", help="JSON file or inline JSON: {parameter: [values]}")
+    ap.add_argument("--window", type=int, default=500, help="bars per scored window (live fetches 500)")
+    ap.add_argument("--forward-bars", type=int, default=120)
+    ap.add_argument("--workers", type=int, default=0, help="processes (0 = LABEL_WORKERS / all cores)")
+    ap.add_argument("--min-signals", type=int, default=30, help="combinations with fewer signals rank last")
+    ap.add_argument("--out", default=None, help="results CSV (default: <parquet>_sweep.csv)")
+    args = ap.parse_args()
+    results = run_sweep(pd.read_parquet(args.parquet), _load_grid(args.grid), args.window, args.forward_bars,
+                        args.workers, args.min_signals)
+    out = args.out or args.parquet.replace('.parquet', '_sweep.csv')
+    results.to_csv(out, index=False)
+    print(results.head(10).to_string(index=False))
+    print(f"Saved {len(results)} combinations to {out}")
@@ -0,0 +1,210 @@
+"""
+ml/train_model.py - (re)train the model on the labeled CSVs listed in data/labeled_manifest.json
+Usage: python ml/train_model.py [--mode auto|full|incremental]
+
+full:        fit a new model on every labeled row (time-ordered 80/20 report first).
+incremental: continue the current model on the rows added since the last training only:
+             LightGBM models keep boosting from the previous booster (init_model), sklearn
+             ensembles with warm_start (RandomForest & co.) grow AUTO_INCREMENT_TREES new trees.
+auto:        full when there is no model yet, the last full fit is older than
+             AUTO_FULL_RETRAIN_HOURS or a labeled file was rewritten (not just appended to);
+             incremental when at least AUTO_MIN_NEW_SAMPLES rows were added; otherwise nothing.
+
+"Added rows" come from the manifest: per file, the rows beyond the count trained on last time,
+as long as the bytes trained on are still the file's prefix (sha1 of the first `bytes` bytes
+equals the sha1 recorded at training); labeled files are written in window order, so new
+windows land at the end, and a regenerated file fails the check even when it is longer and
+starts at the same bar. What was trained on is kept next to the model in <model>.state.json. The model is written atomically, so a ModelRegistry watching the path
+picks it up like any other retrain.
+"""
+
+import argparse, json, os, re, sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(BACKEND_ROOT)
+
+from ml import manifest
+
+DATA_DIR = manifest.DATA_DIR
+MODEL_PATH = os.getenv('AUTO_MODEL_PATH', os.path.join(BACKEND_ROOT, 'models', 'smc_model_labeled.pkl'))
+MIN_NEW_SAMPLES = int(os.getenv('AUTO_MIN_NEW_SAMPLES', '200'))
+FULL_RETRAIN_HOURS = float(os.getenv('AUTO_FULL_RETRAIN_HOURS', '24'))
+INCREMENT_TREES = int(os.getenv('AUTO_INCREMENT_TREES', '50'))
+
+# labeled CSV columns that are not model inputs
+META_COLUMNS = {'symbol', 'timeframe', 'side', 'entry', 'stop_loss', 'take_profits', 'created_at', 'reason', 'label'}
+_BARRIER_COLUMN = re.compile(r'^tp\d+_(outcome|hit_bar|mfe|mae)$')
+
+
+def state_path(model_path: str = MODEL_PATH) -> str:
+    return os.path.splitext(model_path)[0] + '.state.json'
+
+
+def load_state(model_path: str = MODEL_PATH) -> dict:
+    try:
+        with open(state_path(model_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state: dict, model_path: str = MODEL_PATH):
+    tmp = state_path(model_path) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, state_path(model_path))
+
+
+def _trained(entry: dict) -> dict:
+    """What the state keeps per trained file: enough to tell an append from a rewrite."""
+    return {'rows': entry['rows'], 'bytes': entry['bytes'], 'sha1': entry['sha1'], 'ts_min': entry.get('ts_min')}
+
+
+def pending(man: dict, state: dict, data_dir: str = DATA_DIR) -> dict:
+    """
+    Rows per file not trained on yet: {name: (skip, new_rows)}. A file whose trained bytes are
+    no longer its prefix (rewritten, shrunk, or trained before prefixes were recorded) is marked
+    with skip = -1 (needs a full retrain). Only files that changed since training are read.
+    """
+    trained = state.get('files', {})
+    out = {}
+    for name, entry in man['files'].items():
+        prev = trained.get(name)
+        if prev is None:
+            out[name] = (0, entry['rows'])
+        elif entry['sha1'] == prev.get('sha1'):
+            continue
+        elif ('bytes' not in prev or entry['rows'] < prev['rows'] or entry['bytes'] < prev['bytes']
+              or manifest.prefix_sha1(os.path.join(data_dir, name), prev['bytes']) != prev['sha1']):
+            out[name] = (-1, entry['rows'])
+        elif entry['rows'] > prev['rows']:
+            out[name] = (prev['rows'], entry['rows'] - prev['rows'])
+    return out
+
+
+def plan(man: dict, state: dict, model_path: str = MODEL_PATH, now: datetime = None) -> tuple:
+    """('full' | 'incremental' | None, reason, new rows)."""
+    now = now or datetime.utcnow()
+    todo = pending(man, state)
+    new_rows = sum(n for skip, n in todo.values() if skip >= 0)
+    if not os.path.exists(model_path) or not state.get('full_at'):
+        return 'full', 'no model yet', new_rows
+    if any(skip < 0 for skip, _ in todo.values()):
+        return 'full', 'labeled file rewritten', new_rows
+    if now - datetime.fromisoformat(state['full_at']) >= timedelta(hours=FULL_RETRAIN_HOURS):
+        return 'full', f'last full fit older than {FULL_RETRAIN_HOURS:g}h', new_rows
+    if new_rows >= MIN_NEW_SAMPLES:
+        return 'incremental', f'{new_rows} new rows', new_rows
+    return None, f'{new_rows} new rows < {MIN_NEW_SAMPLES}', new_rows
+
+
+def _read(name: str, skip: int = 0) -> pd.DataFrame:
+    path = os.path.join(DATA_DIR, name)
+    return pd.read_csv(path, skiprows=range(1, skip + 1) if skip else None)
+
+
+def feature_columns(df: pd.DataFrame) -> list:
+    return [c for c in df.select_dtypes(include=[np.number]).columns
+            if c not in META_COLUMNS and not _BARRIER_COLUMN.match(c)]
+
+
+def _atomic_dump(model, path: str):
+    import joblib
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    joblib.dump(model, tmp)
+    os.replace(tmp, path)
+
+
+def continue_training(model, X: pd.DataFrame, y: pd.Series):
+    """The previous model extended with X/y only; None when the model type cannot continue."""
+    if hasattr(model, 'booster_'):
+        # LightGBM sklearn API: keep boosting from the current trees
+        from sklearn.base import clone
+        new = clone(model)
+        new.fit(X, y, init_model=model.booster_)
+        return new
+    if 'warm_start' in model.get_params():
+        # sklearn ensembles: the existing trees stay, the extra ones are fit on the new rows
+        if len(np.unique(y)) < len(model.classes_):
+            raise ValueError('new rows do not cover every class')
+        model.set_params(warm_start=True, n_estimators=model.n_estimators + INCREMENT_TREES)
+        model.fit(X, y)
+        return model
+    return None
+
+
+def train_full(man: dict, model_path: str = MODEL_PATH) -> dict:
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import classification_report
+    names = sorted(man['files'])
+    df = pd.concat([_read(n) for n in names], ignore_index=True).dropna()
+    cols = feature_columns(df)
+    X, y = df[cols], df['label'].astype(int)
+    split = int(len(df) * 0.8)
+    model = RandomForestClassifier(n_estimators=300, random_state=42, n_jobs=-1)
+    if 0 < split < len(df):
+        model.fit(X.iloc[:split], y.iloc[:split])
+        print(classification_report(y.iloc[split:], model.predict(X.iloc[split:])))
+    # the saved model sees the whole history
+    model.fit(X, y)
+    _atomic_dump(model, model_path)
+    now = datetime.utcnow().isoformat()
+    state = {'mode': 'full', 'full_at': now, 'trained_at': now, 'features': cols, 'rows': int(len(df)),
+             'files': {n: _trained(man['files'][n]) for n in names}}
+    _save_state(state, model_path)
+    print(f"Full retrain on {len(df)} rows -> {model_path}")
+    return state
+
+
+def train_incremental(man: dict, state: dict, model_path: str = MODEL_PATH) -> dict:
+    import joblib
+    todo = {n: v for n, v in pending(man, state).items() if v[0] >= 0}
+    if not todo:
+        print("No new rows")
+        return state
+    df = pd.concat([_read(n, skip) for n, (skip, _) in sorted(todo.items())], ignore_index=True).dropna()
+    cols = state['features']
+    model = joblib.load(model_path)
+    try:
+        new = continue_training(model, df[cols], df['label'].astype(int))
+    except ValueError as e:
+        print("Incremental update skipped:", e)
+        return state
+    if new is None:
+        print("Model type cannot continue training; running a full retrain")
+        return train_full(man, model_path)
+    _atomic_dump(new, model_path)
+    state = dict(state, mode='incremental', trained_at=datetime.utcnow().isoformat(),
+                 rows=int(state.get('rows', 0) + len(df)))
+    state['files'] = dict(state.get('files', {}))
+    for n in todo:
+        state['files'][n] = _trained(man['files'][n])
+    _save_state(state, model_path)
+    print(f"Incremental update on {len(df)} new rows -> {model_path}")
+    return state
+
+
+def run(mode: str = 'auto', model_path: str = MODEL_PATH):
+    man = manifest.refresh(DATA_DIR)
+    state = load_state(model_path)
+    if mode == 'auto':
+        mode, reason, new_rows = plan(man, state, model_path)
+        print(f"train_model: {mode or 'skip'} ({reason})")
+        if mode is None:
+            return state
+    if mode == 'full':
+        return train_full(man, model_path)
+    return train_incremental(man, state, model_path)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Retrain the model on the labeled datasets")
+    ap.add_argument("--mode", choices=("auto", "full", "incremental"), default="auto")
+    ap.add_argument("--model", default=MODEL_PATH)
+    args = ap.parse_args()
+    run(args.mode, args.model)
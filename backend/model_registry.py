@@ -0,0 +1,172 @@
+# path: backend/model_registry.py
+"""
+Hot-reloadable model registry.
+
+The registry owns the active model reference for the prediction pipeline:
+- the first loadable model in `paths` (priority order) becomes active at startup; after that
+  only the highest-priority existing file is a candidate (no fallback to older files)
+- a daemon thread polls the model files (mtime/size) every `interval` seconds; when they
+  change, candidates are loaded in that thread and validated on a smoke batch
+  (predict_proba must return finite probabilities, one row per sample)
+- a valid new version replaces the active one with a single reference assignment, so
+  in-flight predictions keep the (model, version) pair they already read and never block
+- a candidate that fails to load or validate is logged and the current model stays active
+
+Every model gets a version string "<file>@<mtime>#<sha1[:8]>" so signals can record which
+model produced them.
+"""
+
+import hashlib
+import io
+import os
+import threading
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+
+MODEL_WATCH_SEC = float(os.getenv("MODEL_WATCH_SEC", "30"))
+
+
+def model_version(path: str, blob: bytes) -> str:
+    mtime = datetime.utcfromtimestamp(os.path.getmtime(path)).strftime("%Y%m%dT%H%M%S")
+    return f"{os.path.basename(path)}@{mtime}#{hashlib.sha1(blob).hexdigest()[:8]}"
+
+
+def validate_model(model, smoke_batch: pd.DataFrame):
+    """Raise ValueError unless `model` gives sane probabilities for every row of the smoke batch."""
+    X = smoke_batch
+    names = getattr(model, "feature_names_in_", None)
+    if names is not None:
+        missing = [c for c in names if c not in X.columns]
+        if missing:
+            raise ValueError(f"model expects unknown features: {missing}")
+        X = X[list(names)]
+    proba = np.asarray(model.predict_proba(X), dtype=np.float64)
+    if proba.ndim != 2 or proba.shape[0] != len(X):
+        raise ValueError(f"predict_proba returned shape {proba.shape} for {len(X)} rows")
+    if not np.isfinite(proba).all() or not np.allclose(proba.sum(axis=1), 1.0, atol=1e-6):
+        raise ValueError("predict_proba returned invalid probabilities")
+
+
+class ModelRegistry:
+    def __init__(self, paths: List[str], smoke_batch: Optional[Callable[[], pd.DataFrame]] = None,
+                 interval: float = MODEL_WATCH_SEC):
+        self.paths = list(paths)
+        self.smoke_batch = smoke_batch
+        self.interval = interval
+        # (model, version, path) swapped as one tuple so readers always see a consistent pair
+        self._active: Tuple[object, Optional[str], Optional[str]] = (None, None, None)
+        self._signature = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._reload_lock = threading.Lock()
+        self.swaps = 0
+
+    # ------------------------
+    # Readers (lock free)
+    # ------------------------
+
+    def active(self) -> Tuple[object, Optional[str]]:
+        """(model, version) currently serving predictions; (None, None) when ML is disabled."""
+        model, version, _ = self._active
+        return model, version
+
+    @property
+    def model(self):
+        return self._active[0]
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._active[1]
+
+    def info(self) -> dict:
+        _, version, path = self._active
+        return {"version": version, "path": path, "swaps": self.swaps, "watching": self.is_watching()}
+
+    # ------------------------
+    # Loading
+    # ------------------------
+
+    def _file_signature(self):
+        sig = []
+        for p in self.paths:
+            try:
+                st = os.stat(p)
+                sig.append((p, st.st_mtime_ns, st.st_size))
+            except OSError:
+                continue
+        return tuple(sig)
+
+    def _load_candidate(self, path: str):
+        with open(path, "rb") as f:
+            blob = f.read()
+        version = model_version(path, blob)
+        if version == self._active[1]:
+            return self._active[0], version
+        # load from the bytes that were hashed, so the version always matches the model
+        model = joblib.load(io.BytesIO(blob))
+        if self.smoke_batch is not None:
+            validate_model(model, self.smoke_batch())
+        return model, version
+
+    def reload(self) -> bool:
+        """
+        Load and validate the highest-priority model; swap it in if it is a new version.
+        Until a model is active, lower-priority files are tried in turn; after that only the
+        highest-priority existing file is, and when it fails the current model stays active.
+        """
+        with self._reload_lock:
+            self._signature = self._file_signature()
+            existing = [p for p in self.paths if os.path.exists(p)]
+            if self._active[0] is not None:
+                existing = existing[:1]
+            for p in existing:
+                try:
+                    model, version = self._load_candidate(p)
+                except Exception as e:
+                    print("⚠️ Model load error:", p, e)
+                    if self._active[0] is not None:
+                        print("Keeping active model:", self._active[1])
+                        return False
+                    continue
+                if version == self._active[1]:
+                    return False
+                self._active = (model, version, p)
+                self.swaps += 1
+                print("✅ Loaded model:", p, version)
+                return True
+            if self._active[0] is None:
+                print("⚠️ No model found. ML disabled.")
+            return False
+
+    # ------------------------
+    # Watcher
+    # ------------------------
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self._file_signature() != self._signature:
+                    self.reload()
+            except Exception as e:
+                print("model watcher error:", e)
+
+    def start(self):
+        """Start the background watcher (no-op when interval <= 0 or already running)."""
+        if self.interval <= 0 or self.is_watching():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def is_watching(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
@@ -1,12 +1,22 @@
 # path: backend/predict_signal.py
 from datetime import datetime
-from db import SessionLocal, Signal
+from signal_sink import insert_signals
+import numpy as np
 import pandas as pd
 import json
-import joblib
 import os
-import ccxt
+import time
 import traceback
+from typing import Optional
+from candle_store import get_store
+from check_signals import live_htf, run_smc_confluence
+from smc.state import get_state
+from model_registry import ModelRegistry
+from analysis_context import get_context
+from metrics import METRICS, common
+from utils.timeframes import timeframe_ms
+from feature_store import (BAR_COLUMNS, FEATURE_COLUMNS, FEATURE_STORE_ENABLED, candle_ts, compute_features,
+                           get_feature_store)
 
 # Model paths (adjust if your project uses different locations)
 BASE_DIR = os.path.dirname(__file__)
@@ -14,66 +24,91 @@ MODEL_5M = os.path.join(BASE_DIR, "models", "smc_model_5m.pkl")
 MODEL_FALLBACK = os.path.join(BASE_DIR, "models", "smc_model.pkl")
 MODEL_PATHS = [MODEL_5M, MODEL_FALLBACK, os.path.join(os.path.dirname(BASE_DIR), "models", "smc_model_5m.pkl"), os.path.join(os.path.dirname(BASE_DIR), "models", "smc_model.pkl")]
 
-def load_model():
-    for p in MODEL_PATHS:
-        if os.path.exists(p):
+def features_from_candles(df: pd.DataFrame, symbol=None, timeframe=None) -> pd.DataFrame:
+    """
+    One-row frame of feature_store.FEATURE_COLUMNS for the last candle (the columns training reads).
+    With symbol/timeframe the closed candles are appended to the feature store and the row comes
+    from its carried rolling state; otherwise it is computed from the candles alone.
+    """
+    with METRICS.stage("features_from_candles", symbol, timeframe):
+        ts = candle_ts(df) if symbol and FEATURE_STORE_ENABLED else None
+        if ts is not None:
             try:
-                m = joblib.load(p)
-                print("✅ Loaded model:", p)
-                return m
+                return get_feature_store().latest(symbol, timeframe, df)
             except Exception as e:
-                print("⚠️ Model load error:", p, e)
-    print("⚠️ No model found. ML disabled.")
-    return None
+                print("feature store error:", e)
+        out, _ = compute_features(df[BAR_COLUMNS].to_numpy(dtype=np.float64))
+        return pd.DataFrame(out[-1:], columns=FEATURE_COLUMNS)
 
-def features_from_candles(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy().reset_index(drop=True)
-    last = df.iloc[-1]
-    try:
-        # try to import atr from smc_filters if exists
-        from smc_filters import atr
-        a = atr(df)
-    except Exception:
-        a = 0.0
-    feat = {
-        "open": last["open"],
-        "high": last["high"],
-        "low": last["low"],
-        "close": last["close"],
-        "volume": last.get("volume", 0),
-        "atr": a
-    }
-    return pd.DataFrame([feat])
-
-# load model once for faster repeated calls (thread/process safety: safe enough for small workloads)
-_GLOBAL_MODEL = load_model()
+def _smoke_batch() -> pd.DataFrame:
+    """Feature rows from a fixed synthetic candle series; new models must score them before going live."""
+    rng = np.random.default_rng(7)
+    close = 30000.0 + np.cumsum(rng.normal(0, 25, 120))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 15, 120))
+    candles = pd.DataFrame({"open": open_, "high": np.maximum(open_, close) + spread,
+                            "low": np.minimum(open_, close) - spread, "close": close,
+                            "volume": rng.uniform(1, 50, 120)})
+    return pd.concat([features_from_candles(candles.iloc[:n]) for n in (40, 80, 120)], ignore_index=True)
 
-# function that contains the pipeline: returns saved signal dict OR None
-def predict_from_candles(candles: pd.DataFrame, symbol="BTC/USDT", timeframe="5m", require_smc=True):
+# active model: loaded once at import, then hot-swapped by the registry's watcher thread
+# whenever a retrain rewrites one of MODEL_PATHS (MODEL_WATCH_SEC=0 disables watching)
+MODEL_REGISTRY = ModelRegistry(MODEL_PATHS, smoke_batch=_smoke_batch)
+MODEL_REGISTRY.reload()
+MODEL_REGISTRY.start()
+
+def load_model():
+    """Reload the model files now and return the active model (None when ML is disabled)."""
+    MODEL_REGISTRY.reload()
+    return MODEL_REGISTRY.model
+
+def predict_batch(features: pd.DataFrame, model=None, symbol="*", timeframe="*"):
     """
-    Uses loaded model + SMC confirmation to decide and SAVE a signal if valid.
-    Returns saved signal dict (same shape as API returns) or None.
+    Score many feature rows with one predict_proba call on a contiguous float64 matrix.
+    Returns (labels, confidences): labels = classes_[argmax(proba)] (what model.predict gives),
+    confidences = max(proba) per row. symbol/timeframe only label the predict_proba timing.
     """
-    try:
-        model = _GLOBAL_MODEL
-        features = features_from_candles(candles)
-    except Exception as e:
-        print("feature extraction failed:", e)
-        return None
+    if model is None:
+        model = MODEL_REGISTRY.model
+    cols = list(getattr(model, "feature_names_in_", features.columns))
+    X = pd.DataFrame(np.ascontiguousarray(features[cols].to_numpy(dtype=np.float64)), columns=cols)
+    with METRICS.stage("predict_proba", symbol, timeframe):
+        proba = np.asarray(model.predict_proba(X))
+    best = proba.argmax(axis=1)
+    return np.asarray(model.classes_)[best], proba[np.arange(len(best)), best]
 
-    ml_label, confidence = None, 0.0
-    if model is not None:
-        try:
-            proba = model.predict_proba(features)[0]
-            ml_label = int(model.predict(features)[0])
-            confidence = float(max(proba))
-        except Exception as e:
-            print("ML predict error:", e)
 
-    # if no ML label, abort
-    if ml_label is None:
+def closed_candles(candles: pd.DataFrame, timeframe) -> Optional[pd.DataFrame]:
+    """candles without a still-forming last bar; None when they carry no bar times."""
+    ts = candle_ts(candles)
+    if ts is None:
         return None
+    return candles[ts < int(time.time() * 1000) - timeframe_ms(timeframe) + 1]
 
+def smc_confluence(candles: pd.DataFrame, symbol, timeframe, ml_signal: dict) -> Optional[dict]:
+    """
+    run_smc_confluence score of the closed candles, with the market's streaming SMC state and HTF aggregator.
+    Returns {"valid", "score", "category", "reason"} or None (no bar times / too few bars / error).
+    """
+    closed = closed_candles(candles, timeframe)
+    if closed is None or len(closed) < 10:
+        return None
+    ml_signal = dict(ml_signal, time=pd.Timestamp(int(candle_ts(closed)[-1]), unit="ms"))
+    try:
+        out = run_smc_confluence(closed, symbol, timeframe, ml_signal, state=get_state(symbol, timeframe),
+                                 htf=live_htf(symbol, timeframe))
+    except Exception as e:
+        print("smc_confluence error:", e)
+        return None
+    payload = out["payload"] or {}
+    return {"valid": out["valid"], "score": payload.get("score"), "category": payload.get("category"),
+            "reason": out["reason"]}
+
+def confirm_signal(candles: pd.DataFrame, symbol, timeframe, ml_label, confidence, model_version=None, require_smc=True):
+    """
+    SMC confirmation + SL/TP + move filter for one ML prediction.
+    Returns the Signal column values (see save_signal) or None when rejected.
+    """
     # generate side and minimal signal dict
     side = "BUY" if ml_label == 1 else "SELL"
     signal_stub = {"type": "long" if ml_label == 1 else "short", "index": len(candles)-1}
@@ -87,9 +122,11 @@ def predict_from_candles(candles: pd.DataFrame, symbol="BTC/USDT", timeframe="5m
 
     # Confirm via SMC if function provided
     confirmed = {}
+    ctx = get_context(candles, symbol, timeframe)
     if smc_confirm:
         try:
-            out = smc_confirm(candles, signal_stub)
+            with METRICS.stage("smc_confirm", symbol, timeframe):
+                out = smc_confirm(candles, signal_stub, ctx=ctx)
             if isinstance(out, dict):
                 confirmed = out
             else:
@@ -105,23 +142,26 @@ def predict_from_candles(candles: pd.DataFrame, symbol="BTC/USDT", timeframe="5m
     if require_smc and not confirmed.get("smc_confirmed", False):
         # strict mode: require SMC confirmation
         print("Rejected: not SMC confirmed")
+        METRICS.reject("confirm_signal", "not_smc_confirmed", symbol, timeframe)
         return None
 
     entry = float(candles['close'].iloc[-1])
-    atr_val = confirmed.get("atr", 0.0)
+    # smc_confirm answers with a bool: take the ATR from the shared context
+    atr_val = confirmed.get("atr") or ctx.atr()
     ob = confirmed.get("order_block")
 
     # compute SL/TP (use compute_sl_tp if exists, else fallback simple RR=2)
-    if compute_sl_tp:
-        try:
-            sl, tp = compute_sl_tp(entry, side, ob, atr_val, prefer_rr=2.0)
-        except Exception:
-            # fallback safe SL/TP
+    with METRICS.stage("compute_sl_tp", symbol, timeframe):
+        if compute_sl_tp:
+            try:
+                sl, tp = compute_sl_tp(entry, side, ob, atr_val, prefer_rr=2.0)
+            except Exception:
+                # fallback safe SL/TP
+                sl = entry - atr_val*1.0 if side == "BUY" else entry + atr_val*1.0
+                tp = entry + (entry - sl)*2 if side == "BUY" else entry - (sl - entry)*2
+        else:
             sl = entry - atr_val*1.0 if side == "BUY" else entry + atr_val*1.0
             tp = entry + (entry - sl)*2 if side == "BUY" else entry - (sl - entry)*2
-    else:
-        sl = entry - atr_val*1.0 if side == "BUY" else entry + atr_val*1.0
-        tp = entry + (entry - sl)*2 if side == "BUY" else entry - (sl - entry)*2
 
     # move potential check (use absolute difference in price)
     move = abs(tp - entry)
@@ -130,66 +170,108 @@ def predict_from_candles(candles: pd.DataFrame, symbol="BTC/USDT", timeframe="5m
     MIN_MOVE_POINTS = 150.0
     if move < MIN_MOVE_POINTS:
         print(f"Rejected: move potential {move} < required {MIN_MOVE_POINTS}")
+        METRICS.reject("confirm_signal", "move_below_min", symbol, timeframe)
         return None
 
-    # Save to DB (only if passed all conditions)
+    # confluence score of the closed bars, stored with the signal (informational, not a gate)
+    confluence = smc_confluence(candles, symbol, timeframe, {
+        "type": side, "entry": entry, "stop_loss": sl, "take_profit": tp, "confidence": confidence})
+
+    record = dict(
+        symbol=symbol.replace("/", ""),
+        timeframe=timeframe,
+        side=side.lower(),
+        entry=float(entry),
+        stop_loss=float(sl),
+        take_profit=float(tp),
+        rr=float(abs((tp - entry) / (entry - sl) if (entry - sl) != 0 else 0.0)),
+        ml_label=int(ml_label),
+        confidence=float(confidence),
+        reason="SMC+ML",
+        raw_data=json.dumps({"confirmed": confirmed, "model_version": model_version, "confluence": confluence}),
+        smc_confirmed=bool(confirmed.get("smc_confirmed", False)),
+        created_at=datetime.utcnow()
+    )
+    return record
+
+
+def predict_many(markets, require_smc=True, save=True):
+    """
+    Batch pipeline for many markets: markets is a list of (symbol, timeframe, candles).
+    Features of every market are stacked and scored with a single predict_proba (predict_batch),
+    then each row goes through confirm_signal. Returns one result per market, in order:
+    saved signal dict (save=True) / Signal column values (save=False) / None.
+    """
+    # one read of the registry: this batch keeps its model even if a swap happens meanwhile
+    model, model_version = MODEL_REGISTRY.active()
+    results = [None] * len(markets)
+    rows, keep = [], []
+    for i, (symbol, timeframe, candles) in enumerate(markets):
+        try:
+            rows.append(features_from_candles(candles, symbol, timeframe))
+            keep.append(i)
+        except Exception as e:
+            print("feature extraction failed:", symbol, timeframe, e)
+            METRICS.reject("predict_many", "feature_error", symbol, timeframe)
+    # if no ML label, abort
+    if model is None or not rows:
+        return results
+    try:
+        labels, confidences = predict_batch(pd.concat(rows, ignore_index=True), model,
+                                            common(markets[i][0] for i in keep), common(markets[i][1] for i in keep))
+    except Exception as e:
+        print("ML predict error:", e)
+        METRICS.reject("predict_many", "predict_error", n=len(keep))
+        return results
+
+    for i, label, conf in zip(keep, labels, confidences):
+        symbol, timeframe, candles = markets[i]
+        results[i] = confirm_signal(candles, symbol, timeframe, int(label), float(conf), model_version, require_smc=require_smc)
+    if save:
+        # Save to DB (only if passed all conditions), one transaction for the batch
+        passed = [i for i, r in enumerate(results) if r is not None]
+        saved = save_signals([results[i] for i in passed])
+        results = [None] * len(markets)
+        for i, sig in zip(passed, saved):
+            results[i] = sig
+    return results
+
+
+# function that contains the pipeline: returns saved signal dict OR None
+def predict_from_candles(candles: pd.DataFrame, symbol="BTC/USDT", timeframe="5m", require_smc=True, save=True):
+    """
+    Uses loaded model + SMC confirmation to decide and SAVE a signal if valid.
+    Returns saved signal dict (same shape as API returns) or None.
+    save=False skips the DB write and returns the Signal column values instead (see save_signal).
+    Single-market wrapper around predict_many.
+    """
+    return predict_many([(symbol, timeframe, candles)], require_smc=require_smc, save=save)[0]
+
+
+def save_signal(record: dict):
+    """Insert one signal record (Signal column values) and return it in the API shape, or None on error."""
+    saved = save_signals([record])
+    return saved[0] if saved else None
+
+
+def save_signals(records):
+    """Insert signal records in one batched transaction; returns the saved dicts ([] on error)."""
     try:
-        db = SessionLocal()
-        sig = Signal(
-            symbol=symbol.replace("/", ""),
-            timeframe=timeframe,
-            side=side.lower(),
-            entry=float(entry),
-            stop_loss=float(sl),
-            take_profit=float(tp),
-            rr=float(abs((tp - entry) / (entry - sl) if (entry - sl) != 0 else 0.0)),
-            ml_label=int(ml_label),
-            confidence=float(confidence),
-            reason="SMC+ML",
-            raw_data=json.dumps({"confirmed": confirmed}),
-            smc_confirmed=bool(confirmed.get("smc_confirmed", False)),
-            created_at=datetime.utcnow()
-        )
-        db.add(sig)
-        db.commit()
-        db.refresh(sig)
-        saved = {
-            "id": sig.id,
-            "symbol": sig.symbol,
-            "timeframe": sig.timeframe,
-            "side": sig.side,
-            "entry": sig.entry,
-            "stop_loss": sig.stop_loss,
-            "take_profit": sig.take_profit,
-            "rr": sig.rr,
-            "ml_label": sig.ml_label,
-            "confidence": sig.confidence,
-            "reason": sig.reason,
-            "smc_confirmed": sig.smc_confirmed,
-            "created_at": sig.created_at.isoformat()
-        }
-        db.close()
-        print("✅ Saved signal to DB:", saved)
+        saved = insert_signals(records)
+        for sig in saved:
+            print("✅ Saved signal to DB:", sig)
         return saved
     except Exception as e:
         print("DB save error:", e)
         traceback.print_exc()
-        try:
-            db.close()
-        except:
-            pass
-        return None
+        return []
 
 
-# helper to fetch candles (ccxt)
+# helper to fetch candles (served from the incremental candle cache; only new bars hit the exchange)
 def fetch_candles(symbol="BTC/USDT", timeframe="5m", limit=500):
     try:
-        exchange = ccxt.binance()
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-        df = pd.DataFrame(ohlcv, columns=["timestamp", "open", "high", "low", "close", "volume"])
-        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-        df = df.set_index("timestamp")
-        return df
+        with METRICS.stage("fetch_candles", symbol, timeframe):
+            return get_store().get(symbol, timeframe, limit=limit)
     except Exception as e:
         print("fetch_candles error:", e)
         return None
@@ -199,11 +281,13 @@ def fetch_candles(symbol="BTC/USDT", timeframe="5m", limit=500):
 # returns saved dict OR None
 def run_prediction(symbol="BTC/USDT", timeframe="5m"):
     try:
-        candles = fetch_candles(symbol, timeframe, limit=500)
-        if candles is None or candles.empty:
-            print("No candles fetched")
-            return None
-        return predict_from_candles(candles, symbol=symbol, timeframe=timeframe, require_smc=True)
+        with METRICS.stage("run_prediction", symbol, timeframe):
+            candles = fetch_candles(symbol, timeframe, limit=500)
+            if candles is None or candles.empty:
+                print("No candles fetched")
+                METRICS.reject("run_prediction", "no_candles", symbol, timeframe)
+                return None
+            return predict_from_candles(candles, symbol=symbol, timeframe=timeframe, require_smc=True)
     except Exception as e:
         print("run_prediction error:", e)
         traceback.print_exc()
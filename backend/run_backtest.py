@@ -1,9 +1,60 @@
 # path: backend/run_backtest.py
 import pandas as pd
+import numpy as np
 import math
 from db import SessionLocal, Signal
 from datetime import datetime
 
+OUTCOME_NONE, OUTCOME_SL, OUTCOME_TP = 0, 1, 2
+OUTCOME_NAMES = np.array(["NONE", "SL", "TP"], dtype=object)
+
+
+def resolve_exits(high, low, start, sl, tp, is_buy, horizon=256, max_cells=4_000_000):
+    """
+    For each trade, the first bar >= start whose range touches SL or TP (SL checked first on a bar).
+    All open trades are scanned together as a (trades x bars) block, starting with `horizon`
+    bars; the few still open continue in growing chunks until the end of the series.
+    Returns (outcome codes OUTCOME_*, hit bar or -1).
+    """
+    n = len(high)
+    m = len(start)
+    outcome = np.zeros(m, dtype=np.int8)
+    hit_bar = np.full(m, -1, dtype=np.int64)
+    if n == 0 or m == 0:
+        return outcome, hit_bar
+
+    def scan_block(rows, pos, size):
+        idx = pos[:, None] + np.arange(size)[None, :]
+        valid = idx < n
+        idx = np.minimum(idx, n - 1)
+        hi, lo = high[idx], low[idx]
+        buy = is_buy[rows][:, None]
+        sl_m = np.where(buy, lo <= sl[rows][:, None], hi >= sl[rows][:, None]) & valid
+        tp_m = np.where(buy, hi >= tp[rows][:, None], lo <= tp[rows][:, None]) & valid
+        hit = sl_m | tp_m
+        found = hit.any(axis=1)
+        j = hit.argmax(axis=1)[found]
+        outcome[rows[found]] = np.where(sl_m[found, j], OUTCOME_SL, OUTCOME_TP)
+        hit_bar[rows[found]] = pos[found] + j
+        return rows[~found], pos[~found] + size
+
+    def scan(rows, pos, size):
+        step = max(1, max_cells // size)
+        parts = [scan_block(rows[b:b + step], pos[b:b + step], size) for b in range(0, len(rows), step)]
+        return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+    rows = np.flatnonzero(start < n)
+    pos = start[rows]
+    size = horizon
+    while len(rows):
+        rows, pos = scan(rows, pos, size)
+        keep = pos < n
+        rows, pos = rows[keep], pos[keep]
+        # fewer trades remain open: widen the chunk, keeping the scan matrix bounded
+        size = max(size, min(size * 4, max_cells // max(len(rows), 1)))
+    return outcome, hit_bar
+
+
 def run_backtest_from_db(price_df_path="data/btc_5m.parquet"):
     # load price series
     price_df = pd.read_parquet(price_df_path)
@@ -12,7 +63,8 @@ def run_backtest_from_db(price_df_path="data/btc_5m.parquet"):
 
     db = SessionLocal()
     try:
-        signals = db.query(Signal).order_by(Signal.created_at).all()
+        signals = db.query(Signal.id, Signal.entry, Signal.stop_loss, Signal.take_profit, Signal.side,
+                           Signal.rr, Signal.reason, Signal.created_at).order_by(Signal.created_at).all()
     finally:
         db.close()
 
@@ -20,64 +72,35 @@ def run_backtest_from_db(price_df_path="data/btc_5m.parquet"):
         print("No signals to backtest.")
         return
 
-    trades = []
-    equity = 0.0
-    peak = 0.0
-    max_dd = 0.0
-    wins = 0
-    losses = 0
-    rr_sum = 0.0
-    for s in signals:
-        entry = float(s.entry)
-        sl = float(s.stop_loss)
-        tp = float(s.take_profit)
-        side = s.side
-        # find the index after signal time
-        future = price_df[price_df['timestamp'] > s.created_at]
-        hit = None
-        for _, c in future.iterrows():
-            if side == "BUY":
-                if c['low'] <= sl:
-                    hit = ("SL", sl, c['timestamp'])
-                    break
-                if c['high'] >= tp:
-                    hit = ("TP", tp, c['timestamp'])
-                    break
-            else:
-                if c['high'] >= sl:
-                    hit = ("SL", sl, c['timestamp'])
-                    break
-                if c['low'] <= tp:
-                    hit = ("TP", tp, c['timestamp'])
-                    break
-        if hit:
-            outcome = hit[0]
-            exit_price = hit[1]
-        else:
-            # if not hit, use last close in future window or skip
-            if len(future) > 0:
-                exit_price = future.iloc[-1]['close']
-                outcome = "NONE"
-            else:
-                exit_price = price_df.iloc[-1]['close']
-                outcome = "NONE"
-
-        pnl = (exit_price - entry) if side == "BUY" else (entry - exit_price)
-        trades.append({"id": s.id, "outcome": outcome, "pnl": pnl, "rr": s.rr, "reason": s.reason})
-        equity += pnl
-        peak = max(peak, equity)
-        drawdown = peak - equity
-        max_dd = max(max_dd, drawdown)
-        if outcome == "TP":
-            wins += 1
-        elif outcome == "SL":
-            losses += 1
-        rr_sum += (s.rr or 0)
-
-    total = len(trades)
+    ids, entry, sl, tp, side, rr_raw, reason, created_at = (list(col) for col in zip(*signals))
+    entry = np.array(entry, dtype=np.float64)
+    sl = np.array(sl, dtype=np.float64)
+    tp = np.array(tp, dtype=np.float64)
+    # stored sides are compared as-is (only "BUY" takes the long branch)
+    is_buy = np.array([sd == "BUY" for sd in side], dtype=bool)
+    rr = np.array([r or 0 for r in rr_raw], dtype=np.float64)
+
+    high = price_df['high'].to_numpy(dtype=np.float64)
+    low = price_df['low'].to_numpy(dtype=np.float64)
+    # first bar strictly after each signal
+    start = price_df['timestamp'].searchsorted(pd.to_datetime(created_at), side='right')
+    outcome, _ = resolve_exits(high, low, np.asarray(start, dtype=np.int64), sl, tp, is_buy)
+
+    # unresolved trades exit at the last close of the series
+    last_close = price_df.iloc[-1]['close']
+    exit_price = np.where(outcome == OUTCOME_SL, sl, np.where(outcome == OUTCOME_TP, tp, last_close))
+    pnl = np.where(is_buy, exit_price - entry, entry - exit_price)
+    equity = np.cumsum(pnl)
+    peak = np.maximum.accumulate(np.maximum(equity, 0.0))
+    max_dd = max(0.0, float((peak - equity).max()))
+
+    total = len(pnl)
+    wins = int((outcome == OUTCOME_TP).sum())
+    losses = int((outcome == OUTCOME_SL).sum())
+    total_pnl = float(equity[-1])
     winrate = wins / total if total > 0 else 0
-    avg_rr = rr_sum / total if total > 0 else 0
-    avg_pnl = sum(t['pnl'] for t in trades) / total if total > 0 else 0
+    avg_rr = float(np.cumsum(rr)[-1]) / total if total > 0 else 0
+    avg_pnl = total_pnl / total if total > 0 else 0
     expectancy = (avg_pnl)  # simplification; can be refined
 
     report = {
@@ -86,12 +109,12 @@ def run_backtest_from_db(price_df_path="data/btc_5m.parquet"):
         "losses": losses,
         "winrate": winrate,
         "avg_rr": avg_rr,
-        "total_pnl": sum(t['pnl'] for t in trades),
+        "total_pnl": total_pnl,
         "max_drawdown": max_dd,
         "expectancy": expectancy,
     }
     print("Backtest Report:", report)
-    pd.DataFrame(trades).to_csv("backtest_trades.csv", index=False)
+    pd.DataFrame({"id": ids, "outcome": OUTCOME_NAMES[outcome], "pnl": pnl, "rr": rr_raw, "reason": reason}).to_csv("backtest_trades.csv", index=False)
     print("Saved trades -> backtest_trades.csv")
     return report
 
@@ -0,0 +1,269 @@
+# path: backend/scanner.py
+"""
+Multi-symbol / multi-timeframe scanner for the scheduler job.
+
+One scan cycle:
+- fetches candles (and their feature row) for every (symbol, timeframe) concurrently (bounded thread pool)
+- scores all markets with a single predict_proba call, so inference cost is flat in the universe size
+- runs the CPU-bound SMC confirmation of each prediction in a process pool
+- queues valid signals on the write-behind signal sink (batched inserts off the scan path)
+- reports per-cycle timing; a market that is slow to fetch or analyze is dropped from the
+  cycle once SCAN_MARKET_TIMEOUT expires instead of stalling the others. A fetch still running
+  past its deadline keeps its market out of later cycles until it returns; an analysis still
+  running past its deadline gets its worker process terminated (the pool is rebuilt next cycle)
+
+The analysis pool starts its workers with SCAN_MP_START (default "spawn", or "forkserver"), never
+fork: the parent runs the scheduler, model-watcher and signal-sink threads, and a forked child
+could inherit a lock one of them held. Stage timings and rejections recorded in a worker are
+shipped back with its result and merged into metrics.METRICS, so they reach /metrics.
+
+Configuration (env):
+  SCANNER_ENABLED=1              use the scanner in app.auto_job
+  SCAN_SYMBOLS=BTC/USDT,ETH/USDT explicit universe, or "auto" for the top SCAN_TOP_N pairs by
+                                 24h quote volume in SCAN_QUOTE (default USDT)
+  SCAN_TIMEFRAMES=5m,15m
+  SCAN_FETCH_WORKERS, SCAN_ANALYSIS_WORKERS, SCAN_MARKET_TIMEOUT (seconds), SCAN_CANDLES,
+  SCAN_MP_START
+"""
+
+import os
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import get_context
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from metrics import METRICS
+from predict_signal import (MODEL_REGISTRY, confirm_signal, features_from_candles, fetch_candles,
+                            predict_batch)
+from signal_sink import get_sink
+
+SCANNER_ENABLED = os.getenv("SCANNER_ENABLED", "0") == "1"
+SCAN_SYMBOLS = os.getenv("SCAN_SYMBOLS", "BTC/USDT")
+SCAN_TIMEFRAMES = os.getenv("SCAN_TIMEFRAMES", "5m")
+SCAN_QUOTE = os.getenv("SCAN_QUOTE", "USDT")
+SCAN_TOP_N = int(os.getenv("SCAN_TOP_N", "100"))
+SCAN_FETCH_WORKERS = int(os.getenv("SCAN_FETCH_WORKERS", "16"))
+SCAN_ANALYSIS_WORKERS = int(os.getenv("SCAN_ANALYSIS_WORKERS", str(os.cpu_count() or 2)))
+SCAN_MARKET_TIMEOUT = float(os.getenv("SCAN_MARKET_TIMEOUT", "20"))
+SCAN_CANDLES = int(os.getenv("SCAN_CANDLES", "500"))
+SCAN_MP_START = os.getenv("SCAN_MP_START", "spawn")
+
+_fetch_pool: Optional[ThreadPoolExecutor] = None
+_analysis_pool: Optional[ProcessPoolExecutor] = None
+# futures that complete once a new analysis pool's workers have started
+_warmup: List = []
+# (symbol, timeframe) -> fetch future that outlived its cycle's deadline
+_late_fetches: Dict[Tuple[str, str], object] = {}
+_universe_cache: Dict[str, object] = {"symbols": None, "ts": 0.0}
+
+
+def load_universe(quote: str = SCAN_QUOTE, top_n: int = SCAN_TOP_N) -> List[str]:
+    """Top `top_n` spot pairs quoted in `quote`, ranked by 24h quote volume."""
+    import ccxt
+    ex = ccxt.binance({"enableRateLimit": True})
+    tickers = ex.fetch_tickers()
+    pairs = [(sym, t.get("quoteVolume") or 0.0) for sym, t in tickers.items()
+             if sym.endswith("/" + quote) and ":" not in sym]
+    pairs.sort(key=lambda p: p[1], reverse=True)
+    return [sym for sym, _ in pairs[:top_n]]
+
+
+def get_universe(refresh_sec: int = 3600) -> List[Tuple[str, str]]:
+    """(symbol, timeframe) pairs to scan. The 'auto' universe is refreshed at most every refresh_sec."""
+    if SCAN_SYMBOLS.strip().lower() == "auto":
+        if _universe_cache["symbols"] is None or time.time() - _universe_cache["ts"] > refresh_sec:
+            try:
+                _universe_cache["symbols"] = load_universe()
+                _universe_cache["ts"] = time.time()
+            except Exception as e:
+                print("scanner universe error:", e)
+        symbols = _universe_cache["symbols"] or ["BTC/USDT"]
+    else:
+        symbols = [s.strip() for s in SCAN_SYMBOLS.split(",") if s.strip()]
+    timeframes = [t.strip() for t in SCAN_TIMEFRAMES.split(",") if t.strip()]
+    return [(s, tf) for s in symbols for tf in timeframes]
+
+
+def _pools():
+    global _fetch_pool, _analysis_pool
+    if _fetch_pool is None:
+        _fetch_pool = ThreadPoolExecutor(max_workers=SCAN_FETCH_WORKERS, thread_name_prefix="scan-fetch")
+    if _analysis_pool is None:
+        _analysis_pool = ProcessPoolExecutor(max_workers=SCAN_ANALYSIS_WORKERS,
+                                             mp_context=get_context(SCAN_MP_START),
+                                             initializer=_init_worker)
+        # spawned workers import the pipeline (and load the model) before their first task;
+        # start them now so that happens while the cycle is fetching
+        _warmup[:] = [_analysis_pool.submit(os.getpid) for _ in range(SCAN_ANALYSIS_WORKERS)]
+    return _fetch_pool, _analysis_pool
+
+
+def _kill_analysis_pool():
+    """Drop the analysis pool and terminate its workers (tasks still running are abandoned)."""
+    global _analysis_pool
+    pool, _analysis_pool = _analysis_pool, None
+    if pool is None:
+        return
+    procs = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for p in procs:
+        if p.is_alive():
+            p.terminate()
+
+
+def shutdown():
+    global _fetch_pool
+    if _fetch_pool is not None:
+        _fetch_pool.shutdown(wait=False, cancel_futures=True)
+        _fetch_pool = None
+    _kill_analysis_pool()
+
+
+def _init_worker():
+    """Analysis worker setup: workers never predict, so no model watcher; start with empty metrics."""
+    MODEL_REGISTRY.stop()
+    METRICS.reset()
+
+
+def _fetch(symbol: str, timeframe: str, limit: int):
+    """Thread-pool task: candles + their ML feature row."""
+    t0 = time.perf_counter()
+    candles = fetch_candles(symbol, timeframe, limit=limit)
+    features = None
+    if candles is not None and not candles.empty:
+        try:
+            features = features_from_candles(candles, symbol, timeframe)
+        except Exception as e:
+            print(f"scanner features error {symbol} {timeframe}:", e)
+    return (candles, features), time.perf_counter() - t0
+
+
+def _confirm(symbol: str, timeframe: str, candles, ml_label: int, confidence: float, model_version):
+    """
+    Process-pool task: SMC checks for one ML prediction; the DB write happens in the parent.
+    Returns ((record, metrics recorded by this task), took).
+    """
+    t0 = time.perf_counter()
+    try:
+        record = confirm_signal(candles, symbol, timeframe, ml_label, confidence, model_version, require_smc=True)
+    except Exception:
+        traceback.print_exc()
+        record = None
+    return (record, METRICS.drain()), time.perf_counter() - t0
+
+
+def _drain(pending: Dict, deadlines: Dict, report: Dict, market_timeout: float, late: Optional[Dict] = None):
+    """
+    Yield (stage, symbol, timeframe, result, took) as futures complete. Failed tasks are counted in
+    report["failed"]; tasks still pending at their deadline are cancelled and counted as timed out.
+    Timed-out tasks that were already running (cancel() fails) are put in late[(symbol, timeframe)].
+    """
+    while pending:
+        now = time.perf_counter()
+        next_deadline = min(deadlines[f] for f in pending)
+        done, _ = wait(list(pending), timeout=max(0.0, next_deadline - now), return_when=FIRST_COMPLETED)
+        for fut in done:
+            stage, symbol, tf = pending.pop(fut)
+            deadlines.pop(fut, None)
+            try:
+                result, took = fut.result()
+            except Exception as e:
+                print(f"scanner {stage} error {symbol} {tf}:", e)
+                report["failed"] += 1
+                continue
+            yield stage, symbol, tf, result, took
+        # markets past their deadline are dropped from this cycle
+        now = time.perf_counter()
+        for fut in [f for f in pending if deadlines[f] <= now]:
+            stage, symbol, tf = pending.pop(fut)
+            deadlines.pop(fut, None)
+            if not fut.cancel() and late is not None:
+                late[(symbol, tf)] = fut
+            report["timed_out"] += 1
+            print(f"scanner: {symbol} {tf} {stage} timed out after {market_timeout}s")
+
+
+def run_scan_cycle(universe: Optional[List[Tuple[str, str]]] = None, market_timeout: float = SCAN_MARKET_TIMEOUT) -> Dict:
+    """
+    Scan every (symbol, timeframe) once:
+    fetch + features (thread pool) -> one predict_proba for all markets -> SMC confirmation
+    (process pool) -> signal sink. Returns the cycle report:
+    {"markets", "fetched", "analyzed", "failed", "timed_out", "skipped", "signals": [queued Signal
+     records], "fetch_sec", "inference_sec", "analysis_sec", "save_sec", "total_sec"}
+    fetch_sec / analysis_sec are summed task times (work done), the others are wall time.
+    "skipped" counts markets whose fetch from an earlier cycle is still running.
+    """
+    universe = universe if universe is not None else get_universe()
+    fetch_pool, analysis_pool = _pools()
+    t_start = time.perf_counter()
+    report = {"markets": len(universe), "fetched": 0, "analyzed": 0, "failed": 0, "timed_out": 0,
+              "skipped": 0, "signals": [], "fetch_sec": 0.0, "inference_sec": 0.0, "analysis_sec": 0.0,
+              "save_sec": 0.0, "total_sec": 0.0}
+
+    for key in [k for k, f in _late_fetches.items() if f.done()]:
+        del _late_fetches[key]
+
+    deadlines = {}
+    pending = {}
+    for symbol, tf in universe:
+        if (symbol, tf) in _late_fetches:
+            report["skipped"] += 1
+            continue
+        fut = fetch_pool.submit(_fetch, symbol, tf, SCAN_CANDLES)
+        pending[fut] = ("fetch", symbol, tf)
+        deadlines[fut] = t_start + market_timeout
+
+    fetched = []
+    for _, symbol, tf, (candles, features), took in _drain(pending, deadlines, report, market_timeout, _late_fetches):
+        report["fetch_sec"] += took
+        if candles is None or candles.empty or features is None:
+            report["failed"] += 1
+            continue
+        report["fetched"] += 1
+        fetched.append((symbol, tf, candles, features))
+
+    # one inference call for the whole universe
+    t_inf = time.perf_counter()
+    model, model_version = MODEL_REGISTRY.active()
+    predictions = []
+    if model is not None and fetched:
+        try:
+            labels, confidences = predict_batch(pd.concat([f[3] for f in fetched], ignore_index=True), model)
+            predictions = list(zip(fetched, labels, confidences))
+        except Exception as e:
+            print("scanner ML predict error:", e)
+    report["inference_sec"] = time.perf_counter() - t_inf
+
+    # analysis deadlines start once the workers are up, not while they are importing
+    wait(_warmup)
+    _warmup.clear()
+    for (symbol, tf, candles, _), label, conf in predictions:
+        afut = analysis_pool.submit(_confirm, symbol, tf, candles, int(label), float(conf), model_version)
+        pending[afut] = ("analyze", symbol, tf)
+        deadlines[afut] = time.perf_counter() + market_timeout
+
+    records = []
+    late_analysis = {}
+    for _, symbol, tf, (record, recorded), took in _drain(pending, deadlines, report, market_timeout, late_analysis):
+        METRICS.merge(recorded)
+        report["analysis_sec"] += took
+        report["analyzed"] += 1
+        if record:
+            records.append(record)
+    if any(not f.done() for f in late_analysis.values()):
+        # a running task cannot be cancelled; free its worker for the next cycle
+        _kill_analysis_pool()
+
+    # write-behind: the sink thread inserts the batch; the cycle does not wait for the DB
+    t_save = time.perf_counter()
+    get_sink().submit_many(records)
+    report["signals"] = records
+    report["save_sec"] = time.perf_counter() - t_save
+    report["total_sec"] = time.perf_counter() - t_start
+    print("scanner cycle: {markets} markets, {fetched} fetched, {analyzed} analyzed, {failed} failed, "
+          "{timed_out} timed out, {skipped} skipped, {n} signals | fetch {fetch_sec:.2f}s inference {inference_sec:.3f}s "
+          "analysis {analysis_sec:.2f}s save {save_sec:.2f}s wall {total_sec:.2f}s".format(n=len(report["signals"]), **report))
+    return report
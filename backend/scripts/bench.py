@@ -0,0 +1,298 @@
+"""
+scripts/bench.py - benchmark the SMC detectors, confluence, labeling and backtest on synthetic data
+Usage: python bench.py [--sizes 1000,100000,1000000] [--baseline bench_baseline.json] [--update-baseline]
+                       [--threshold 0.25] [--only detect_fvg,run_backtest_from_db] [--no-limits]
+
+Every target runs on the same seeded synthetic OHLCV series (trend / range / volatility-spike
+regimes, 5m bars). Wall time is the best of --repeat runs; peak memory (tracemalloc, Python + NumPy
+allocations) is measured in a separate run so tracing does not inflate the timings.
+
+Without --update-baseline the results are compared against the baseline JSON: a target whose
+wall time or peak memory grew by more than --threshold (default BENCH_THRESHOLD or 0.25, i.e.
+25%) counts as a regression and the script exits with status 1. Differences below --min-sec /
+--min-mb are treated as noise. Timings are machine-specific: record the baseline on the machine
+that runs the comparison.
+"""
+import argparse, gc, json, os, platform, sys, tempfile, time, tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+BENCH_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.25"))
+
+# ------------------------
+# Synthetic OHLCV
+# ------------------------
+
+REGIMES = ("trend", "range", "spike")
+
+
+def synthetic_ohlcv(n: int, seed: int = 7, start_price: float = 30_000.0, freq: str = "5min") -> pd.DataFrame:
+    """
+    Seeded OHLCV frame (DatetimeIndex 'timestamp', UTC-naive) built from alternating regimes:
+    trend (drift, normal volatility), range (mean reversion to the regime's opening price) and
+    spike (4-8x volatility and volume). Regimes last 100-2000 bars. Same (n, seed) -> same frame.
+    """
+    rng = np.random.default_rng(seed)
+    sigma = 0.0015
+    rets = np.empty(n)
+    vol_mult = np.empty(n)
+    regime = np.empty(n, dtype=np.int8)
+    i = 0
+    while i < n:
+        kind = rng.choice(len(REGIMES), p=(0.45, 0.45, 0.10))
+        length = min(int(rng.integers(100, 2000)), n - i)
+        if REGIMES[kind] == "trend":
+            drift = rng.choice((-1, 1)) * rng.uniform(0.1, 0.4) * sigma
+            rets[i:i + length] = drift + sigma * rng.standard_normal(length)
+            vol_mult[i:i + length] = 1.0
+        elif REGIMES[kind] == "range":
+            # AR(1) log-price deviation from the regime's start: returns are its increments
+            dev = np.zeros(length + 1)
+            shocks = 0.7 * sigma * rng.standard_normal(length)
+            for k in range(length):
+                dev[k + 1] = 0.97 * dev[k] + shocks[k]
+            rets[i:i + length] = np.diff(dev)
+            vol_mult[i:i + length] = 0.7
+        else:
+            mult = rng.uniform(4.0, 8.0)
+            rets[i:i + length] = mult * sigma * rng.standard_normal(length)
+            vol_mult[i:i + length] = mult
+        regime[i:i + length] = kind
+        i += length
+
+    close = start_price * np.exp(np.cumsum(rets))
+    open_ = np.empty(n)
+    open_[0] = start_price
+    open_[1:] = close[:-1]
+    wick = np.abs(rng.standard_normal((2, n))) * sigma * 0.5 * vol_mult * close
+    high = np.maximum(open_, close) + wick[0]
+    low = np.minimum(open_, close) - wick[1]
+    volume = rng.lognormal(mean=3.0, sigma=0.5, size=n) * vol_mult
+
+    index = pd.date_range("2024-01-01", periods=n, freq=freq, name="timestamp")
+    return pd.DataFrame({"open": open_, "high": high, "low": low, "close": close, "volume": volume,
+                         "regime": np.asarray(REGIMES, dtype=object)[regime]}, index=index)
+
+
+def synthetic_signals(df: pd.DataFrame, every: int = 50, seed: int = 7):
+    """Signal records (db.Signal columns) on every `every`-th bar: entry at the close, SL/TP 1x/2x a local range."""
+    rng = np.random.default_rng(seed)
+    bars = np.arange(every, len(df) - 1, every)
+    close = df["close"].to_numpy()
+    rng_width = (df["high"] - df["low"]).rolling(14, min_periods=1).mean().to_numpy()
+    buy = rng.random(len(bars)) < 0.5
+    records = []
+    for b, is_buy in zip(bars, buy):
+        entry, risk = float(close[b]), float(2 * rng_width[b])
+        sl = entry - risk if is_buy else entry + risk
+        tp = entry + 2 * risk if is_buy else entry - 2 * risk
+        records.append({"symbol": "BTC/USDT", "timeframe": "5m", "side": "BUY" if is_buy else "SELL",
+                        "entry": entry, "stop_loss": sl, "take_profit": tp, "rr": 2.0, "ml_label": 1,
+                        "confidence": 0.6, "reason": "bench", "smc_confirmed": True,
+                        "created_at": df.index[b].to_pydatetime()})
+    return records
+
+
+# ------------------------
+# Targets
+# ------------------------
+
+class Workload:
+    """Inputs shared by the targets at one size: the frame, its parquet file and the signal table."""
+
+    def __init__(self, n: int, workdir: str, seed: int):
+        self.n = n
+        self.workdir = workdir
+        self.df = synthetic_ohlcv(n, seed=seed)
+        self.ohlcv = self.df.drop(columns="regime")
+        # label_generator takes symbol / timeframe from the file name
+        self.parquet = os.path.join(workdir, "BTCUSDT_5m.parquet")
+        self.ohlcv.rename_axis("ts").reset_index().to_parquet(self.parquet, index=False)
+        self._load_signals(seed)
+
+    def _load_signals(self, seed):
+        from db import SessionLocal, Signal, init_db
+        from signal_sink import insert_signals
+        db = SessionLocal()
+        try:
+            # db.py binds its engine on first import: never clear a signals table that is not ours
+            bound = db.get_bind().url.database or ""
+            scratch = os.path.join(self.workdir, "bench.db")
+            if os.path.abspath(bound) != os.path.abspath(scratch):
+                raise RuntimeError(f"bench: db is bound to {db.get_bind().url}, not the scratch {scratch} "
+                                   "(import db only after run() sets DATABASE_URL)")
+            init_db()
+            db.query(Signal).delete()
+            db.commit()
+        finally:
+            db.close()
+        records = synthetic_signals(self.ohlcv, seed=seed)
+        for b in range(0, len(records), 5000):
+            insert_signals(records[b:b + 5000])
+        self.signals = len(records)
+
+
+def _confluence(w: Workload):
+    from check_signals import run_smc_confluence
+    from analysis_context import AnalysisContext
+    df = w.ohlcv
+    entry = float(df["close"].iloc[-1])
+    ml_signal = {"type": "BUY", "entry": entry, "stop_loss": entry * 0.99, "take_profit": entry * 1.02,
+                 "confidence": 0.7, "time": df.index[-1]}
+    # a fresh context: the shared one would serve repeated runs from its memo
+    return run_smc_confluence(df, "BTC/USDT", "5m", ml_signal, ctx=AnalysisContext(df, "BTC/USDT", "5m"))
+
+
+def _label(w: Workload):
+    from ml.label_generator import generate_labeled_dataset
+    return generate_labeled_dataset(w.parquet, out_csv=os.path.join(w.workdir, "labeled.csv"))
+
+
+def _backtest(w: Workload):
+    from run_backtest import run_backtest_from_db
+    cwd = os.getcwd()
+    os.chdir(w.workdir)          # backtest_trades.csv is written to the working directory
+    try:
+        return run_backtest_from_db(w.parquet)
+    finally:
+        os.chdir(cwd)
+
+
+def _targets():
+    import smc_filters
+    from smc.inducement import detect_inducement
+    # (name, fn(workload), max bars or None). smc_filters detectors get lookback=len(df) so they
+    # scan the whole series; detect_inducement is a per-row .iloc loop and is capped by default.
+    return [
+        ("detect_fvg", lambda w: smc_filters.detect_fvg(w.ohlcv, lookback=w.n), None),
+        ("detect_order_blocks", lambda w: smc_filters.detect_order_blocks(w.ohlcv, lookback=w.n), None),
+        ("detect_liquidity_pools", lambda w: smc_filters.detect_liquidity_pools(w.ohlcv), None),
+        ("detect_bos", lambda w: smc_filters.detect_bos(w.ohlcv), None),
+        ("detect_inducement", lambda w: detect_inducement(w.ohlcv), 100_000),
+        ("run_smc_confluence", _confluence, None),
+        ("generate_labeled_dataset", _label, None),
+        ("run_backtest_from_db", _backtest, None),
+    ]
+
+
+# ------------------------
+# Measurement
+# ------------------------
+
+class _Quiet:
+    """Swallow the targets' progress prints while they are timed."""
+
+    def __enter__(self):
+        self._stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def __exit__(self, *exc):
+        sys.stdout.close()
+        sys.stdout = self._stdout
+
+
+def measure(fn, w: Workload, repeat: int):
+    gc.collect()
+    times = []
+    for _ in range(repeat):
+        with _Quiet():
+            t0 = time.perf_counter()
+            fn(w)
+            times.append(time.perf_counter() - t0)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with _Quiet():
+            fn(w)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"wall_sec": round(min(times), 6), "peak_mb": round(peak / 2**20, 3)}
+
+
+def run(sizes, repeat=3, only=None, limits=True, seed=7):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="smc_bench_") as workdir:
+        # the backtest reads signals from the DB: point db.py at a scratch SQLite file
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        targets = [t for t in _targets() if not only or t[0] in only]
+        for n in sizes:
+            print(f"== {n:,} bars")
+            w = Workload(n, workdir, seed)
+            for name, fn, max_bars in targets:
+                key = f"{name}@{n}"
+                if limits and max_bars is not None and n > max_bars:
+                    print(f"  {name:<26} skipped (> {max_bars:,} bars, use --no-limits)")
+                    continue
+                res = measure(fn, w, repeat)
+                results[key] = res
+                print(f"  {name:<26} {res['wall_sec']:>10.4f} s {res['peak_mb']:>10.1f} MB")
+            del w
+    return results
+
+
+def compare(results, baseline, threshold, min_sec=0.005, min_mb=1.0):
+    """Regression messages for results that exceed baseline * (1 + threshold) by more than the noise floor."""
+    regressions = []
+    for key, res in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        for metric, floor in (("wall_sec", min_sec), ("peak_mb", min_mb)):
+            old, new = base[metric], res[metric]
+            if new > old * (1 + threshold) and new - old > floor:
+                regressions.append(f"{key} {metric}: {old:g} -> {new:g} (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark SMC detectors / confluence / labeling / backtest")
+    ap.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="comma separated bar counts")
+    ap.add_argument("--repeat", type=int, default=3, help="timed runs per target (best is kept)")
+    ap.add_argument("--only", default="", help="comma separated target names")
+    ap.add_argument("--baseline", default="bench_baseline.json")
+    ap.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    ap.add_argument("--threshold", type=float, default=BENCH_THRESHOLD, help="allowed relative growth (0.25 = 25%%)")
+    ap.add_argument("--min-sec", type=float, default=0.005, help="ignore wall time growth below this")
+    ap.add_argument("--min-mb", type=float, default=1.0, help="ignore peak memory growth below this")
+    ap.add_argument("--no-limits", action="store_true", help="also run capped targets at every size")
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    only = {s for s in args.only.split(",") if s}
+    results = run(sizes, repeat=args.repeat, only=only, limits=not args.no_limits, seed=args.seed)
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        doc = {
+            "created_at": datetime.utcnow().isoformat(),
+            "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                        "numpy": np.__version__, "pandas": pd.__version__},
+            "seed": args.seed,
+            "results": results,
+        }
+        with open(args.baseline, "w") as f:
+            json.dump(doc, f, indent=2)
+        print(f"Saved baseline -> {args.baseline}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f).get("results", {})
+    regressions = compare(results, baseline, args.threshold, args.min_sec, args.min_mb)
+    if regressions:
+        print(f"REGRESSIONS (threshold {args.threshold:.0%}):")
+        for r in regressions:
+            print("  " + r)
+        return 1
+    print(f"No regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,26 +3,12 @@ scripts/features.py
 Takes a OHLCV parquet and label parquet and produces feature table for model training.
 """
 import pandas as pd, numpy as np, os, sys
-try:
-    from ta.volatility import AverageTrueRange
-except Exception:
-    AverageTrueRange = None
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from feature_store import features_frame
 
 def add_features(df):
-    df = df.copy().reset_index(drop=True)
-    df['r1'] = df['close'].pct_change(1)
-    df['r3'] = df['close'].pct_change(3)
-    df['ma5'] = df['close'].rolling(5).mean()
-    df['ma20'] = df['close'].rolling(20).mean()
-    if AverageTrueRange is not None:
-        df['atr'] = AverageTrueRange(df['high'], df['low'], df['close'], window=14).average_true_range()
-    else:
-        df['atr'] = df['high'] - df['low']
-    df['body'] = (df['close'] - df['open']).abs()
-    df['upper_wick'] = df['high'] - df[['close','open']].max(axis=1)
-    df['lower_wick'] = df[['close','open']].min(axis=1) - df['low']
-    df['vol_spike'] = (df['volume'] > df['volume'].rolling(20).mean()*2).astype(int)
-    return df.dropna()
+    # same columns (and values) the live model is served from feature_store
+    return features_frame(df.reset_index(drop=True)).dropna()
 
 if __name__ == "__main__":
     if len(sys.argv)<4:
@@ -12,49 +12,104 @@ import sys
 # --- Fix path issue ---
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from smc.smc_engine import generate_signal
-
-
-def label_df(df: pd.DataFrame, forward_bars=60, profit_pct=0.006, stop_pct=0.004):
+from smc.smc_engine import breakout_columns, generate_signals_series, signal_indicators
+from ml import sharded
+
+
+def _future_extremes(close: np.ndarray, forward_bars: int):
+    """fut_max/fut_min[i]: extremes of close[i:i+forward_bars] (clipped at the end of the array)."""
+    fut_max = pd.Series(close[::-1]).rolling(forward_bars, min_periods=1).max().to_numpy()[::-1]
+    fut_min = pd.Series(close[::-1]).rolling(forward_bars, min_periods=1).min().to_numpy()[::-1]
+    return fut_max, fut_min
+
+
+def _label_chunk(task):
+    """
+    Worker task: signal, entry and label of rows [t0, t1) from the shared close/high/low and the
+    parent's ATR/EMA (one bar of leading overlap for the breakout, forward_bars trailing).
+    """
+    (t0, t1), forward_bars, profit_pct, stop_pct = task
+    cols = sharded.arrays()
+    a, b = t0 - 1, min(len(cols["close"]), t1 + forward_bars)
+    close, high, low = cols["close"][a:b], cols["high"][a:b], cols["low"][a:b]
+    buy, sell, filtered, _, _ = breakout_columns(close, high, low, cols["atr"][a:b], cols["ema"][a:b])
+    fut_max, fut_min = _future_extremes(close, forward_bars)
+    own = slice(1, t1 - a)
+    nxt = slice(2, t1 - a + 1)
+    buy_o, sell_o, filt_o = buy[own] & ~filtered[own], sell[own] & ~filtered[own], filtered[own]
+    # entry as generate_signals_series reports it: rounded close, None (NaN) when filtered or 0
+    entry = np.where(filt_o | (close[own] == 0), np.nan, np.round(close[own], 2))
+    with np.errstate(invalid="ignore"):
+        buy_win = buy_o & (fut_max[nxt] >= entry * (1 + profit_pct)) & ~(fut_min[nxt] <= entry * (1 - stop_pct))
+        sell_win = sell_o & (fut_min[nxt] <= entry * (1 - stop_pct)) & ~(fut_max[nxt] >= entry * (1 + profit_pct))
+    signal = np.where(buy_o, "buy", np.where(sell_o, "sell", "none")).astype(object)
+    return signal, entry, (buy_win | sell_win).astype(np.int64)
+
+
+def label_df_sharded(df: pd.DataFrame, forward_bars=60, profit_pct=0.006, stop_pct=0.004, workers=None, chunk=None):
+    """
+    label_df() over time chunks in worker processes (ml.sharded). ATR and EMA200 are recursive,
+    so the parent computes them once and shares them with the price columns; the rows are the
+    same as label_df's, in the same order.
+    """
+    total = len(df) - forward_bars
+    if total <= 120:
+        return pd.DataFrame([])
+    workers = workers or sharded.LABEL_WORKERS
+    atr, ema = signal_indicators(df)
+    columns = {k: np.ascontiguousarray(df[k].to_numpy(dtype=np.float64)) for k in ("close", "high", "low")}
+    columns.update(atr=atr, ema=ema)
+    chunks = sharded.plan_chunks(120, total, workers, chunk)
+    print(f"   Processing rows 120..{total} ({total - 120} rows) in {len(chunks)} chunks, {workers} workers")
+    parts = sharded.run_sharded(columns, _label_chunk, [(c, forward_bars, profit_pct, stop_pct) for c in chunks], workers)
+    return pd.DataFrame({
+        "ts": df["ts"].iloc[120:total].tolist(),
+        "signal": np.concatenate([p[0] for p in parts]),
+        "entry": np.concatenate([p[1] for p in parts]),
+        "label": np.concatenate([p[2] for p in parts]),
+        "reason": "",
+    })
+
+
+def label_df(df: pd.DataFrame, forward_bars=60, profit_pct=0.006, stop_pct=0.004, workers=1):
+    if workers != 1:
+        return label_df_sharded(df, forward_bars, profit_pct, stop_pct, workers=workers)
     rows = []
     total = len(df) - forward_bars
+    if total <= 120:
+        return pd.DataFrame(rows)
+
+    # one whole-series pass instead of generate_signal() on every prefix
+    sigs = generate_signals_series(df)
+    close = df["close"].to_numpy()
+    fut_max, fut_min = _future_extremes(close, forward_bars)
+    signal_col = sigs["signal"].to_numpy()
+    entry_col = sigs["entry"].to_numpy()
+    ts_col = df["ts"]
+    print(f"   Processing rows 120..{total} ({total - 120} rows)")
 
     for i in range(120, total):
-        # progress every 50 rows
-        if i % 50 == 0:
-            print(f"   Processing row {i}/{total}")
-
-        window = df.iloc[: i + 1].copy()
-        sig = generate_signal(window)
-
-        # agar signal empty ya dict me 'signal' na ho → skip
-        if not sig or "signal" not in sig:
-            continue  
-
-        entry = sig.get("entry", float(window["close"].iat[-1]))
-        fut = df["close"].iloc[i + 1 : i + 1 + forward_bars]
-        fut_max = fut.max()
-        fut_min = fut.min()
-
+        signal = signal_col[i]
+        entry = entry_col[i]
         label = 0
-        if sig["signal"] == "buy":
-            win = fut_max >= entry * (1 + profit_pct)
-            loss = fut_min <= entry * (1 - stop_pct)
+        if signal == "buy":
+            win = fut_max[i + 1] >= entry * (1 + profit_pct)
+            loss = fut_min[i + 1] <= entry * (1 - stop_pct)
             if win and not loss:
                 label = 1
-        elif sig["signal"] == "sell":
-            win = fut_min <= entry * (1 - stop_pct)
-            loss = fut_max >= entry * (1 + profit_pct)
+        elif signal == "sell":
+            win = fut_min[i + 1] <= entry * (1 - stop_pct)
+            loss = fut_max[i + 1] >= entry * (1 + profit_pct)
             if win and not loss:
                 label = 1
 
         rows.append(
             {
-                "ts": window["ts"].iat[-1],
-                "signal": sig["signal"],
+                "ts": ts_col.iat[i],
+                "signal": signal,
                 "entry": entry,
                 "label": label,
-                "reason": sig.get("reason", ""),
+                "reason": "",
             }
         )
 
@@ -63,11 +118,13 @@ def label_df(df: pd.DataFrame, forward_bars=60, profit_pct=0.006, stop_pct=0.004
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print("Usage: python label_data.py input.parquet out.parquet")
+        print("Usage: python label_data.py input.parquet out.parquet [workers]")
         sys.exit(1)
 
     inp = sys.argv[1]
     out = sys.argv[2]
+    # 0 = LABEL_WORKERS / all cores
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 1
 
     print(f"📂 Reading input file: {inp}")
     df = pd.read_parquet(inp)
@@ -75,7 +132,7 @@ if __name__ == "__main__":
     print(f"Total rows in input dataframe: {len(df)}")
 
     print("👉 Labeling started...")
-    labels = label_df(df)
+    labels = label_df(df, workers=workers)
 
     os.makedirs(os.path.dirname(out), exist_ok=True)
     labels.to_parquet(out)
@@ -0,0 +1,22 @@
+"""
+scripts/migrate_candidates.py - one-shot move of data/candidates/candidate_*.json into the candidate journal
+Usage: python migrate_candidates.py [--keep]
+
+Files are appended in creation time order and deleted once journaled, unless --keep.
+Safe to re-run after an interruption with the default (deleting) mode: only files still on
+disk are imported.
+"""
+import argparse, os, sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smc.analyzer import CANDIDATES_DIR, get_journal
+from smc.journal import migrate_directory
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Migrate per-candidate JSON files into the candidate journal")
+    ap.add_argument("--src", default=CANDIDATES_DIR)
+    ap.add_argument("--keep", action="store_true", help="leave the JSON files in place")
+    args = ap.parse_args()
+    journal = get_journal()
+    n = migrate_directory(args.src, journal, remove=not args.keep)
+    print(f"Migrated {n} candidates into {journal.root} ({journal.count()} total, {len(journal.segments)} segments)")
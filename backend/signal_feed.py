@@ -0,0 +1,102 @@
+# path: backend/signal_feed.py
+"""
+In-process fan-out of newly persisted signals + response cache for the signal endpoints.
+
+signal_sink.insert_signals() calls publish() after every commit:
+- the saved signals go into a bounded buffer keyed by their DB id, and every subscriber blocked
+  in wait() (SSE stream / long-poll) wakes up once for the whole batch
+- the feed version is bumped, which invalidates every cached endpoint response
+
+Cached responses also expire after SIGNAL_CACHE_TTL seconds, so rows written by another
+process (live_runner, scripts) still show up.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+SIGNAL_CACHE_TTL = float(os.getenv("SIGNAL_CACHE_TTL", "30"))
+FEED_BUFFER = int(os.getenv("SIGNAL_FEED_BUFFER", "1000"))
+
+
+class SignalFeed:
+    def __init__(self, buffer: int = FEED_BUFFER, cache_ttl: float = SIGNAL_CACHE_TTL):
+        self.cache_ttl = cache_ttl
+        self.version = 0
+        self._events: deque = deque(maxlen=buffer)
+        self._cond = threading.Condition()
+        self._cache: Dict[Tuple, Tuple[int, float, bytes, str]] = {}
+
+    # ------------------------
+    # Publish / subscribe
+    # ------------------------
+
+    def publish(self, signals: List[Dict]):
+        """Called once per committed batch of saved signals (API-shaped dicts with ids)."""
+        if not signals:
+            return
+        with self._cond:
+            self._events.extend(signals)
+            self.version += 1
+            self._cache.clear()
+            self._cond.notify_all()
+
+    def last_id(self) -> int:
+        with self._cond:
+            return self._events[-1]["id"] if self._events else 0
+
+    def _since(self, after_id: int, match: Callable[[Dict], bool]) -> List[Dict]:
+        out = []
+        for ev in reversed(self._events):
+            if ev["id"] <= after_id:
+                break
+            if match(ev):
+                out.append(ev)
+        out.reverse()
+        return out
+
+    def wait(self, after_id: int, timeout: float, symbol: Optional[str] = None, timeframe: Optional[str] = None) -> List[Dict]:
+        """
+        Signals with id > after_id (optionally for one symbol/timeframe), oldest first.
+        Blocks up to `timeout` seconds when there are none yet; returns [] on timeout.
+        """
+        def match(ev):
+            return (symbol is None or ev["symbol"] == symbol) and (timeframe is None or ev["timeframe"] == timeframe)
+
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                found = self._since(after_id, match)
+                remaining = deadline - time.monotonic()
+                if found or remaining <= 0:
+                    return found
+                self._cond.wait(remaining)
+
+    # ------------------------
+    # Response cache
+    # ------------------------
+
+    def cached(self, key: Tuple, build: Callable[[], object]) -> Tuple[bytes, str]:
+        """
+        (JSON body, etag) for `key`; build() (a DB query) only runs when the feed changed since
+        the cached body was built or the entry is older than cache_ttl.
+        """
+        now = time.monotonic()
+        with self._cond:
+            hit = self._cache.get(key)
+            version = self.version
+        if hit and hit[0] == version and now - hit[1] < self.cache_ttl:
+            return hit[2], hit[3]
+        body = json.dumps(build()).encode()
+        etag = hashlib.sha1(body).hexdigest()
+        with self._cond:
+            if self.version == version:
+                self._cache[key] = (version, now, body, etag)
+        return body, etag
+
+
+FEED = SignalFeed()
@@ -0,0 +1,158 @@
+# path: backend/signal_sink.py
+"""
+Batched signal writes.
+
+insert_signals() writes many Signal records in one transaction with a single multi-row
+INSERT ... RETURNING (SQLAlchemy "insertmanyvalues": batched VALUES on SQLite, bulk insert on
+Postgres) and returns them in the API shape, ids included.
+
+Every committed batch is published on signal_feed.FEED (stream subscribers, API cache).
+
+SignalSink is the write-behind front: submit() only queues the record; a daemon thread drains
+the queue and flushes it with insert_signals() every SINK_FLUSH_SEC seconds or as soon as
+SINK_BATCH records are waiting. flush() blocks until everything queued so far is written.
+"""
+
+import atexit
+import os
+import queue
+import threading
+import traceback
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+
+from db import SessionLocal, Signal
+from metrics import METRICS, common
+from signal_feed import FEED
+
+SINK_FLUSH_SEC = float(os.getenv("SINK_FLUSH_SEC", "1.0"))
+SINK_BATCH = int(os.getenv("SINK_BATCH", "500"))
+
+
+def _float(value):
+    # SQLite RETURNING can hand back whole REAL values as int
+    return float(value) if value is not None else None
+
+
+def signal_dict(row) -> Dict:
+    """Signal row (ORM object or RETURNING row) in the shape the API returns."""
+    return {
+        "id": row.id,
+        "symbol": row.symbol,
+        "timeframe": row.timeframe,
+        "side": row.side,
+        "entry": _float(row.entry),
+        "stop_loss": _float(row.stop_loss),
+        "take_profit": _float(row.take_profit),
+        "rr": _float(row.rr),
+        "ml_label": row.ml_label,
+        "confidence": _float(row.confidence),
+        "reason": row.reason,
+        "smc_confirmed": row.smc_confirmed,
+        "created_at": row.created_at.isoformat()
+    }
+
+
+_RETURNING = [Signal.id, Signal.symbol, Signal.timeframe, Signal.side, Signal.entry, Signal.stop_loss,
+              Signal.take_profit, Signal.rr, Signal.ml_label, Signal.confidence, Signal.reason,
+              Signal.smc_confirmed, Signal.created_at]
+
+
+def insert_signals(records: List[Dict]) -> List[Dict]:
+    """Insert Signal records (column values) in one transaction; returns the saved signals in order."""
+    if not records:
+        return []
+    db = SessionLocal()
+    try:
+        with METRICS.stage("db_commit", common(r.get("symbol") for r in records), common(r.get("timeframe") for r in records)):
+            rows = db.execute(insert(Signal).returning(*_RETURNING, sort_by_parameter_order=True), records).all()
+            db.commit()
+        saved = [signal_dict(r) for r in rows]
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    # wake stream subscribers and drop cached API responses
+    FEED.publish(saved)
+    return saved
+
+
+class SignalSink:
+    def __init__(self, flush_sec: float = SINK_FLUSH_SEC, batch: int = SINK_BATCH):
+        self.flush_sec = flush_sec
+        self.batch = batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+
+    def _ensure_thread(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="signal-sink", daemon=True)
+                self._thread.start()
+
+    def submit(self, record: Dict):
+        """Queue one Signal record; returns immediately."""
+        self._ensure_thread()
+        self._queue.put(record)
+
+    def submit_many(self, records: List[Dict]):
+        for rec in records:
+            self.submit(rec)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far is written. False on timeout."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _write(self, records: List[Dict]):
+        try:
+            saved = insert_signals(records)
+            self.written += len(saved)
+            print(f"✅ Saved {len(saved)} signals to DB")
+        except Exception as e:
+            self.failed += len(records)
+            print("DB save error:", e)
+            traceback.print_exc()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            records, markers = [], []
+            # collect whatever arrives within flush_sec, up to `batch` records
+            while True:
+                if isinstance(item, threading.Event):
+                    markers.append(item)
+                    break
+                records.append(item)
+                if len(records) >= self.batch:
+                    break
+                try:
+                    item = self._queue.get(timeout=self.flush_sec)
+                except queue.Empty:
+                    break
+            if records:
+                self._write(records)
+            for m in markers:
+                m.set()
+
+
+_SINK: Optional[SignalSink] = None
+
+
+def get_sink() -> SignalSink:
+    global _SINK
+    if _SINK is None:
+        _SINK = SignalSink()
+        atexit.register(_SINK.flush, 10.0)
+    return _SINK
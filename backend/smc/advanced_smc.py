@@ -1,26 +1,23 @@
+import numpy as np
 import pandas as pd
-def detect_order_blocks(df, lookback=40):
-    obs = []
-    for i in range(2, min(len(df), lookback)):
-        cur = df.iloc[-i]
-        body = abs(cur['close'] - cur['open'])
-        rng = cur['high'] - cur['low'] if cur['high']!=cur['low'] else 1e-9
-        if body > 0.6 * rng and body > 0.0015 * cur['close']:
-            if cur['close'] < cur['open']:
-                obs.append({'type':'bearish','high':float(cur['high']),'low':float(cur['low']),'index':len(df)-i-1})
-            else:
-                obs.append({'type':'bullish','high':float(cur['high']),'low':float(cur['low']),'index':len(df)-i-1})
-    return obs
+from smc.arrays import ohlc_arrays
+from smc.fvg import find_fvgs, fvg_frame, FVG_BULL
+from smc.orderblock import ORDER_BLOCK_RULES, order_block_frame, OB_BULL
+# impulse order block body filters: body > BODY_RATIO * range and body > MIN_BODY_PCT * close
+BODY_RATIO = 0.6
+MIN_BODY_PCT = 0.0015
+def detect_order_blocks(df, lookback=40, body_ratio=BODY_RATIO, min_body_pct=MIN_BODY_PCT):
+    res = order_block_frame(df, rule='impulse', lookback=lookback, body_ratio=body_ratio, min_body_pct=min_body_pct)
+    return [
+        {'type':'bullish' if t == OB_BULL else 'bearish','high':float(h),'low':float(l),'index':int(i)-1}
+        for i, t, h, l in zip(res['index'], res['type'], res['high'], res['low'])
+    ]
 def detect_fvg(df):
-    fvg = []
-    for i in range(2, len(df)):
-        a = df.iloc[i-2]
-        c = df.iloc[i]
-        if c['low'] > a['high']:
-            fvg.append({'type':'bullish','from':float(a['high']),'to':float(c['low']),'index':i})
-        if c['high'] < a['low']:
-            fvg.append({'type':'bearish','from':float(c['high']),'to':float(a['low']),'index':i})
-    return fvg
+    res = fvg_frame(df)
+    return [
+        {'type':'bullish' if t == FVG_BULL else 'bearish','from':float(lo),'to':float(hi),'index':int(i)}
+        for i, t, lo, hi in zip(res['index'], res['type'], res['low'], res['high'])
+    ]
 def detect_bos(df):
     # simple BOS: last close breaks previous swing high/low
     if len(df) < 6:
@@ -37,9 +34,9 @@ def detect_bos(df):
     if last['close'] < prev_low:
         return {'type':'bearish_bos','price':float(last['close'])}
     return None
-def evaluate_smc(df):
+def evaluate_smc(df, body_ratio=BODY_RATIO, min_body_pct=MIN_BODY_PCT):
     signals = []
-    obs = detect_order_blocks(df)
+    obs = detect_order_blocks(df, body_ratio=body_ratio, min_body_pct=min_body_pct)
     fvg = detect_fvg(df)
     bos = detect_bos(df)
     last = df.iloc[-1]
@@ -73,3 +70,62 @@ def evaluate_smc(df):
                 tp1 = entry - (sl-entry); tp2 = entry - (sl-entry)*2; tp3 = entry - (sl-entry)*3
                 signals.append({'symbol':df.attrs.get('symbol','BTC/USDT'),'timeframe':df.attrs.get('timeframe','1m'),'side':'sell','entry':entry,'stop_loss':sl,'take_profits':[tp1,tp2,tp3],'rr':round((entry-tp2)/(sl-entry) if sl-entry!=0 else 0,2),'confidence':0.53,'reason':'bearish_ob','ob':ob,'fvg':fvg})
     return signals
+def evaluate_smc_batch(df, lookback, start=None, stop=None, ob_lookback=40, block=65536, body_ratio=BODY_RATIO, min_body_pct=MIN_BODY_PCT):
+    """
+    evaluate_smc() for every sliding window df.iloc[t-lookback:t], t in [start, stop), in one pass.
+    Order blocks, BOS and FVGs are computed once over the whole frame; candidates come out as
+    columnar arrays ordered like the per-window calls (by t, then newest OB first):
+    t, ob_pos, side (1 buy / 0 sell), entry, stop_loss, tp1..tp3, ob_high, ob_low, confidence,
+    with_bos (reason *_with_bos), has_fvg (window had any FVG).
+    body_ratio / min_body_pct: the impulse OB body filters, as in evaluate_smc().
+    """
+    o, h, l, c = ohlc_arrays(df)
+    n = len(c)
+    start = lookback if start is None else max(int(start), lookback)
+    stop = n if stop is None else min(int(stop), n)
+    cols = ('t','ob_pos','side','entry','stop_loss','tp1','tp2','tp3','ob_high','ob_low','confidence','with_bos','has_fvg')
+    if stop <= start or lookback < 1:
+        return {k: np.empty(0) for k in cols}
+    # candidate OBs: the impulse rule over the whole frame, scanned at offsets 2..K-1 before t
+    bull_ob, bear_ob = ORDER_BLOCK_RULES['impulse'](o, h, l, c, body_ratio=body_ratio, min_body_pct=min_body_pct)[:2]
+    offsets = np.arange(2, min(lookback, ob_lookback))
+    # window BOS: last close vs max/min of the three highs/lows before it
+    hmax3 = pd.Series(h).rolling(3).max().to_numpy()
+    lmin3 = pd.Series(l).rolling(3).min().to_numpy()
+    # any (uncoloured) FVG with its third candle inside the window
+    gaps = np.zeros(n + 1, dtype=np.int64)
+    fv = find_fvgs(o, h, l, c)
+    np.add.at(gaps, fv['index'] + 1, 1)
+    gaps = np.cumsum(gaps)
+
+    out = {k: [] for k in cols}
+    for b0 in range(start, stop, block):
+        t = np.arange(b0, min(b0 + block, stop))
+        last = t - 1
+        q = t[:, None] - offsets[None, :]
+        bull = bull_ob[q] & (l[last][:, None] >= l[q]) & (l[last][:, None] <= h[q])
+        bear = bear_ob[q] & (h[last][:, None] <= h[q]) & (h[last][:, None] >= l[q])
+        ti, oi = np.nonzero(bull | bear)
+        if len(ti) == 0:
+            continue
+        tt = t[ti]
+        qq = q[ti, oi]
+        is_buy = bull[ti, oi]
+        entry = c[tt - 1]
+        ob_h, ob_l = h[qq], l[qq]
+        sl = np.where(is_buy, ob_l - 0.5*(ob_h-ob_l), ob_h + 0.5*(ob_h-ob_l))
+        risk = np.where(is_buy, entry - sl, sl - entry)
+        sign = np.where(is_buy, 1.0, -1.0)
+        if lookback >= 6:
+            prev_high = hmax3[tt - 2]
+            prev_low = lmin3[tt - 2]
+            with_bos = (entry > prev_high) | (entry < prev_low)
+        else:
+            with_bos = np.zeros(len(tt), dtype=bool)
+        out['t'].append(tt); out['ob_pos'].append(qq); out['side'].append(is_buy.astype(np.int64))
+        out['entry'].append(entry); out['stop_loss'].append(sl)
+        out['tp1'].append(entry + sign*risk); out['tp2'].append(entry + sign*risk*2); out['tp3'].append(entry + sign*risk*3)
+        out['ob_high'].append(ob_h); out['ob_low'].append(ob_l)
+        out['confidence'].append(np.where(with_bos, 0.68, 0.53)); out['with_bos'].append(with_bos)
+        out['has_fvg'].append(gaps[tt] - gaps[tt - lookback + 2] > 0)
+    return {k: (np.concatenate(v) if v else np.empty(0)) for k, v in out.items()}
@@ -2,19 +2,34 @@
 """
 SMC Analyzer utility:
 - extract_features(signal_df, candidate): create ML-friendly features for a candidate
-- persist_candidate_for_labeling(candidate_record): save candidate metadata to disk for later labeling
+- extract_features_batch(prices, candidates): the same features for a candidate table as one float32 matrix + metadata
+- persist_candidate_for_labeling(candidate_record): append candidate metadata to the journal for later labeling
+- gather_candidates(limit) / candidates_between(symbol, start, end): read it back
 """
 
 import os
 import json
 import math
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from numpy.lib.stride_tricks import sliding_window_view
+
+from smc.journal import CandidateJournal
 
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
 CANDIDATES_DIR = os.path.join(DATA_DIR, "candidates")
+JOURNAL_DIR = os.path.join(CANDIDATES_DIR, "journal")
 os.makedirs(CANDIDATES_DIR, exist_ok=True)
 
+_journal = None
+
+def get_journal() -> CandidateJournal:
+    global _journal
+    if _journal is None:
+        _journal = CandidateJournal(JOURNAL_DIR)
+    return _journal
+
 def _tf_to_minutes(tf: str):
     if not isinstance(tf, str):
         return 1
@@ -26,105 +41,174 @@ def _tf_to_minutes(tf: str):
         return int(tf.replace('d',''))*1440
     return 1
 
-def extract_features(df: pd.DataFrame, candidate: dict) -> dict:
+FEATURE_COLUMNS = ['close', 'open', 'high', 'low', 'volume', 'r1', 'ret_3', 'ret_5', 'ret_10', 'atr14', 'r_atr',
+                   'dist_to_ob_pct', 'ob_width_pct', 'ob_type', 'has_bos', 'has_fvg', 'heur_confidence', 'rr1', 'tf_min']
+INT_FEATURES = ('ob_type', 'has_bos', 'has_fvg', 'tf_min')
+
+def extract_features_batch(prices, candidates, lookback=None, symbol='BTC/USDT', timeframe='1m', created_at=None, dtype=np.float32):
     """
-    df: pandas DataFrame (window used to create candidate), LAST row is current
-    candidate: dict produced by advanced_smc.evaluate_smc (entry, stop_loss, take_profits, ob, fvg, bos, etc.)
-    returns: flat dict of numeric features + meta for model training / inference
+    Vectorized extract_features for many candidates over one price series.
+    prices: DataFrame / mapping with open, high, low, close, volume arrays
+    candidates: DataFrame / mapping of equal-length columns:
+        bar (required)   position in prices of the candidate's current (last) bar
+        side             'buy'/'sell' or bool (True = buy), default buy
+        entry, stop_loss default close / low of the bar
+        tp1              first take profit (else the first of take_profits, else entry)
+        take_profits     lists, only passed through to the metadata
+        ob_high, ob_low  order block bounds, NaN = no OB; ob_type (1/-1/0) defaults to the side
+        has_bos, has_fvg, confidence (default 0.5), symbol, timeframe, reason
+    lookback: bars in each candidate's window ending at `bar` (default: every bar up to it)
+    returns: (features (candidates, FEATURE_COLUMNS) array of dtype, metadata DataFrame)
     """
-    last = df.iloc[-1]
+    def col(key, default=None):
+        return np.asarray(candidates[key]) if key in candidates else default
+
+    o, h, l, c, v = (np.asarray(prices[k], dtype=np.float64) for k in ('open', 'high', 'low', 'close', 'volume'))
+    bar = col('bar').astype(np.int64)
+    m = len(bar)
+    avail = bar + 1 if lookback is None else np.minimum(bar + 1, lookback)
+    side = col('side', np.ones(m, dtype=bool))
+    is_buy = side == 'buy' if side.dtype.kind in 'OUS' else side.astype(bool)
+
     f = {}
-    # price/momentum
-    f['close'] = float(last['close'])
-    f['open']  = float(last['open'])
-    f['high']  = float(last['high'])
-    f['low']   = float(last['low'])
-    f['volume']= float(last['volume'])
-    f['r1']    = (f['close'] - f['open']) / (f['open'] + 1e-9)
+    f['close'], f['open'], f['high'], f['low'], f['volume'] = c[bar], o[bar], h[bar], l[bar], v[bar]
+    f['r1'] = (f['close'] - f['open']) / (f['open'] + 1e-9)
     # small returns over recent candles
-    for look in (3,5,10):
-        if len(df) > look:
-            f[f"ret_{look}"] = (float(last['close']) - float(df['close'].iloc[-look])) / (float(df['close'].iloc[-look]) + 1e-9)
-        else:
-            f[f"ret_{look}"] = 0.0
-    # volatility / atr proxy
-    rng = (df['high'] - df['low']).tail(14)
-    f['atr14'] = float(rng.mean()) if len(rng)>0 else (f['high'] - f['low'])
+    for look in (3, 5, 10):
+        ok = avail > look
+        ref = c[np.where(ok, bar - look + 1, bar)]
+        f[f"ret_{look}"] = np.where(ok, (f['close'] - ref) / (ref + 1e-9), 0.0)
+    # volatility / atr proxy: mean range of the last min(14, window) bars
+    k = np.minimum(avail, 14)
+    rng = h - l
+    f['atr14'] = np.empty(m)
+    for kk in np.unique(k):
+        sel = k == kk
+        f['atr14'][sel] = (sliding_window_view(rng, kk).sum(axis=1) / kk)[bar[sel] - kk + 1]
     f['r_atr'] = f['r1'] / (f['atr14'] + 1e-9)
     # OB info
-    if candidate.get('ob'):
-        ob = candidate['ob']
-        mid = (ob['high'] + ob['low']) / 2.0
-        f['dist_to_ob_pct'] = abs(f['close'] - mid) / (mid + 1e-9)
-        f['ob_width_pct'] = (ob['high'] - ob['low']) / (mid + 1e-9)
-        f['ob_type'] = 1 if ob.get('type') == 'bullish' else -1
-    else:
-        f['dist_to_ob_pct'] = 999.0
-        f['ob_width_pct'] = 0.0
-        f['ob_type'] = 0
-    # BOS / FVG
-    f['has_bos'] = 1 if candidate.get('bos') else 0
-    f['has_fvg'] = 1 if candidate.get('fvg') else 0
-    # confidence given by heuristic (if present)
-    f['heur_confidence'] = float(candidate.get('confidence', 0.5))
-    # risk/reward engineered
-    entry = float(candidate.get('entry', f['close']))
-    sl = float(candidate.get('stop_loss', f['low']))
-    # for sell logic sl might be > entry
-    if sl == 0:
-        f['rr1'] = 0.0
-    else:
-        if candidate.get('side', 'buy') == 'buy':
-            rr = (candidate.get('take_profits',[entry])[0] - entry) / (entry - sl + 1e-9) if (entry - sl) != 0 else 0.0
-        else:
-            rr = (entry - candidate.get('take_profits',[entry])[0]) / (sl - entry + 1e-9) if (sl - entry) != 0 else 0.0
-        f['rr1'] = float(rr)
+    ob_h = col('ob_high', np.full(m, np.nan)).astype(np.float64)
+    ob_l = col('ob_low', np.full(m, np.nan)).astype(np.float64)
+    has_ob = ~np.isnan(ob_h)
+    mid = (ob_h + ob_l) / 2.0
+    f['dist_to_ob_pct'] = np.where(has_ob, np.abs(f['close'] - mid) / (mid + 1e-9), 999.0)
+    f['ob_width_pct'] = np.where(has_ob, (ob_h - ob_l) / (mid + 1e-9), 0.0)
+    f['ob_type'] = col('ob_type', np.where(has_ob, np.where(is_buy, 1, -1), 0))
+    # BOS / FVG / heuristic confidence
+    f['has_bos'] = col('has_bos', np.zeros(m)).astype(np.int64)
+    f['has_fvg'] = col('has_fvg', np.zeros(m)).astype(np.int64)
+    f['heur_confidence'] = col('confidence', np.full(m, 0.5)).astype(np.float64)
+    # risk/reward engineered (for sell logic sl is above entry)
+    entry = col('entry', np.full(m, np.nan)).astype(np.float64)
+    entry = np.where(np.isnan(entry), f['close'], entry)
+    sl = col('stop_loss', np.full(m, np.nan)).astype(np.float64)
+    sl = np.where(np.isnan(sl), f['low'], sl)
+    # take_profits holds ragged lists: kept as given, never turned into an array
+    take_profits = candidates['take_profits'] if 'take_profits' in candidates else None
+    tp1 = col('tp1')
+    if tp1 is None:
+        tp1 = np.array([tp[0] if len(tp) else np.nan for tp in (take_profits if take_profits is not None else [[]] * m)], dtype=np.float64)
+    tp1 = np.where(np.isnan(tp1), entry, tp1)
+    risk = np.where(is_buy, entry - sl, sl - entry)
+    reward = np.where(is_buy, tp1 - entry, entry - tp1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rr1 = np.where(risk != 0, reward / (risk + 1e-9), 0.0)
+    f['rr1'] = np.where(sl == 0, 0.0, rr1)
     # timeframe numeric
-    f['tf_min'] = _tf_to_minutes(candidate.get('timeframe','1m'))
-    # meta
-    meta = {
-        'symbol': candidate.get('symbol', df.attrs.get('symbol','BTC/USDT')),
-        'timeframe': candidate.get('timeframe', df.attrs.get('timeframe','1m')),
-        'side': 1 if candidate.get('side','buy')=='buy' else 0,
-        'entry': float(candidate.get('entry', f['close'])),
-        'stop_loss': float(candidate.get('stop_loss', f['low'])),
-        'take_profits': candidate.get('take_profits', []),
-        'created_at': datetime.utcnow().isoformat() if 'datetime' not in globals() else datetime.now().isoformat(),
-        'reason': candidate.get('reason','')
+    tfs = col('timeframe')
+    if tfs is None:
+        f['tf_min'] = np.full(m, _tf_to_minutes(timeframe), dtype=np.int64)
+    else:
+        minutes = {tf: _tf_to_minutes(tf) for tf in set(tfs.tolist())}
+        f['tf_min'] = np.array([minutes[tf] for tf in tfs.tolist()], dtype=np.int64)
+
+    if take_profits is None:
+        levels = [col(f'tp{j}') for j in (1, 2, 3) if f'tp{j}' in candidates]
+        take_profits = [list(tp) for tp in zip(*(lv.tolist() for lv in levels))] if levels else [[] for _ in range(m)]
+    meta = pd.DataFrame({
+        'symbol': col('symbol', [symbol] * m),
+        'timeframe': tfs if tfs is not None else [timeframe] * m,
+        'side': is_buy.astype(np.int64),
+        'entry': entry,
+        'stop_loss': sl,
+        'take_profits': list(take_profits),
+        'created_at': [created_at or datetime.now().isoformat()] * m,
+        'reason': col('reason', [''] * m),
+    })
+    X = np.empty((m, len(FEATURE_COLUMNS)), dtype=dtype)
+    for i, name in enumerate(FEATURE_COLUMNS):
+        X[:, i] = f[name]
+    return X, meta
+
+def features_frame(X: np.ndarray, meta: pd.DataFrame) -> pd.DataFrame:
+    """extract_features_batch output as one frame: metadata then feature columns (flag / tf columns as int)"""
+    feats = pd.DataFrame(X, columns=FEATURE_COLUMNS).astype({k: np.int64 for k in INT_FEATURES})
+    return pd.concat([meta.reset_index(drop=True), feats], axis=1)
+
+def extract_features(df: pd.DataFrame, candidate: dict) -> dict:
+    """
+    df: pandas DataFrame (window used to create candidate), LAST row is current
+    candidate: dict produced by advanced_smc.evaluate_smc (entry, stop_loss, take_profits, ob, fvg, bos, etc.)
+    returns: flat dict of numeric features + meta for model training / inference
+    (single-candidate wrapper around extract_features_batch, for the live path)
+    """
+    last = df.iloc[-1]
+    ob = candidate.get('ob')
+    tps = candidate.get('take_profits', [])
+    table = {
+        'bar': [len(df) - 1],
+        'side': [candidate.get('side', 'buy') == 'buy'],
+        'entry': [float(candidate.get('entry', last['close']))],
+        'stop_loss': [float(candidate.get('stop_loss', last['low']))],
+        'tp1': [float(tps[0]) if len(tps) else np.nan],
+        'ob_high': [float(ob['high']) if ob else np.nan],
+        'ob_low': [float(ob['low']) if ob else np.nan],
+        'ob_type': [(1 if ob.get('type') == 'bullish' else -1) if ob else 0],
+        'has_bos': [1 if candidate.get('bos') else 0],
+        'has_fvg': [1 if candidate.get('fvg') else 0],
+        'confidence': [float(candidate.get('confidence', 0.5))],
+        # tf_min only looks at the candidate's own timeframe
+        'timeframe': [candidate.get('timeframe', '1m')],
     }
-    # combine
-    combined = {**meta, **f}
-    # ensure all values are JSON serializable
-    for k,v in combined.items():
-        if isinstance(v, (pd.Timestamp,)):
-            combined[k] = str(v)
-        if isinstance(v, (float, int, str, list)):
-            continue
-        # fallback stringify
-        if v is None:
-            combined[k] = None
-        else:
-            try:
-                combined[k] = float(v)
-            except Exception:
-                combined[k] = str(v)
+    X, meta = extract_features_batch(df, table, dtype=np.float64)
+    combined = {
+        'symbol': candidate.get('symbol', df.attrs.get('symbol', 'BTC/USDT')),
+        'timeframe': candidate.get('timeframe', df.attrs.get('timeframe', '1m')),
+        'side': int(meta['side'].iat[0]),
+        'entry': float(meta['entry'].iat[0]),
+        'stop_loss': float(meta['stop_loss'].iat[0]),
+        'take_profits': tps,
+        'created_at': meta['created_at'].iat[0],
+        'reason': candidate.get('reason', ''),
+    }
+    for i, name in enumerate(FEATURE_COLUMNS):
+        combined[name] = int(X[0, i]) if name in INT_FEATURES else float(X[0, i])
     return combined
 
 def persist_candidate_for_labeling(feature_record: dict):
     """
-    Save candidate features/metadata to disk so labeler/trainer can pick it up later.
-    Each candidate saved as JSON file with timestamped name.
+    Save candidate features/metadata so labeler/trainer can pick it up later.
+    Appended to the candidate journal (data/candidates/journal); returns '<segment>#<line>'.
+    """
+    return get_journal().append(feature_record)
+
+def gather_candidates(limit=1000):
+    """
+    Newest `limit` candidates from the journal, oldest first (for manual review / labeling pipeline)
+    """
+    journal = get_journal()
+    return journal.last(limit or journal.count())
+
+def candidates_between(symbol=None, start=None, end=None):
+    """
+    Journal candidates for `symbol` (any when None) recorded between start and end (inclusive)
     """
-    ts = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
-    fn = f"candidate_{feature_record.get('symbol','X')}_{ts}.json"
-    path = os.path.join(CANDIDATES_DIR, fn)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(feature_record, f, indent=2)
-    return path
+    return get_journal().query(symbol, start, end)
 
 def gather_candidates_files(limit=1000):
     """
-    Return list of saved candidate JSONs (for manual review / labeling pipeline)
+    Return list of legacy one-file-per-candidate JSONs not migrated yet
+    (python scripts/migrate_candidates.py moves them into the journal)
     """
     files = sorted([os.path.join(CANDIDATES_DIR, p) for p in os.listdir(CANDIDATES_DIR) if p.endswith('.json')])
     if limit:
@@ -0,0 +1,11 @@
+import numpy as np
+import pandas as pd
+from typing import Tuple
+
+
+def ohlc_arrays(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return (open, high, low, close) as contiguous float64 arrays (positional, index ignored).
+    The detectors work on these so a frame is converted once instead of once per row.
+    """
+    return tuple(np.ascontiguousarray(df[c].to_numpy(dtype=np.float64)) for c in ("open", "high", "low", "close"))
@@ -1,30 +1,62 @@
+import numpy as np
 import pandas as pd
+from typing import Dict, Optional
+
+from smc.arrays import ohlc_arrays
+
+FVG_BULL = 1
+FVG_BEAR = -1
+
+
+def find_fvgs(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+              require_color: bool = False, start: int = 2, stop: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """
+    Vectorized 3-candle Fair Value Gap engine.
+    Candle j is compared with candle j-2 for every j in [start, stop) using shifted arrays.
+    - bullish: low[j] > high[j-2]   (gap = high[j-2] .. low[j])
+    - bearish: high[j] < low[j-2]   (gap = high[j] .. low[j-2])
+    require_color additionally asks for a bearish->bullish (or bullish->bearish) candle pair.
+    Returns columnar arrays sorted by bar, bullish before bearish on the same bar:
+    {"index": third candle position, "type": FVG_BULL/FVG_BEAR, "low": gap bottom, "high": gap top}
+    """
+    n = len(close)
+    start = max(int(start), 2)
+    stop = n if stop is None else min(int(stop), n)
+    if stop <= start:
+        empty = np.empty(0, dtype=np.float64)
+        return {"index": np.empty(0, dtype=np.int64), "type": np.empty(0, dtype=np.int8), "low": empty, "high": empty}
+
+    a = slice(start - 2, stop - 2)
+    c = slice(start, stop)
+    bull = low[c] > high[a]
+    bear = high[c] < low[a]
+    if require_color:
+        bull &= (close[a] < open_[a]) & (close[c] > open_[c])
+        bear &= (close[a] > open_[a]) & (close[c] < open_[c])
+
+    bull_pos = np.flatnonzero(bull)
+    bear_pos = np.flatnonzero(bear)
+    pos = np.concatenate([bull_pos, bear_pos])
+    kind = np.concatenate([np.full(len(bull_pos), FVG_BULL, dtype=np.int8), np.full(len(bear_pos), FVG_BEAR, dtype=np.int8)])
+    lo = np.concatenate([high[a][bull_pos], high[c][bear_pos]])
+    hi = np.concatenate([low[c][bull_pos], low[a][bear_pos]])
+    order = np.argsort(pos * 2 + (kind == FVG_BEAR), kind="stable")
+    return {"index": pos[order] + start, "type": kind[order], "low": lo[order], "high": hi[order]}
+
+
+def fvg_frame(df: pd.DataFrame, require_color: bool = False, start: int = 2, stop: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """find_fvgs() on a OHLC dataframe."""
+    o, h, l, c = ohlc_arrays(df)
+    return find_fvgs(o, h, l, c, require_color=require_color, start=start, stop=stop)
+
 
 def detect_fvg(df: pd.DataFrame, lookback=50):
     """
     Detect Fair Value Gaps (FVGs) in OHLC data.
     df must have ['open','high','low','close']
     """
-    fvg_list = []
-    for i in range(2, len(df)):
-        prev_low = df.iloc[i-2]['low']
-        prev_high = df.iloc[i-2]['high']
-        cur_low = df.iloc[i]['low']
-        cur_high = df.iloc[i]['high']
-
-        # Bullish FVG
-        if prev_high < cur_low:
-            fvg_list.append({
-                "index": i,
-                "type": "bullish",
-                "gap": (prev_high, cur_low)
-            })
-
-        # Bearish FVG
-        if prev_low > cur_high:
-            fvg_list.append({
-                "index": i,
-                "type": "bearish",
-                "gap": (cur_high, prev_low)
-            })
-    return fvg_list
+    res = fvg_frame(df)
+    return [
+        {"index": int(i), "type": "bullish" if t == FVG_BULL else "bearish", "gap": (float(lo), float(hi))}
+        for i, t, lo, hi in zip(res["index"], res["type"], res["low"], res["high"])
+    ]
@@ -0,0 +1,257 @@
+"""
+Append-only candidate journal (data/candidates/journal/).
+
+Candidates are appended as one JSON line each to the active segment (seg-000001.jsonl, ...).
+A segment is closed and a new one started once it reaches JOURNAL_SEGMENT_MB or is older than
+JOURNAL_SEGMENT_HOURS. index.json keeps, per segment, the record count, the first/last
+record time and the symbols it holds, so
+- last(n) reads only the newest segment(s), and only their tail
+- query(symbol, start, end) opens only the segments whose time range and symbols match
+
+Lines are {"ts": <record time, ISO>, "symbol": ..., "record": {...}}; readers get the records.
+The index is rewritten on rotation and every INDEX_EVERY appends; on open the active segment
+is rescanned, so appends after the last index write are never lost. One writer process per
+journal directory (threads are fine).
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+SEGMENT_MB = float(os.getenv("JOURNAL_SEGMENT_MB", "64"))
+SEGMENT_HOURS = float(os.getenv("JOURNAL_SEGMENT_HOURS", "24"))
+INDEX_EVERY = 100
+
+
+def _iso(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return datetime.fromisoformat(str(value)).isoformat()
+
+
+def _stamp(value) -> Optional[str]:
+    """_iso(value), or None when value is missing or not an ISO time."""
+    try:
+        return _iso(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _tail_lines(path: str, n: int, block: int = 1 << 16) -> List[bytes]:
+    """Last n lines of a file, read backwards from the end."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = [l for l in data.split(b"\n") if l]
+    return lines[-n:] if n else []
+
+
+class CandidateJournal:
+    def __init__(self, root: str, segment_mb: float = SEGMENT_MB, segment_hours: float = SEGMENT_HOURS):
+        self.root = root
+        self.segment_bytes = int(segment_mb * 2**20)
+        self.segment_sec = segment_hours * 3600
+        self.index_path = os.path.join(root, "index.json")
+        self._lock = threading.RLock()
+        self._unindexed = 0
+        os.makedirs(root, exist_ok=True)
+        self.segments: List[Dict] = self._load_index()
+        if self.segments:
+            # appends made after the last index write
+            self.segments[-1].update(self._scan(self.segments[-1]["file"]))
+
+    # ------------------------
+    # Index
+    # ------------------------
+
+    def _load_index(self) -> List[Dict]:
+        try:
+            with open(self.index_path) as f:
+                segments = json.load(f)["segments"]
+        except (OSError, ValueError, KeyError):
+            segments = []
+        known = {s["file"] for s in segments}
+        # segments the index never saw (crash right after a rotation)
+        for name in sorted(os.listdir(self.root)):
+            if name.startswith("seg-") and name.endswith(".jsonl") and name not in known:
+                seg = {"file": name, "created": time.time()}
+                seg.update(self._scan(name))
+                segments.append(seg)
+        return sorted(segments, key=lambda s: s["file"])
+
+    def _scan(self, name: str) -> Dict:
+        count, t_min, t_max, symbols = 0, None, None, {}
+        path = os.path.join(self.root, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        continue        # torn last line
+                    count += 1
+                    ts, sym = row.get("ts"), row.get("symbol")
+                    if ts:
+                        t_min = ts if t_min is None or ts < t_min else t_min
+                        t_max = ts if t_max is None or ts > t_max else t_max
+                    symbols[sym] = symbols.get(sym, 0) + 1
+        return {"count": count, "t_min": t_min, "t_max": t_max, "symbols": symbols,
+                "bytes": os.path.getsize(path) if os.path.exists(path) else 0}
+
+    def write_index(self):
+        with self._lock:
+            tmp = self.index_path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"segments": self.segments}, f)
+            os.replace(tmp, self.index_path)
+            self._unindexed = 0
+
+    # ------------------------
+    # Append
+    # ------------------------
+
+    def _active(self) -> Dict:
+        seg = self.segments[-1] if self.segments else None
+        if seg is None or seg["bytes"] >= self.segment_bytes or time.time() - seg["created"] >= self.segment_sec:
+            number = int(seg["file"][4:10]) + 1 if seg else 1
+            seg = {"file": f"seg-{number:06d}.jsonl", "created": time.time(), "count": 0,
+                   "t_min": None, "t_max": None, "symbols": {}, "bytes": 0}
+            self.segments.append(seg)
+            self.write_index()
+        return seg
+
+    def append_many(self, records: Iterable[Dict], ts: Optional[Iterable] = None) -> int:
+        """
+        Append records; ts gives each record's time (default: its 'created_at', else now; times
+        that are not ISO fall through to the next choice).
+        Returns the number appended.
+        """
+        records = list(records)
+        stamps = list(ts) if ts is not None else [None] * len(records)
+        with self._lock:
+            written = 0
+            while written < len(records):
+                seg = self._active()
+                lines = []
+                size = seg["bytes"]
+                # fill the active segment, then rotate
+                for rec, stamp in zip(records[written:], stamps[written:]):
+                    stamp = _stamp(stamp) or _stamp(rec.get("created_at")) or datetime.utcnow().isoformat()
+                    sym = rec.get("symbol")
+                    line = (json.dumps({"ts": stamp, "symbol": sym, "record": rec}) + "\n").encode()
+                    lines.append(line)
+                    size += len(line)
+                    seg["count"] += 1
+                    seg["t_min"] = stamp if seg["t_min"] is None or stamp < seg["t_min"] else seg["t_min"]
+                    seg["t_max"] = stamp if seg["t_max"] is None or stamp > seg["t_max"] else seg["t_max"]
+                    seg["symbols"][sym] = seg["symbols"].get(sym, 0) + 1
+                    if size >= self.segment_bytes:
+                        break
+                with open(os.path.join(self.root, seg["file"]), "ab") as f:
+                    f.write(b"".join(lines))
+                seg["bytes"] = size
+                written += len(lines)
+                self._unindexed += len(lines)
+            if self._unindexed >= INDEX_EVERY:
+                self.write_index()
+        return written
+
+    def append(self, record: Dict, ts=None) -> str:
+        """Append one record; returns its location '<segment>#<line>'."""
+        with self._lock:
+            self.append_many([record], None if ts is None else [ts])
+            seg = self.segments[-1]
+            return f"{os.path.join(self.root, seg['file'])}#{seg['count']}"
+
+    # ------------------------
+    # Read
+    # ------------------------
+
+    def count(self) -> int:
+        return sum(s["count"] for s in self.segments)
+
+    def last(self, n: int = 1000) -> List[Dict]:
+        """The newest n records, oldest first."""
+        with self._lock:
+            segments = [dict(s) for s in self.segments]
+        out: List[bytes] = []
+        for seg in reversed(segments):
+            need = n - len(out)
+            if need <= 0:
+                break
+            if seg["count"]:
+                out = _tail_lines(os.path.join(self.root, seg["file"]), min(need, seg["count"])) + out
+        return [json.loads(l)["record"] for l in out]
+
+    def query(self, symbol: Optional[str] = None, start=None, end=None) -> List[Dict]:
+        """Records for `symbol` (any when None) with start <= time <= end, oldest first."""
+        start, end = _iso(start), _iso(end)
+        with self._lock:
+            segments = [dict(s) for s in self.segments]
+        out = []
+        for seg in segments:
+            if not seg["count"] or (symbol is not None and symbol not in seg["symbols"]):
+                continue
+            if (start and seg["t_max"] and seg["t_max"] < start) or (end and seg["t_min"] and seg["t_min"] > end):
+                continue
+            with open(os.path.join(self.root, seg["file"]), "rb") as f:
+                for line in f:
+                    row = json.loads(line)
+                    if symbol is not None and row["symbol"] != symbol:
+                        continue
+                    if (start and row["ts"] < start) or (end and row["ts"] > end):
+                        continue
+                    out.append(row["record"])
+        return out
+
+
+def migrate_directory(src: str, journal: CandidateJournal, remove: bool = False, batch: int = 5000) -> int:
+    """
+    One-shot import of the legacy one-JSON-file-per-candidate directory into the journal, in
+    creation order (the timestamp suffix of the file name). The record time is its created_at, else the timestamp in
+    the file name. remove=True deletes each file once its batch is in the journal; files that
+    cannot be read or parsed are skipped and always left in place.
+    Returns the number of records migrated.
+    """
+    # candidate_<symbol>_<%Y%m%dT%H%M%S%f>.json
+    names = sorted((p for p in os.listdir(src) if p.startswith("candidate_") and p.endswith(".json")),
+                   key=lambda p: (p[:-5].rsplit("_", 1)[1], p))
+    moved = 0
+    for b in range(0, len(names), batch):
+        chunk = names[b:b + batch]
+        records, stamps, loaded = [], [], []
+        for name in chunk:
+            try:
+                with open(os.path.join(src, name), encoding="utf-8") as f:
+                    rec = json.load(f)
+            except (OSError, ValueError) as e:
+                print("skipping", name, e)
+                continue
+            if not isinstance(rec, dict):
+                print("skipping", name, "not a candidate record")
+                continue
+            records.append(rec)
+            loaded.append(name)
+            try:
+                named = datetime.strptime(name[:-5].rsplit("_", 1)[1], "%Y%m%dT%H%M%S%f")
+            except ValueError:
+                named = None
+            stamps.append(_stamp(rec.get("created_at")) or named)
+        moved += journal.append_many(records, stamps)
+        if remove:
+            # only what is now in the journal
+            for name in loaded:
+                os.remove(os.path.join(src, name))
+    journal.write_index()
+    return moved
@@ -0,0 +1,81 @@
+import bisect
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+
+
+class LevelSet:
+    """
+    Insertion-ordered set of price levels.
+    Exact levels are de-duplicated through a dict (O(1)); with rel_tolerance > 0 a level that lies
+    within rel_tolerance * level of an already stored one is merged into it (sorted list + bisect).
+    """
+
+    def __init__(self, rel_tolerance: float = 0.0):
+        self.rel_tolerance = float(rel_tolerance)
+        self._levels: Dict[float, None] = {}
+        self._sorted: List[float] = []
+
+    def _near(self, level: float) -> bool:
+        tol = abs(level) * self.rel_tolerance
+        pos = bisect.bisect_left(self._sorted, level - tol)
+        return pos < len(self._sorted) and self._sorted[pos] <= level + tol
+
+    def add(self, level: float) -> bool:
+        """Add a level; returns False when it was merged into an existing one."""
+        if level in self._levels:
+            return False
+        if self.rel_tolerance > 0 and self._near(level):
+            return False
+        self._levels[level] = None
+        bisect.insort(self._sorted, level)
+        return True
+
+    def levels(self) -> List[float]:
+        return list(self._levels)
+
+    def __contains__(self, level) -> bool:
+        return level in self._levels
+
+    def __len__(self) -> int:
+        return len(self._levels)
+
+
+def window_extremes(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Max and min of the trailing window values[i-window:i] for every i (NaN where i < 1).
+    pandas' rolling max/min keep a monotonic deque, so this is O(n) whatever the window.
+    """
+    s = pd.Series(values, dtype=np.float64)
+    roll = s.rolling(window, min_periods=1)
+    return roll.max().shift(1).to_numpy(), roll.min().shift(1).to_numpy()
+
+
+def find_liquidity_pools(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                         lookback: int = 20, threshold: float = 0.0005) -> Dict[str, np.ndarray]:
+    """
+    Bars i >= lookback whose previous `lookback` highs (lows) span at most close[i] * threshold.
+    Returns {"high_index", "high_level", "low_index", "low_level"} with unrounded levels
+    (window max of highs / window min of lows), in bar order.
+    """
+    n = len(close)
+    if n <= lookback:
+        empty_i = np.empty(0, dtype=np.int64)
+        empty_f = np.empty(0, dtype=np.float64)
+        return {"high_index": empty_i, "high_level": empty_f, "low_index": empty_i, "low_level": empty_f}
+    hmax, hmin = window_extremes(high, lookback)
+    lmax, lmin = window_extremes(low, lookback)
+    limit = close * threshold
+    hi_idx = np.flatnonzero(hmax[lookback:] - hmin[lookback:] <= limit[lookback:]) + lookback
+    lo_idx = np.flatnonzero(lmax[lookback:] - lmin[lookback:] <= limit[lookback:]) + lookback
+    return {"high_index": hi_idx, "high_level": hmax[hi_idx], "low_index": lo_idx, "low_level": lmin[lo_idx]}
+
+
+def pool_levels(levels: np.ndarray, precision: int = 5, rel_tolerance: float = 0.0) -> List[float]:
+    """Round levels to `precision` and de-duplicate them, keeping first-seen order."""
+    # collapse repeats of the same raw level before the per-level Python round()
+    uniq, first = np.unique(levels, return_index=True)
+    pools = LevelSet(rel_tolerance)
+    for raw in uniq[np.argsort(first, kind="stable")]:
+        pools.add(round(float(raw), precision))
+    return pools.levels()
@@ -1,5 +1,11 @@
+from collections import deque
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
 import pandas as pd
 
+from utils.timeframes import timeframe_ms
+
 def higher_tf_trend(df: pd.DataFrame, ema_period=200):
     """
     Detect higher timeframe trend using EMA.
@@ -9,3 +15,145 @@ def higher_tf_trend(df: pd.DataFrame, ema_period=200):
         return "bullish"
     else:
         return "bearish"
+
+
+# ------------------------
+# Incremental higher-timeframe aggregation
+# ------------------------
+
+class _HTFSeries:
+    """One higher timeframe: closed bars, the bar being built, and MA/trend as of the last close."""
+
+    def __init__(self, rule: str, history: int, fast: int, slow: int):
+        self.rule = rule
+        self.step = timeframe_ms(rule)
+        self.fast = fast
+        self.slow = slow
+        self.bars = deque(maxlen=history)          # closed (ts, open, high, low, close, volume)
+        self._closes = deque(maxlen=slow)
+        self.partial = None                        # [ts, open, high, low, close, volume]
+        self.ma_fast = float("nan")
+        self.ma_slow = float("nan")
+        self.trend = "neutral"
+
+    def _close_partial(self):
+        bar = tuple(self.partial)
+        self.partial = None
+        self.bars.append(bar)
+        self._closes.append(bar[4])
+        closes = list(self._closes)
+        self.ma_fast = sum(closes[-self.fast:]) / self.fast if len(closes) >= self.fast else float("nan")
+        self.ma_slow = sum(closes) / self.slow if len(closes) >= self.slow else float("nan")
+        self.trend = "bull" if self.ma_fast > self.ma_slow else ("bear" if self.ma_fast < self.ma_slow else "neutral")
+
+    def add(self, ts: int, o: float, h: float, l: float, c: float, v: float, base_step: int):
+        bucket = ts - ts % self.step
+        if self.partial is not None and self.partial[0] != bucket:
+            self._close_partial()
+        if self.partial is None:
+            self.partial = [bucket, o, h, l, c, v]
+        else:
+            p = self.partial
+            p[2] = max(p[2], h)
+            p[3] = min(p[3], l)
+            p[4] = c
+            p[5] += v
+        # the base bar that ends the bucket completes the HTF bar
+        if ts + base_step >= bucket + self.step:
+            self._close_partial()
+
+
+class HTFAggregator:
+    """
+    Rolls a base candle stream up into higher timeframes (default 15m / 1h / 4h), keeping up to
+    `history` closed bars per timeframe, i.e. far more HTF history than the base window holds.
+    Fast/slow close MAs and the resulting trend are updated when an HTF bar closes, so trend()
+    and confirm() are O(1) lookups.
+
+    Buckets are aligned to midnight UTC like DataFrame.resample. Base candles are fed in time
+    order; re-feeding the latest (still forming) base candle replaces it, and a base candle is
+    only rolled up once a newer one arrives, so forming bars are never double counted.
+    """
+
+    def __init__(self, base_timeframe: str = "5m", rules=("15m", "1h", "4h"), history: int = 1000,
+                 fast: int = 20, slow: int = 50):
+        self.base_step = timeframe_ms(base_timeframe)
+        self.series = {r: _HTFSeries(r, history, fast, slow) for r in rules}
+        self.last_ts: Optional[int] = None
+        self._pending = None
+
+    def update(self, ts: int, o: float, h: float, l: float, c: float, v: float = 0.0):
+        """Feed one base candle (ts in ms, bar open time)."""
+        if self.last_ts is not None and ts < self.last_ts:
+            return
+        if self._pending is not None and ts > self._pending[0]:
+            for s in self.series.values():
+                s.add(*self._pending, base_step=self.base_step)
+        self._pending = (int(ts), float(o), float(h), float(l), float(c), float(v))
+        self.last_ts = int(ts)
+
+    @staticmethod
+    def _frame_ms(df: pd.DataFrame) -> np.ndarray:
+        if isinstance(df.index, pd.DatetimeIndex):
+            stamps = df.index
+        elif "timestamp" in df.columns:
+            stamps = pd.DatetimeIndex(pd.to_datetime(df["timestamp"]))
+        else:
+            stamps = pd.DatetimeIndex(pd.to_datetime(df["ts"], unit="ms"))
+        return np.asarray((stamps - pd.Timestamp(0)) // pd.Timedelta(1, "ms"), dtype=np.int64)
+
+    def follows(self, df: pd.DataFrame) -> bool:
+        """True when df does not end before the last fed candle (it continues this stream)."""
+        return self.last_ts is None or (len(df) > 0 and int(self._frame_ms(df)[-1]) >= self.last_ts)
+
+    def sync(self, df: pd.DataFrame) -> int:
+        """Feed the rows of an OHLCV frame (DatetimeIndex, 'timestamp' or 'ts' column) from the last fed candle on."""
+        ts = self._frame_ms(df)
+        start = 0 if self.last_ts is None else int(np.searchsorted(ts, self.last_ts, side="left"))
+        vol = df["volume"].to_numpy() if "volume" in df.columns else np.zeros(len(df))
+        o, h, l, c = (df[k].to_numpy() for k in ("open", "high", "low", "close"))
+        for i in range(start, len(df)):
+            self.update(int(ts[i]), o[i], h[i], l[i], c[i], vol[i])
+        return len(df) - start
+
+    def seed_bars(self) -> int:
+        """Base candles needed for every timeframe's slow MA (one extra HTF bar for alignment)."""
+        return max(s.step * (s.slow + 1) for s in self.series.values()) // self.base_step
+
+    def trend(self, rule: str) -> str:
+        return self.series[rule].trend
+
+    def bars(self, rule: str) -> pd.DataFrame:
+        """Closed HTF bars as an OHLCV frame indexed by bucket start."""
+        rows = list(self.series[rule].bars)
+        out = pd.DataFrame(rows, columns=["ts", "open", "high", "low", "close", "volume"])
+        out.index = pd.to_datetime(out.pop("ts"), unit="ms")
+        return out
+
+    def confirm(self, rules=("15m", "1h")) -> bool:
+        """True when every rule has the same non-neutral trend."""
+        trends = {self.series[r].trend for r in rules}
+        return len(trends) == 1 and "neutral" not in trends
+
+
+_AGGREGATORS: Dict[Tuple[str, str], HTFAggregator] = {}
+
+
+def get_htf(symbol: str, timeframe: str, seed: Optional[Callable[[int], pd.DataFrame]] = None,
+            **kwargs) -> HTFAggregator:
+    """
+    Process-wide HTFAggregator for (symbol, base timeframe), created on first use.
+    seed(n) returns the last n closed base candles; a new aggregator is fed seed(seed_bars())
+    so its slow MAs are defined from the first call instead of after days of live bars.
+    """
+    key = (symbol, timeframe)
+    agg = _AGGREGATORS.get(key)
+    if agg is None:
+        agg = HTFAggregator(base_timeframe=timeframe, **kwargs)
+        if seed is not None:
+            try:
+                agg.sync(seed(agg.seed_bars()))
+            except Exception as e:
+                print("htf seed error:", symbol, timeframe, e)
+        _AGGREGATORS[key] = agg
+    return agg
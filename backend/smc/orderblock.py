@@ -1,24 +1,98 @@
+import numpy as np
 import pandas as pd
+from typing import Dict
+
+from smc.arrays import ohlc_arrays
+
+OB_BULL = 1
+OB_BEAR = -1
+
+
+# ------------------------
+# Rule sets
+# Each rule returns (bull_mask, bear_mask, start, stop, descending) where the masks are
+# evaluated over the full arrays and only positions in [start, stop) are reported.
+# ------------------------
+
+def _rule_color_flip(o, h, l, c, min_size: int = 3):
+    """Last candle of one colour before a candle of the opposite colour (smc.orderblock)."""
+    n = len(c)
+    bull = np.zeros(n, dtype=bool)
+    bear = np.zeros(n, dtype=bool)
+    up = c > o
+    down = c < o
+    bear[:-1] = up[:-1] & down[1:]
+    bull[:-1] = down[:-1] & up[1:]
+    return bull, bear, 0, min(n - min_size, n - 1), False
+
+
+def _rule_impulse(o, h, l, c, lookback: int = 40, body_ratio: float = 0.6, min_body_pct: float = 0.0015):
+    """Large-bodied candle (body/range and body/price) among the last `lookback` bars (smc.advanced_smc)."""
+    n = len(c)
+    body = np.abs(c - o)
+    rng = np.where(h != l, h - l, 1e-9)
+    strong = (body > body_ratio * rng) & (body > min_body_pct * c)
+    bear = strong & (c < o)
+    bull = strong & ~(c < o)
+    # scanned newest first, skipping the last bar
+    return bull, bear, n - min(n, lookback) + 1, n - 1, True
+
+
+def _rule_three_candle(o, h, l, c, lookback: int = 200):
+    """Opposite candle followed by two candles in the move direction (smc_filters)."""
+    n = len(c)
+    bull = np.zeros(n, dtype=bool)
+    bear = np.zeros(n, dtype=bool)
+    up = c > o
+    down = c < o
+    if n >= 3:
+        bull[:-2] = down[:-2] & up[1:-1] & up[2:]
+        bear[:-2] = up[:-2] & down[1:-1] & down[2:]
+    return bull, bear, 1, min(n - 2, lookback) - 1, False
+
+
+ORDER_BLOCK_RULES = {
+    "color_flip": _rule_color_flip,
+    "impulse": _rule_impulse,
+    "three_candle": _rule_three_candle,
+}
+
+
+def find_order_blocks(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray,
+                      rule: str = "three_candle", **params) -> Dict[str, np.ndarray]:
+    """
+    Evaluate an order block rule set (see ORDER_BLOCK_RULES) as boolean masks over the OHLC arrays.
+    Returns columnar arrays in the rule's scan order:
+    {"index": OB candle position, "type": OB_BULL/OB_BEAR, "open", "high", "low"}
+    """
+    if rule not in ORDER_BLOCK_RULES:
+        raise ValueError(f"Unknown order block rule: {rule}")
+    bull, bear, start, stop, descending = ORDER_BLOCK_RULES[rule](open_, high, low, close, **params)
+    start = max(int(start), 0)
+    stop = min(int(stop), len(close))
+    if stop <= start:
+        empty = np.empty(0, dtype=np.float64)
+        return {"index": np.empty(0, dtype=np.int64), "type": np.empty(0, dtype=np.int8), "open": empty, "high": empty, "low": empty}
+    hit = bull[start:stop] | bear[start:stop]
+    pos = np.flatnonzero(hit) + start
+    if descending:
+        pos = pos[::-1]
+    kind = np.where(bull[pos], OB_BULL, OB_BEAR).astype(np.int8)
+    return {"index": pos, "type": kind, "open": open_[pos], "high": high[pos], "low": low[pos]}
+
+
+def order_block_frame(df: pd.DataFrame, rule: str = "three_candle", **params) -> Dict[str, np.ndarray]:
+    """find_order_blocks() on a OHLC dataframe."""
+    o, h, l, c = ohlc_arrays(df)
+    return find_order_blocks(o, h, l, c, rule=rule, **params)
+
 
 def detect_order_blocks(df: pd.DataFrame, min_size=3):
     """
     Detect simple bullish/bearish order blocks.
     """
-    obs = []
-    for i in range(len(df)-min_size):
-        # Bearish OB = last bullish candle before strong drop
-        if df.iloc[i]['close'] > df.iloc[i]['open'] and df.iloc[i+1]['close'] < df.iloc[i+1]['open']:
-            obs.append({
-                "index": i,
-                "type": "bearish",
-                "price": df.iloc[i]['open']
-            })
-
-        # Bullish OB = last bearish candle before strong rally
-        if df.iloc[i]['close'] < df.iloc[i]['open'] and df.iloc[i+1]['close'] > df.iloc[i+1]['open']:
-            obs.append({
-                "index": i,
-                "type": "bullish",
-                "price": df.iloc[i]['open']
-            })
-    return obs
+    res = order_block_frame(df, rule="color_flip", min_size=min_size)
+    return [
+        {"index": int(i), "type": "bullish" if t == OB_BULL else "bearish", "price": float(p)}
+        for i, t, p in zip(res["index"], res["type"], res["open"])
+    ]
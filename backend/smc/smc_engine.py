@@ -72,3 +72,78 @@ def generate_signal(df: pd.DataFrame) -> Dict:
             "take_profits": [],
             "error": str(e),
         }
+
+
+_NONE_ROW = ("none", None, None, [])
+
+
+def signal_indicators(df: pd.DataFrame, atr_window: int = 14, ema_window: int = 200):
+    """(ATR, EMA) arrays generate_signal() reads, over the whole frame. Both are recursive, so
+    they are computed in one serial pass; everything else in the signal only looks one bar back."""
+    atr = AverageTrueRange(high=df["high"], low=df["low"], close=df["close"], window=atr_window).average_true_range().to_numpy()
+    ema = EMAIndicator(close=df["close"], window=ema_window).ema_indicator().to_numpy()
+    return atr, ema
+
+
+def breakout_columns(close: np.ndarray, high: np.ndarray, low: np.ndarray, atr: np.ndarray, ema: np.ndarray):
+    """
+    Per-bar generate_signal() rules as arrays: (buy, sell, filtered, sl, tp).
+    filtered marks breakouts dropped by the EMA200 side or the 150-point TP check.
+    Position 0 has no previous bar and is never a breakout.
+    """
+    prev_high = np.r_[np.nan, high[:-1]]
+    prev_low = np.r_[np.nan, low[:-1]]
+    buy = close > prev_high
+    sell = ~buy & (close < prev_low)
+    # EMA filter: price must be above (buy) / below (sell) EMA200
+    filtered = (buy & (close < ema)) | (sell & (close > ema))
+    sl = np.where(buy, close - atr, close + atr)
+    tp = np.where(buy, close + 2 * atr, close - 2 * atr)
+    # skip if TP < 150 points
+    filtered |= (buy | sell) & (np.abs(tp - close) < 150)
+    return buy, sell, filtered, sl, tp
+
+
+def generate_signals_series(df: pd.DataFrame, atr_window: int = 14, ema_window: int = 200) -> pd.DataFrame:
+    """
+    generate_signal() for every prefix df.iloc[:i+1] in one pass.
+    ATR and EMA200 are causal, so they are computed once over the whole frame; the breakout,
+    EMA filter and 150-point TP checks are evaluated as columns.
+    Returns an object-dtype frame indexed like df with columns signal, entry, stop_loss,
+    take_profits, error holding exactly the values generate_signal() would return (None kept).
+    """
+    cols = ["signal", "entry", "stop_loss", "take_profits", "error"]
+    n = len(df)
+    # prefixes too short for the indicators go through the per-bar function (they error out there)
+    head = min(n, max(atr_window, 2))
+    rows = []
+    for i in range(head):
+        sig = generate_signal(df.iloc[: i + 1].copy())
+        rows.append((sig["signal"], sig["entry"], sig["stop_loss"], sig["take_profits"], sig.get("error")))
+    if n > head and any(c not in df.columns for c in ("open", "high", "low", "close")):
+        # every prefix fails the same column check
+        rows += [rows[-1]] * (n - head)
+    if n <= head or len(rows) == n:
+        return pd.DataFrame(rows, columns=cols, index=df.index, dtype=object)
+
+    close = df["close"].to_numpy()
+    high = df["high"].to_numpy()
+    low = df["low"].to_numpy()
+    atr, ema = signal_indicators(df, atr_window, ema_window)
+    buy, sell, filtered, sl, tp = breakout_columns(close, high, low, atr, ema)
+
+    entry_r = np.round(close, 2)
+    sl_r = np.round(sl, 2)
+    tp_r = np.round(tp, 2)
+    for i in range(head, n):
+        if filtered[i]:
+            rows.append(_NONE_ROW + (None,))
+        elif buy[i] or sell[i]:
+            rows.append(("buy" if buy[i] else "sell",
+                         float(entry_r[i]) if close[i] else None,
+                         float(sl_r[i]) if sl[i] else None,
+                         [float(tp_r[i])] if tp[i] else [],
+                         None))
+        else:
+            rows.append(("none", float(entry_r[i]) if close[i] else None, None, [], None))
+    return pd.DataFrame(rows, columns=cols, index=df.index, dtype=object)
@@ -0,0 +1,401 @@
+"""
+Incremental SMC state for a live (symbol, timeframe) stream.
+
+SMCState.update(candle) is fed one closed candle at a time and keeps the detector results of
+smc_filters current in amortized O(1) per bar:
+- three-candle order blocks, colour-confirmed FVGs, BOS, liquidity pools,
+  mitigation / breaker blocks and premium / discount zone over the last `window` bars
+- open (not yet invalidated) order blocks and unfilled FVGs
+- the last confirmed swing high / swing low
+snapshot() returns the same values smc_filters' batch functions return for a frame holding the
+same last `window` candles, so run_smc_confluence can use it instead of re-running the detectors.
+
+Opt-in: predict_signal.smc_confluence passes run_smc_confluence(..., state=get_state(symbol,
+timeframe)) with closed candles only; a bar is never revised once applied, so a still-forming
+last bar would be frozen at its first value. get_state() keeps at most SMC_STATE_MAX states
+(least recently used dropped first); callers hold state.lock around sync() + snapshot().
+"""
+
+import heapq
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from smc.liquidity import pool_levels
+
+
+class _MonotonicWindow:
+    """Sliding max (or min) over bar positions; each bar is pushed and popped at most once."""
+
+    def __init__(self, mode: str = "max"):
+        self._dq = deque()
+        self._max = mode == "max"
+
+    def push(self, pos: int, value: float):
+        dq = self._dq
+        if self._max:
+            while dq and dq[-1][1] <= value:
+                dq.pop()
+        else:
+            while dq and dq[-1][1] >= value:
+                dq.pop()
+        dq.append((pos, value))
+
+    def evict(self, min_pos: int):
+        dq = self._dq
+        while dq and dq[0][0] < min_pos:
+            dq.popleft()
+
+    def value(self) -> Optional[float]:
+        return self._dq[0][1] if self._dq else None
+
+
+class SMCState:
+    """Streaming SMC detectors for one (symbol, timeframe). Positions in outputs are window-relative."""
+
+    def __init__(self, symbol: str = "BTC/USDT", timeframe: str = "5m", window: int = 500,
+                 ob_lookback: int = 200, fvg_lookback: int = 200, bos_lookback: int = 20,
+                 pool_lookback: int = 20, pool_threshold: float = 0.0005, pool_precision: int = 5,
+                 zone_lookback: int = 50, recent_candles: int = 5):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.window = int(window)
+        self.ob_lookback = ob_lookback
+        self.fvg_lookback = fvg_lookback
+        self.bos_lookback = bos_lookback
+        self.pool_lookback = pool_lookback
+        self.pool_threshold = pool_threshold
+        self.pool_precision = pool_precision
+        self.zone_lookback = zone_lookback
+        self.recent_candles = recent_candles
+        self.lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.count = 0            # bars seen since creation (absolute position of next bar)
+        self.last_ts = None
+        self._bars = deque(maxlen=self.window)   # (ts, open, high, low, close, volume)
+
+        # detector events keyed by absolute bar position, oldest first
+        self._obs = deque()        # (pos, "bull"/"bear", high, low)
+        self._fvgs = deque()       # (middle pos, "bull"/"bear", top, bottom)
+        self._pool_highs = deque() # (pos, raw level)
+        self._pool_lows = deque()
+        self._bos: List[Dict] = []
+
+        self._bos_high = _MonotonicWindow("max")
+        self._bos_low = _MonotonicWindow("min")
+        self._pool_hmax = _MonotonicWindow("max")
+        self._pool_hmin = _MonotonicWindow("min")
+        self._pool_lmax = _MonotonicWindow("max")
+        self._pool_lmin = _MonotonicWindow("min")
+        self._zone_high = _MonotonicWindow("max")
+        self._zone_low = _MonotonicWindow("min")
+
+        # open OBs / unfilled FVGs, heap-ordered by the price that invalidates them first
+        self._open_bull_obs = []   # (-low, pos, ob)   broken when close < low
+        self._open_bear_obs = []   # (high, pos, ob)   broken when close > high
+        self._open_bull_fvgs = []  # (-top, pos, fvg)  filled when low <= top
+        self._open_bear_fvgs = []  # (bottom, pos, fvg) filled when high >= bottom
+
+        self.swing_high: Optional[Dict] = None
+        self.swing_low: Optional[Dict] = None
+
+    # ------------------------
+    # Feeding
+    # ------------------------
+
+    @property
+    def start(self) -> int:
+        """Absolute position of the oldest bar in the window."""
+        return self.count - len(self._bars)
+
+    def __len__(self) -> int:
+        return len(self._bars)
+
+    def update(self, candle) -> bool:
+        """
+        Apply one closed candle: a dict with open/high/low/close[/volume, ts|timestamp] or a
+        (ts, open, high, low, close, volume) tuple. Candles not newer than the last one are ignored.
+        """
+        if isinstance(candle, dict):
+            ts = candle.get("ts", candle.get("timestamp"))
+            bar = (ts, float(candle["open"]), float(candle["high"]), float(candle["low"]),
+                   float(candle["close"]), float(candle.get("volume", 0.0)))
+        else:
+            ts, o, h, l, c, v = candle
+            bar = (ts, float(o), float(h), float(l), float(c), float(v))
+        ts = bar[0]
+        if ts is not None and self.last_ts is not None and ts <= self.last_ts:
+            return False
+
+        pos = self.count
+        _, o, h, l, c, _ = bar
+        bars = self._bars
+
+        # detectors that look at the bars *before* this one
+        self._update_bos(pos, c)
+        self._update_pools(pos, c)
+
+        bars.append(bar)
+        self.count += 1
+        self.last_ts = ts
+
+        self._zone_high.push(pos, h)
+        self._zone_low.push(pos, l)
+        self._bos_high.push(pos, h)
+        self._bos_low.push(pos, l)
+        for w, v in ((self._pool_hmax, h), (self._pool_hmin, h), (self._pool_lmax, l), (self._pool_lmin, l)):
+            w.push(pos, v)
+
+        if len(bars) >= 3:
+            self._update_patterns(pos)
+        self._update_open_levels(h, l, c)
+        self._evict()
+        return True
+
+    def sync(self, df: pd.DataFrame) -> int:
+        """
+        Feed every row of an OHLCV frame newer than the last applied candle. Returns rows applied.
+        The frame needs bar times (DatetimeIndex, 'timestamp' or 'ts' in ms) to tell new rows
+        from ones already applied; ValueError otherwise. A frame that starts after the last
+        applied candle (bars in between never seen) replaces the state instead of extending it.
+        """
+        if isinstance(df.index, pd.DatetimeIndex):
+            ts = df.index
+        elif "timestamp" in df.columns:
+            ts = pd.to_datetime(df["timestamp"])
+        elif "ts" in df.columns:
+            ts = pd.to_datetime(df["ts"], unit="ms")
+        else:
+            raise ValueError("SMCState.sync needs a DatetimeIndex or a 'timestamp' / 'ts' column")
+        if self.last_ts is not None and len(ts) and ts[0] > self.last_ts:
+            self._clear()
+        vol = df["volume"].to_numpy() if "volume" in df.columns else np.zeros(len(df))
+        applied = 0
+        rows = zip(ts, df["open"].to_numpy(), df["high"].to_numpy(), df["low"].to_numpy(), df["close"].to_numpy(), vol)
+        for row in rows:
+            if self.last_ts is not None and row[0] <= self.last_ts:
+                continue
+            applied += self.update(row)
+        return applied
+
+    # ------------------------
+    # Incremental detectors
+    # ------------------------
+
+    def _update_bos(self, pos: int, close: float):
+        lb = self.bos_lookback
+        self._bos = []
+        self._bos_high.evict(pos - lb)
+        self._bos_low.evict(pos - lb)
+        # batch detect_bos needs lookback+1 bars in the window (this bar included)
+        if min(len(self._bars) + 1, self.window) < lb + 1:
+            return
+        prev_high = self._bos_high.value()
+        prev_low = self._bos_low.value()
+        if prev_high is not None and close > prev_high:
+            self._bos.append({"type": "bull", "level": float(prev_high), "abs": pos})
+        if prev_low is not None and close < prev_low:
+            self._bos.append({"type": "bear", "level": float(prev_low), "abs": pos})
+
+    def _update_pools(self, pos: int, close: float):
+        lb = self.pool_lookback
+        for w in (self._pool_hmax, self._pool_hmin, self._pool_lmax, self._pool_lmin):
+            w.evict(pos - lb)
+        if pos < lb:
+            return
+        limit = close * self.pool_threshold
+        hmax, hmin = self._pool_hmax.value(), self._pool_hmin.value()
+        lmax, lmin = self._pool_lmax.value(), self._pool_lmin.value()
+        if hmax is not None and hmax - hmin <= limit:
+            self._pool_highs.append((pos, hmax))
+        if lmax is not None and lmax - lmin <= limit:
+            self._pool_lows.append((pos, lmin))
+
+    def _update_patterns(self, pos: int):
+        bars = self._bars
+        _, o0, h0, l0, c0, _ = bars[-3]
+        _, o1, _, _, c1, _ = bars[-2]
+        _, o2, h2, l2, c2, _ = bars[-1]
+
+        # three-candle order block on bar pos-2
+        if c0 < o0 and c1 > o1 and c2 > o2:
+            ob = {"type": "bull", "high": h0, "low": l0, "abs": pos - 2}
+            self._obs.append((pos - 2, "bull", h0, l0))
+            heapq.heappush(self._open_bull_obs, (-l0, pos - 2, ob))
+        elif c0 > o0 and c1 < o1 and c2 < o2:
+            ob = {"type": "bear", "high": h0, "low": l0, "abs": pos - 2}
+            self._obs.append((pos - 2, "bear", h0, l0))
+            heapq.heappush(self._open_bear_obs, (h0, pos - 2, ob))
+
+        # colour-confirmed FVG with middle candle pos-1
+        if c0 < o0 and c2 > o2 and l2 > h0:
+            fvg = {"type": "bull", "top": h0, "bottom": l2, "abs": pos - 1}
+            self._fvgs.append((pos - 1, "bull", h0, l2))
+            heapq.heappush(self._open_bull_fvgs, (-h0, pos - 1, fvg))
+        if c0 > o0 and c2 < o2 and h2 < l0:
+            fvg = {"type": "bear", "top": h2, "bottom": l0, "abs": pos - 1}
+            self._fvgs.append((pos - 1, "bear", h2, l0))
+            heapq.heappush(self._open_bear_fvgs, (l0, pos - 1, fvg))
+
+        # 3-bar fractal swing on bar pos-1, confirmed by this bar
+        _, _, h1, l1, _, _ = bars[-2]
+        if h1 > h0 and h1 > h2:
+            self.swing_high = {"price": h1, "abs": pos - 1}
+        if l1 < l0 and l1 < l2:
+            self.swing_low = {"price": l1, "abs": pos - 1}
+
+    def _update_open_levels(self, high: float, low: float, close: float):
+        while self._open_bull_obs and -self._open_bull_obs[0][0] > close:
+            heapq.heappop(self._open_bull_obs)
+        while self._open_bear_obs and self._open_bear_obs[0][0] < close:
+            heapq.heappop(self._open_bear_obs)
+        while self._open_bull_fvgs and -self._open_bull_fvgs[0][0] >= low:
+            heapq.heappop(self._open_bull_fvgs)
+        while self._open_bear_fvgs and self._open_bear_fvgs[0][0] <= high:
+            heapq.heappop(self._open_bear_fvgs)
+
+    def _evict(self):
+        start = self.start
+        for events in (self._obs, self._fvgs, self._pool_highs, self._pool_lows):
+            while events and events[0][0] < start:
+                events.popleft()
+        self._zone_high.evict(self.count - min(len(self._bars), self.zone_lookback))
+        self._zone_low.evict(self.count - min(len(self._bars), self.zone_lookback))
+        # open levels that left the window are dropped lazily once the heaps outgrow it
+        for name in ("_open_bull_obs", "_open_bear_obs", "_open_bull_fvgs", "_open_bear_fvgs"):
+            heap = getattr(self, name)
+            if len(heap) > 2 * self.window:
+                heap = [item for item in heap if item[1] >= start]
+                heapq.heapify(heap)
+                setattr(self, name, heap)
+
+    # ------------------------
+    # Outputs (same shape as smc_filters)
+    # ------------------------
+
+    def order_blocks(self) -> List[Dict]:
+        start, n = self.start, len(self._bars)
+        stop = min(n - 2, self.ob_lookback) - 1
+        out = []
+        for pos, kind, h, l in self._obs:
+            rel = pos - start
+            if rel >= stop:
+                break
+            if rel >= 1:
+                out.append({"type": kind, "index": rel, "high": h, "low": l})
+        return out
+
+    def fvgs(self) -> List[Dict]:
+        start, n = self.start, len(self._bars)
+        stop = min(n - 1, self.fvg_lookback)
+        out = []
+        for pos, kind, top, bottom in self._fvgs:
+            rel = pos - start
+            if rel >= stop:
+                break
+            if rel >= 1:
+                out.append({"type": kind, "index": rel, "top": top, "bottom": bottom})
+        return out
+
+    def bos(self) -> List[Dict]:
+        return [{"type": b["type"], "level": b["level"], "index": b["abs"] - self.start} for b in self._bos]
+
+    def liquidity_pools(self) -> Dict:
+        first = self.start + self.pool_lookback
+        highs = np.array([lvl for pos, lvl in self._pool_highs if pos >= first], dtype=np.float64)
+        lows = np.array([lvl for pos, lvl in self._pool_lows if pos >= first], dtype=np.float64)
+        return {"highs": pool_levels(highs, self.pool_precision), "lows": pool_levels(lows, self.pool_precision)}
+
+    def mitigations(self, bos_points: Optional[List[Dict]] = None, order_blocks: Optional[List[Dict]] = None) -> List[Dict]:
+        bos_points = self.bos() if bos_points is None else bos_points
+        order_blocks = self.order_blocks() if order_blocks is None else order_blocks
+        if not bos_points or not order_blocks:
+            return []
+        recent = [self._bars[-k] for k in range(1, min(self.recent_candles, len(self._bars)) + 1)]
+        recent_low = min(b[3] for b in recent)
+        recent_high = max(b[2] for b in recent)
+        out = []
+        for b in bos_points:
+            for ob in order_blocks:
+                if ob["index"] < b["index"] and recent_low <= ob["low"] and recent_high >= ob["high"]:
+                    out.append(ob)
+        return out
+
+    def breakers(self, order_blocks: Optional[List[Dict]] = None) -> List[Dict]:
+        order_blocks = self.order_blocks() if order_blocks is None else order_blocks
+        if not order_blocks:
+            return []
+        last_close = self._bars[-1][4]
+        out = []
+        for ob in order_blocks:
+            if ob["type"] == "bull" and last_close < ob["low"]:
+                nb = ob.copy(); nb["type"] = "bear_breaker"; out.append(nb)
+            if ob["type"] == "bear" and last_close > ob["high"]:
+                nb = ob.copy(); nb["type"] = "bull_breaker"; out.append(nb)
+        return out
+
+    def premium_discount(self) -> Tuple[str, float]:
+        equilibrium = (self._zone_high.value() + self._zone_low.value()) / 2.0
+        zone = "premium" if self._bars[-1][4] > equilibrium else "discount"
+        return zone, equilibrium
+
+    def open_order_blocks(self) -> List[Dict]:
+        """Order blocks in the window that price has not closed through yet, oldest first."""
+        start = self.start
+        items = [it[2] for it in self._open_bull_obs + self._open_bear_obs if it[1] >= start]
+        items.sort(key=lambda ob: ob["abs"])
+        return [{"type": ob["type"], "index": ob["abs"] - start, "high": ob["high"], "low": ob["low"]} for ob in items]
+
+    def unfilled_fvgs(self) -> List[Dict]:
+        """FVGs in the window whose gap price has not traded back through yet, oldest first."""
+        start = self.start
+        items = [it[2] for it in self._open_bull_fvgs + self._open_bear_fvgs if it[1] >= start]
+        items.sort(key=lambda f: f["abs"])
+        return [{"type": f["type"], "index": f["abs"] - start, "top": f["top"], "bottom": f["bottom"]} for f in items]
+
+    def snapshot(self) -> Dict:
+        """Detector outputs for the current window, as consumed by check_signals.run_smc_confluence."""
+        order_blocks = self.order_blocks()
+        bos_points = self.bos()
+        zone, eq = self.premium_discount()
+        return {
+            "order_blocks": order_blocks,
+            "bos": bos_points,
+            "fvgs": self.fvgs(),
+            "liquidity_pools": self.liquidity_pools(),
+            "mitigations": self.mitigations(bos_points, order_blocks),
+            "breakers": self.breakers(order_blocks),
+            "zone": zone,
+            "equilibrium": eq,
+        }
+
+
+# ------------------------
+# Per-market registry
+# ------------------------
+
+SMC_STATE_MAX = int(os.getenv("SMC_STATE_MAX", "256"))
+
+_STATES: "OrderedDict[Tuple[str, str], SMCState]" = OrderedDict()
+_states_lock = threading.Lock()
+
+
+def get_state(symbol: str, timeframe: str, **kwargs) -> SMCState:
+    """Return the process-wide SMCState for (symbol, timeframe), creating it on first use (closed candles only)."""
+    key = (symbol, timeframe)
+    with _states_lock:
+        st = _STATES.get(key)
+        if st is None:
+            st = SMCState(symbol=symbol, timeframe=timeframe, **kwargs)
+            _STATES[key] = st
+            while len(_STATES) > SMC_STATE_MAX:
+                _STATES.popitem(last=False)
+        else:
+            _STATES.move_to_end(key)
+        return st
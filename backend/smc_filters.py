@@ -3,6 +3,11 @@ import pandas as pd
 import numpy as np
 from typing import List, Dict, Optional, Tuple
 
+from smc.arrays import ohlc_arrays
+from smc.fvg import fvg_frame, FVG_BULL
+from smc.liquidity import find_liquidity_pools, pool_levels
+from smc.orderblock import order_block_frame, OB_BULL
+
 # ------------------------
 # Basic helpers
 # ------------------------
@@ -27,17 +32,11 @@ def atr(df: pd.DataFrame, period: int = 14) -> float:
 
 def detect_order_blocks(df: pd.DataFrame, lookback: int = 200) -> List[Dict]:
     """Detect simple bullish/bearish order blocks."""
-    obs = []
-    df = df.reset_index(drop=True)
-    for i in range(2, min(len(df)-2, lookback)):
-        prev = df.loc[i-1]
-        cur = df.loc[i]
-        nxt = df.loc[i+1]
-        if prev['close'] < prev['open'] and cur['close'] > cur['open'] and nxt['close'] > nxt['open']:
-            obs.append({"type": "bull", "index": int(i-1), "high": float(prev['high']), "low": float(prev['low'])})
-        if prev['close'] > prev['open'] and cur['close'] < cur['open'] and nxt['close'] < nxt['open']:
-            obs.append({"type": "bear", "index": int(i-1), "high": float(prev['high']), "low": float(prev['low'])})
-    return obs
+    res = order_block_frame(df, rule="three_candle", lookback=lookback)
+    return [
+        {"type": "bull" if t == OB_BULL else "bear", "index": int(i), "high": float(h), "low": float(l)}
+        for i, t, h, l in zip(res["index"], res["type"], res["high"], res["low"])
+    ]
 
 def detect_bos(df: pd.DataFrame, lookback: int = 20) -> List[Dict]:
     """Detect Break of Structure points."""
@@ -57,38 +56,27 @@ def detect_bos(df: pd.DataFrame, lookback: int = 20) -> List[Dict]:
 
 def detect_fvg(df: pd.DataFrame, lookback: int = 200) -> List[Dict]:
     """Detect Fair Value Gaps (3-candle pattern)."""
-    fvg = []
-    df = df.reset_index(drop=True)
-    for i in range(1, min(len(df)-1, lookback)):
-        prev = df.loc[i-1]
-        nxt = df.loc[i+1]
-        if prev['close'] < prev['open'] and nxt['close'] > nxt['open'] and nxt['low'] > prev['high']:
-            fvg.append({"type": "bull", "index": i, "top": float(prev['high']), "bottom": float(nxt['low'])})
-        if prev['close'] > prev['open'] and nxt['close'] < nxt['open'] and nxt['high'] < prev['low']:
-            fvg.append({"type": "bear", "index": i, "top": float(nxt['high']), "bottom": float(prev['low'])})
-    return fvg
+    # gaps are reported on the middle candle; only middles in [1, lookback) are scanned
+    res = fvg_frame(df, require_color=True, stop=lookback + 1)
+    return [
+        {"type": "bull" if t == FVG_BULL else "bear", "index": int(i) - 1, "top": float(lo), "bottom": float(hi)}
+        for i, t, lo, hi in zip(res["index"], res["type"], res["low"], res["high"])
+    ]
 
 # ------------------------
 # Liquidity Pools
 # ------------------------
 
-def detect_liquidity_pools(df: pd.DataFrame, lookback: int = 20, threshold: float = 0.0005, precision: int = 5) -> Dict:
-    """Detect liquidity pools (clusters of equal highs/lows)."""
-    pools = {"highs": [], "lows": []}
-    df = df.reset_index(drop=True)
-    for i in range(lookback, len(df)):
-        highs = df['high'].iloc[i-lookback:i]
-        lows = df['low'].iloc[i-lookback:i]
-        close_price = df['close'].iloc[i]
-        if highs.max() - highs.min() <= close_price * threshold:
-            level = round(float(highs.max()), precision)
-            if level not in pools["highs"]:
-                pools["highs"].append(level)
-        if lows.max() - lows.min() <= close_price * threshold:
-            level = round(float(lows.min()), precision)
-            if level not in pools["lows"]:
-                pools["lows"].append(level)
-    return pools
+def detect_liquidity_pools(df: pd.DataFrame, lookback: int = 20, threshold: float = 0.0005, precision: int = 5,
+                           merge_tolerance: float = 0.0) -> Dict:
+    """Detect liquidity pools (clusters of equal highs/lows).
+    merge_tolerance > 0 folds levels within that fraction of price of an earlier level into it."""
+    _, high, low, close = ohlc_arrays(df)
+    res = find_liquidity_pools(high, low, close, lookback=lookback, threshold=threshold)
+    return {
+        "highs": pool_levels(res["high_level"], precision, merge_tolerance),
+        "lows": pool_levels(res["low_level"], precision, merge_tolerance),
+    }
 
 # ------------------------
 # Mitigation & Breaker Blocks
@@ -174,12 +162,12 @@ def detect_smt_divergence(df_primary: pd.DataFrame, df_reference: pd.DataFrame,
 # Resampling
 # ------------------------
 
-def resample_ohlcv(df: pd.DataFrame, timeframe: str = "15T") -> pd.DataFrame:
+def resample_ohlcv(df: pd.DataFrame, timeframe: str = "15min") -> pd.DataFrame:
     """Resample OHLCV dataframe to given timeframe."""
     if not isinstance(df.index, pd.DatetimeIndex):
         df = df.set_index(pd.to_datetime(df.index))
     ohlc = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
-    res = df.resample(timeframe).apply(ohlc).dropna()
+    res = df.resample(timeframe).agg(ohlc).dropna()
     return res
 
 # ------------------------
@@ -220,32 +208,35 @@ def calculate_move_potential(df: pd.DataFrame, signal: Dict, horizon: int = 12)
         return entry_price - future_low
     return 0.0
 
-def smc_validate_signal(df: pd.DataFrame, signal: Dict) -> bool:
-    """Validate a signal using SMA20 trend filter."""
+def smc_validate_signal(df: pd.DataFrame, signal: Dict, ctx=None) -> bool:
+    """Validate a signal using SMA20 trend filter (ctx: optional AnalysisContext for df)."""
     idx = signal.get("index", None)
     if idx is None or idx >= len(df):
         return False
-    df['sma20'] = df['close'].rolling(20).mean()
+    sma = ctx.sma(20) if ctx is not None else df['close'].rolling(20).mean()
     side = signal.get("type")
     close_price = df['close'].iloc[idx]
-    sma20 = df['sma20'].iloc[idx]
+    sma20 = sma.iloc[idx]
     if side == "long" and close_price > sma20:
         return True
     if side == "short" and close_price < sma20:
         return True
     return False
 
-def smc_confirm(df: pd.DataFrame, signal: Dict) -> bool:
-    """Confirm a signal with confluence of SMA20 + Premium/Discount zones."""
+def smc_confirm(df: pd.DataFrame, signal: Dict, ctx=None) -> bool:
+    """Confirm a signal with confluence of SMA20 + Premium/Discount zones (ctx: optional AnalysisContext for df)."""
     if signal is None:
         return False
     side = signal.get("type")
     price = signal.get("price", None)
     if price is None:
         return False
-    df['sma20'] = df['close'].rolling(20).mean()
-    sma20 = df['sma20'].iloc[-1]
-    zone, eq = detect_premium_discount(df, lookback=50)
+    if ctx is not None:
+        sma20 = ctx.sma(20).iloc[-1]
+        zone, eq = ctx.premium_discount(50)
+    else:
+        sma20 = df['close'].rolling(20).mean().iloc[-1]
+        zone, eq = detect_premium_discount(df, lookback=50)
     if side == "long":
         if price < eq and df['close'].iloc[-1] > sma20:
             return True
@@ -3,6 +3,10 @@
 Auto trainer scheduler:
 - periodically: fetch recent historical (parquet), create labeled csv, run train script as subprocess
 - safe mode: only runs if we have minimum labeled samples threshold
+- row counts come from the labeled-data manifest (ml/manifest.py), so unchanged CSVs are never
+  re-read; the subprocess only runs when ml/train_model.plan() asks for a full retrain (no
+  model / rewritten files / every AUTO_FULL_RETRAIN_HOURS) or an incremental update
+  (>= AUTO_MIN_NEW_SAMPLES new rows, trained on the new rows only)
 """
 
 import os, subprocess, sys
@@ -11,39 +15,32 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BACKEND_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if BACKEND_ROOT not in sys.path:
+    sys.path.append(BACKEND_ROOT)
+from ml import manifest
+
 DATA_DIR = os.path.join(BACKEND_ROOT, 'data')
 MIN_LABELED_SAMPLES = int(os.getenv('MIN_LABELED_SAMPLES', '500'))
 AUTO_INTERVAL_MIN = int(os.getenv('AUTO_TRAIN_INTERVAL_MIN', '60'))
 
-def _count_labeled_csv_rows():
-    cnt = 0
-    if not os.path.exists(DATA_DIR):
-        return 0
-    for f in os.listdir(DATA_DIR):
-        if f.endswith('.csv') and 'labeled' in f:
-            try:
-                import pandas as pd
-                df = pd.read_csv(os.path.join(DATA_DIR, f))
-                cnt += len(df)
-            except Exception:
-                continue
-    return cnt
-
 def retrain_job():
     try:
         print("AutoTrainer: checking labeled dataset...")
-        n = _count_labeled_csv_rows()
+        man = manifest.refresh(DATA_DIR) if os.path.exists(DATA_DIR) else {"files": {}}
+        n = manifest.total_rows(man)
         print("AutoTrainer: labeled rows found:", n)
         if n < MIN_LABELED_SAMPLES:
             print(f"AutoTrainer: not enough labeled samples ({n} < {MIN_LABELED_SAMPLES}). Skipping retrain.")
             return
-        # call train script (assumes backend/ml/train_model.py exists and is executable)
-        train_script = os.path.join(BACKEND_ROOT, 'ml', 'train_model.py')
-        if not os.path.exists(train_script):
-            print("AutoTrainer: train_model.py not found at", train_script)
+        # training runs in the subprocess; only the plan is computed here
+        from ml import train_model
+        mode, reason, new_rows = train_model.plan(man, train_model.load_state())
+        if mode is None:
+            print(f"AutoTrainer: no retrain ({reason}).")
             return
-        cmd = [sys.executable, train_script]
-        print("AutoTrainer: running trainer subprocess...")
+        train_script = os.path.join(BACKEND_ROOT, 'ml', 'train_model.py')
+        cmd = [sys.executable, train_script, '--mode', mode]
+        print(f"AutoTrainer: running {mode} trainer subprocess ({reason})...")
         subprocess.run(cmd, check=True)
         print("AutoTrainer: trainer finished.")
     except Exception as e:
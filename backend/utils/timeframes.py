@@ -1,6 +1,16 @@
 import pandas as pd
 
-def resample_timeframe(df, timeframe="15T"):
+_TF_UNITS = {"m": 60_000, "T": 60_000, "min": 60_000, "h": 3_600_000, "H": 3_600_000,
+             "d": 86_400_000, "D": 86_400_000, "w": 604_800_000}
+
+
+def timeframe_ms(timeframe):
+    """'5m' / '15T' / '15min' / '1h' / '1H' / '4h' / '1d' / '1w' -> milliseconds."""
+    num = timeframe.rstrip("".join(_TF_UNITS))
+    return int(num or 1) * _TF_UNITS[timeframe[len(num):]]
+
+
+def resample_timeframe(df, timeframe="15min"):
     """
     Resample OHLCV dataframe to given timeframe.
     df must have datetime index.
@@ -32,22 +32,30 @@ export default function SignalsPanel() {
     }
   };
 
+  const SYMBOL = "BTC/USDT";
+  const TIMEFRAME = "5m";
+
+  const showSignal = (sig) => {
+    setSignal(sig);
+    // if new valid signal ID appears, beep
+    if (sig && sig.id && lastIdRef.current !== sig.id) {
+      lastIdRef.current = sig.id;
+      // only beep for real entries (not placeholder rows)
+      if (sig.side && sig.side !== "none") {
+        playBeep();
+      }
+    }
+  };
+
   const fetchSignal = async () => {
     setLoading(true);
     setError(null);
     try {
-      const res = await fetch(`${API_BASE}/signals?symbol=BTC/USDT&timeframe=5m`);
+      // the API answers 304 (no body, no DB query) while nothing new was saved
+      const res = await fetch(`${API_BASE}/signals?symbol=${SYMBOL}&timeframe=${TIMEFRAME}`);
       if (!res.ok) throw new Error("Failed to fetch");
       const data = await res.json();
-      setSignal(data.signal);
-      // if new valid signal ID appears, beep
-      if (data.signal && data.signal.id && lastIdRef.current !== data.signal.id) {
-        lastIdRef.current = data.signal.id;
-        // only beep for real entries (not placeholder rows)
-        if (data.signal.side && data.signal.side !== "none") {
-          playBeep();
-        }
-      }
+      showSignal(data.signal);
     } catch (err) {
       setError(err.message || "fetch error");
     } finally {
@@ -57,8 +65,18 @@ export default function SignalsPanel() {
 
   useEffect(() => {
     fetchSignal();
-    const pid = setInterval(fetchSignal, 10000); // poll every 10 seconds
-    return () => clearInterval(pid);
+    if (typeof window === "undefined" || !window.EventSource) {
+      const pid = setInterval(fetchSignal, 10000); // no SSE support: poll every 10 seconds
+      return () => clearInterval(pid);
+    }
+    // new signals are pushed as they are saved; EventSource reconnects on its own
+    const es = new EventSource(`${API_BASE}/signals/stream?symbol=${SYMBOL}&timeframe=${TIMEFRAME}`);
+    es.addEventListener("signal", (ev) => {
+      setError(null);
+      showSignal(JSON.parse(ev.data));
+    });
+    es.onerror = () => setError("stream disconnected, reconnecting...");
+    return () => es.close();
   }, []);
 
   return (